@@ -7,14 +7,28 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 django.setup()
 
+from .core.specs import machine_specs_writer  # noqa: E402
 from .urls import ws_urlpatterns  # noqa: E402
 
 django_application = get_asgi_application()
 
 
+async def lifespan_application(scope, receive, send):
+    """Store data buffered in memory when the server shuts down (e.g. on deploy), so that it is not lost"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await machine_specs_writer.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
 application = ProtocolTypeRouter(
     {
         "http": django_application,
         "websocket": URLRouter(ws_urlpatterns),
+        "lifespan": lifespan_application,
     }
 )
@@ -9,12 +9,16 @@ from django.utils.safestring import mark_safe
 from .models import (
     GPU,
     Channel,
+    HourlyJobReceiptStats,
     Job,
     JobFeedback,
     JobReceipt,
     JobStatus,
     Miner,
+    MinerReceiptsCursor,
+    MinerStats,
     SignatureInfo,
+    TrustedValidator,
     UserPreferences,
     Validator,
 )
@@ -81,12 +85,21 @@ class ValidatorAdmin(admin.ModelAdmin):
         return obj.last_job_time.isoformat() if obj.last_job_time else "-"
 
 
+@register(TrustedValidator)
+class TrustedValidatorAdmin(admin.ModelAdmin):
+    list_display = ("ss58_address", "name", "created_at")
+    search_fields = ("ss58_address", "name")
+    ordering = ("-created_at",)
+
+
 @register(Miner)
 class MinerAdmin(admin.ModelAdmin):
     list_display = (
         "pk",
         "ss58_address",
         "is_active",
+        "busy_until",
+        "last_assigned_at",
     )
     list_filter = ("is_active",)
     search_fields = ("ss58_address",)
@@ -150,7 +163,6 @@ class JobStatusAdmin(admin.ModelAdmin):
         "job__docker_image",
         "job__input_url",
         "job__output_upload_url",
-        "job__output_download_url",
     )
     autocomplete_fields = ("job",)
     ordering = ("-created_at",)
@@ -182,10 +194,8 @@ class JobAdminForm(forms.ModelForm):
             "env",
             "use_gpu",
             "input_url",
-            "output_download_url_expires_at",
             "tag",
             "output_upload_url",
-            "output_download_url",
         ]
 
     def __init__(self, *args, **kwargs):
@@ -203,7 +213,7 @@ class JobAdmin(admin.ModelAdmin):
         "executor_class",
         "docker_image",
         "created_at",
-        "status",
+        "get_last_status_display",
         "get_elapsed_display",
     )
     list_filter = (
@@ -216,7 +226,6 @@ class JobAdmin(admin.ModelAdmin):
         "docker_image",
         "input_url",
         "output_upload_url",
-        "output_download_url",
     )
     ordering = ("-created_at",)
     autocomplete_fields = (
@@ -229,11 +238,9 @@ class JobAdmin(admin.ModelAdmin):
     )
     inlines = [JobStatusInline]
 
-    def get_queryset(self, request: HttpRequest) -> QuerySet[Job]:
-        return super().get_queryset(request).with_statuses()
-
-    def status(self, obj: Job) -> str:
-        return list(obj.statuses.all())[-1].get_status_display()
+    @admin.display(description="Status", ordering="last_status")
+    def get_last_status_display(self, obj: Job) -> str:
+        return obj.get_last_status_display()
 
     def save_model(self, request, obj, form, change):
         try:
@@ -243,9 +250,10 @@ class JobAdmin(admin.ModelAdmin):
         except Validator.DoesNotExist:
             self.message_user(request, "No active validators available", level=messages.ERROR)
 
+    @admin.display(description="Elapsed")
     def get_elapsed_display(self, obj: Job) -> str | None:
-        if elapsed := obj.elapsed:
-            return str(elapsed).split(".")[0]
+        if obj.last_status_at:
+            return str(obj.last_status_at - obj.created_at).split(".")[0]
 
 
 @register(JobReceipt)
@@ -261,6 +269,49 @@ class JobReceiptAdmin(admin.ModelAdmin):
     )
     search_fields = ("job_uuid", "miner_hotkey", "validator_hotkey")
     ordering = ("-time_started",)
+    # counting all receipts means scanning every partition
+    show_full_result_count = False
+
+
+@register(HourlyJobReceiptStats)
+class HourlyJobReceiptStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "hour",
+        "miner_hotkey",
+        "validator_hotkey",
+        "executor_class",
+        "count",
+        "average_time_took",
+        "average_score",
+    )
+    search_fields = ("miner_hotkey", "validator_hotkey")
+    list_filter = ("executor_class",)
+    ordering = ("-hour",)
+    show_full_result_count = False
+
+
+@register(MinerStats)
+class MinerStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "window",
+        "miner_hotkey",
+        "executor_class",
+        "count",
+        "time_took_p50_us",
+        "time_took_p95_us",
+        "average_score",
+        "updated_at",
+    )
+    search_fields = ("miner_hotkey",)
+    list_filter = ("window", "executor_class")
+    ordering = ("window", "-count")
+
+
+@register(MinerReceiptsCursor)
+class MinerReceiptsCursorAdmin(admin.ModelAdmin):
+    list_display = ("miner_hotkey", "offset", "etag", "last_modified", "updated_at")
+    search_fields = ("miner_hotkey",)
+    ordering = ("-updated_at",)
 
 
 @register(JobFeedback)
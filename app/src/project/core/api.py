@@ -1,15 +1,33 @@
+import asyncio
+import hashlib
+import json
+from collections.abc import AsyncIterator
+from uuid import UUID
+
 import django_filters
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Max
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters import fields
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, routers, serializers, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from .middleware.signature_middleware import require_signature
-from .models import Job, JobFeedback
+from .models import Job, JobFeedback, JobStatus, MinerStats
 
 
 class Conflict(APIException):
@@ -24,6 +42,13 @@ class DefaultModelPagination(PageNumberPagination):
     max_page_size = 256
 
 
+class MinerStatsPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = ("-count", "miner_hotkey", "executor_class")
+
+
 class JobSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Job
@@ -52,16 +77,13 @@ class JobSerializer(serializers.HyperlinkedModelSerializer):
     stdout = serializers.SerializerMethodField()
 
     def get_status(self, obj):
-        return obj.status.get_status_display()
+        return obj.get_last_status_display()
 
     def get_stdout(self, obj):
-        meta = obj.status.meta
-        if meta and meta.miner_response:
-            return meta.miner_response.docker_process_stdout
-        return ""
+        return obj.last_stdout
 
     def get_last_update(self, obj):
-        return obj.status.created_at
+        return obj.last_status_at
 
 
 class RawJobSerializer(JobSerializer):
@@ -89,15 +111,79 @@ class JobFeedbackSerializer(serializers.ModelSerializer):
         fields = ["result_correctness", "expected_duration"]
 
 
+class MinerStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MinerStats
+        fields = (
+            "miner_hotkey",
+            "executor_class",
+            "count",
+            "time_took_p50",
+            "time_took_p95",
+            "average_score",
+            "updated_at",
+        )
+
+    time_took_p50 = serializers.SerializerMethodField()
+    time_took_p95 = serializers.SerializerMethodField()
+
+    def get_time_took_p50(self, obj) -> float:
+        return obj.time_took_p50_us / 1_000_000
+
+    def get_time_took_p95(self, obj) -> float:
+        return obj.time_took_p95_us / 1_000_000
+
+
+def get_selection_error_message(exc: ObjectDoesNotExist) -> str:
+    model_name = exc.__class__.__qualname__.partition(".")[0]
+    return f"Could not select {model_name}"
+
+
 class BaseCreateJobViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
-    queryset = Job.objects.with_statuses()
+    queryset = Job.objects.all()
 
     def perform_create(self, serializer):
         try:
             serializer.save(user=self.request.user)
         except ObjectDoesNotExist as exc:
-            model_name = exc.__class__.__qualname__.partition(".")[0]
-            raise ValidationError(f"Could not select {model_name}")
+            raise ValidationError(get_selection_error_message(exc))
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        """
+        Create many jobs at once.
+
+        Request body is a list of jobs; response contains a result for each of them, in the same order.
+        Invalid jobs (or jobs for which no nodes are available) are reported without affecting the others.
+        """
+
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of jobs")
+        if len(request.data) > settings.JOB_BULK_SUBMIT_MAX_SIZE:
+            raise ValidationError(f"At most {settings.JOB_BULK_SUBMIT_MAX_SIZE} jobs may be submitted at once")
+
+        serializers_ = [self.get_serializer(data=item) for item in request.data]
+        is_valid = [serializer.is_valid() for serializer in serializers_]
+        jobs = [Job(**serializer.validated_data) for serializer, valid in zip(serializers_, is_valid) if valid]
+        submitted = iter(Job.submit_many(request.user, jobs))
+
+        results = []
+        for serializer, valid in zip(serializers_, is_valid):
+            if not valid:
+                results.append({"status": "error", "errors": serializer.errors})
+                continue
+
+            result = next(submitted)
+            if isinstance(result, ObjectDoesNotExist):
+                results.append(
+                    {"status": "error", "errors": {"non_field_errors": [get_selection_error_message(result)]}}
+                )
+            elif isinstance(result, DjangoValidationError):
+                results.append({"status": "error", "errors": {"non_field_errors": result.messages}})
+            else:
+                results.append({"status": "created", "job": self.get_serializer(result).data})
+
+        return Response(results)
 
 
 class NonValidatingMultipleChoiceField(fields.MultipleChoiceField):
@@ -118,7 +204,7 @@ class JobViewSetFilter(django_filters.FilterSet):
 
 
 class JobViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
-    queryset = Job.objects.with_statuses()
+    queryset = Job.objects.order_by("-created_at")
     serializer_class = JobSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = DefaultModelPagination
@@ -129,6 +215,47 @@ class JobViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.Gene
         return self.queryset.filter(user=self.request.user)
 
 
+def get_miner_stats_window(request) -> str:
+    window = request.GET.get("window", settings.MINER_STATS_DEFAULT_WINDOW)
+    if window not in settings.MINER_STATS_WINDOWS:
+        raise ValidationError({"window": f"Expected one of: {', '.join(settings.MINER_STATS_WINDOWS)}"})
+    return window
+
+
+def miner_stats_etag(request, *args, **kwargs) -> str | None:
+    """Stats only change when refreshed, so the time of the last refresh identifies every page of them"""
+    updated_at = MinerStats.objects.filter(window=get_miner_stats_window(request)).aggregate(Max("updated_at"))
+    if updated_at["updated_at__max"] is None:
+        return None
+    version = f"{updated_at['updated_at__max'].isoformat()}:{request.get_full_path()}"
+    return hashlib.sha256(version.encode()).hexdigest()
+
+
+class MinerStatsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Leaderboard of miners, per executor class, over a sliding window.
+
+    Use `?window=<window>` to select the window (e.g. `1h`, `24h`, `7d`) and `?executor_class=<executor class>`
+    to only list miners of given executor class. Miners are ordered by the number of jobs done.
+    Times are in seconds.
+    """
+
+    queryset = MinerStats.objects.all()
+    serializer_class = MinerStatsSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = MinerStatsPagination
+
+    def get_queryset(self):
+        queryset = self.queryset.filter(window=get_miner_stats_window(self.request))
+        if executor_class := self.request.GET.get("executor_class"):
+            queryset = queryset.filter(executor_class=executor_class)
+        return queryset
+
+    @method_decorator(condition(etag_func=miner_stats_etag))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
 class RawJobViewset(BaseCreateJobViewSet):
     serializer_class = RawJobSerializer
 
@@ -175,6 +302,98 @@ class JobFeedbackViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, vie
         return self.create(request, *args, **kwargs)
 
 
+def get_api_user(request: HttpRequest):
+    """Authenticate plain Django request the same way DRF views do"""
+    authenticators = [authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    return Request(request, authenticators=authenticators).user
+
+
+async def job_events_view(request: HttpRequest) -> HttpResponse:
+    """
+    Stream status updates of user's jobs as Server-Sent Events.
+
+    Use `?uuid=<job uuid>` to follow a single job (the stream starts with its current status and ends
+    when it is completed), `?tag=<tag>` to follow jobs with given tag, or no parameters to follow all jobs.
+    """
+
+    user = await sync_to_async(get_api_user)(request)
+    if not user.is_authenticated:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    job = None
+    if job_uuid := request.GET.get("uuid"):
+        try:
+            job = await Job.objects.filter(uuid=UUID(job_uuid), user=user).afirst()
+        except ValueError:
+            pass
+        if job is None:
+            return JsonResponse({"detail": "Not found."}, status=404)
+        group = job.status_group_name
+    else:
+        group = Job.get_user_status_group_name(user.pk)
+
+    return StreamingHttpResponse(
+        stream_job_events(group, job=job, tag=request.GET.get("tag")),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def format_job_event(event: dict) -> str:
+    data = {
+        "uuid": event["uuid"],
+        "status": JobStatus.Status(event["status"]).label,
+        "created_at": event["created_at"],
+        "tag": event["tag"],
+    }
+    return f"event: status\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_job_events(group: str, job: Job | None = None, tag: str | None = None) -> AsyncIterator[str]:
+    channel_layer = get_channel_layer()
+    channel_name = await channel_layer.new_channel()
+    await channel_layer.group_add(group, channel_name)
+    try:
+        yield ": connected\n\n"
+
+        # current status of the followed job, read after subscribing, so that no update is missed
+        if job is not None:
+            await job.arefresh_from_db()
+            if job.last_status is not None:
+                yield format_job_event(
+                    {
+                        "uuid": str(job.uuid),
+                        "status": job.last_status,
+                        "created_at": job.last_status_at.isoformat(),
+                        "tag": job.tag,
+                    }
+                )
+            if job.last_status in JobStatus.FINAL_STATUS_VALUES:
+                return
+
+        # clients are expected to reconnect, which frees resources of connections which are gone
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.JOB_EVENTS_STREAM_DURATION.total_seconds()
+        while (timeout := deadline - loop.time()) > 0:
+            try:
+                message = await asyncio.wait_for(
+                    channel_layer.receive(channel_name),
+                    timeout=min(timeout, settings.JOB_EVENTS_KEEPALIVE_INTERVAL.total_seconds()),
+                )
+            except TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            for event in message["events"]:
+                if tag is not None and event["tag"] != tag:
+                    continue
+                yield format_job_event(event)
+                if job is not None and event["status"] in JobStatus.FINAL_STATUS_VALUES:
+                    return
+    finally:
+        await channel_layer.group_discard(group, channel_name)
+
+
 class APIRootView(routers.DefaultRouter.APIRootView):
     description = "api-root"
 
@@ -188,3 +407,4 @@ router.register(r"jobs", JobViewSet)
 router.register(r"job-docker", DockerJobViewset, basename="job_docker")
 router.register(r"job-raw", RawJobViewset, basename="job_raw")
 router.register(r"jobs/(?P<job_uuid>[^/.]+)/feedback", JobFeedbackViewSet, basename="job_feedback")
+router.register(r"miners/stats", MinerStatsViewSet, basename="miner_stats")
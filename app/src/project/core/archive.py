@@ -0,0 +1,162 @@
+"""
+Archiving old rows of append-only tables.
+
+Rows older than the retention of their `ArchivePolicy` are moved, oldest first and in batches, to gzipped JSON
+Lines files in the R2 bucket, and deleted from the database. A file holds rows measured on a single day and is
+named after the day, time and id of its first row, so files of a day sort chronologically, a batch archived again
+after an interrupted run overwrites the same file, and `read_archive` only downloads files of the days asked for.
+"""
+
+import gzip
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+import structlog
+from django.conf import settings
+from django.db import models
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+from .models import ExecutorSpecsSnapshot, HardwareState, RawSpecsSnapshot
+from .utils import s3, upload_data
+
+log = structlog.get_logger(__name__)
+
+ARCHIVE_PREFIX = "archive"
+
+
+@dataclass(frozen=True)
+class ArchivePolicy:
+    name: str
+    model: type[models.Model]
+    # values of these are stored, so that archived rows can be read without joining other tables
+    fields: list[str]
+    timestamp_field: str = "measured_at"
+
+    @property
+    def retention(self) -> timedelta:
+        return settings.ARCHIVE_RETENTION[self.name]
+
+    @property
+    def prefix(self) -> str:
+        return f"{ARCHIVE_PREFIX}/{self.name}/"
+
+    def get_key(self, first_timestamp: datetime, first_pk: int) -> str:
+        return f"{self.prefix}{first_timestamp.date().isoformat()}/{first_timestamp:%H%M%S%f}-{first_pk}.jsonl.gz"
+
+
+ARCHIVE_POLICIES = {
+    policy.name: policy
+    for policy in [
+        ArchivePolicy(
+            name="executor_specs_snapshots",
+            model=ExecutorSpecsSnapshot,
+            fields=[
+                "id",
+                "measured_at",
+                "batch_id",
+                "miner__ss58_address",
+                "validator__ss58_address",
+                "raw_specs_id",
+            ],
+        ),
+        ArchivePolicy(
+            name="hardware_states",
+            model=HardwareState,
+            fields=["id", "measured_at", "subnet__uid", "state"],
+        ),
+        ArchivePolicy(
+            name="raw_specs_snapshots",
+            model=RawSpecsSnapshot,
+            fields=["id", "measured_at", "miner__ss58_address", "validator__ss58_address", "state"],
+        ),
+    ]
+}
+
+
+def to_json(value) -> str:
+    # unlike `DjangoJSONEncoder`, keeps microseconds of timestamps
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def serialize_rows(rows: list[dict]) -> bytes:
+    lines = (json.dumps(row, default=to_json, separators=(",", ":")) for row in rows)
+    return gzip.compress("\n".join(lines).encode() + b"\n")
+
+
+def archive_batch(policy: ArchivePolicy, batch_size: int) -> int:
+    """
+    Archive up to `batch_size` oldest rows past retention, all measured on the same day.
+
+    Return the number of rows archived, 0 when there is nothing left to archive.
+    """
+    cutoff = now() - policy.retention
+    expired = policy.model.objects.filter(**{f"{policy.timestamp_field}__lt": cutoff})
+    oldest = expired.order_by(policy.timestamp_field).values_list(policy.timestamp_field, flat=True).first()
+    if oldest is None:
+        return 0
+
+    day = oldest.date()
+    day_end = datetime.combine(day + timedelta(days=1), time(), tzinfo=oldest.tzinfo)
+    rows = list(
+        expired.filter(**{f"{policy.timestamp_field}__lt": min(cutoff, day_end)})
+        .order_by(policy.timestamp_field, "pk")
+        .values(*policy.fields)[:batch_size]
+    )
+    pks = [row["id"] for row in rows]
+
+    key = policy.get_key(rows[0][policy.timestamp_field], rows[0]["id"])
+    upload_data(key, serialize_rows(rows))
+    # only deleted once uploaded; if this does not happen, the same rows are uploaded to the same file again
+    policy.model.objects.filter(pk__in=pks).delete()
+    log.info("archived rows", archive=policy.name, key=key, rows=len(rows))
+    return len(rows)
+
+
+def archive(policy: ArchivePolicy, batch_size: int | None = None) -> int:
+    """Archive all rows past retention of given policy, returning the number of rows archived"""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    num_archived = 0
+    while archived := archive_batch(policy, batch_size):
+        num_archived += archived
+    return num_archived
+
+
+def list_archive_keys(policy: ArchivePolicy, since: date | None = None, until: date | None = None) -> list[str]:
+    """Return keys of archive files of given policy with rows measured between given days (inclusive)"""
+    keys = []
+    paginator = s3.get_paginator("list_objects_v2")
+    start_after = f"{policy.prefix}{since.isoformat()}/" if since else ""
+    for page in paginator.paginate(Bucket=settings.R2_BUCKET_NAME, Prefix=policy.prefix, StartAfter=start_after):
+        for obj in page.get("Contents", []):
+            day = date.fromisoformat(obj["Key"].removeprefix(policy.prefix).split("/", 1)[0])
+            if until and day > until:
+                return keys
+            keys.append(obj["Key"])
+    return keys
+
+
+def read_archive(
+    policy: ArchivePolicy,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    **filters,
+) -> Iterator[dict]:
+    """
+    Yield archived rows of given policy measured in [since, until) and having given values of `fields`.
+
+    Timestamps are parsed back to datetimes, other values are as stored (e.g. UUIDs as strings).
+    """
+    keys = list_archive_keys(policy, since.date() if since else None, until.date() if until else None)
+    for key in keys:
+        response = s3.get_object(Bucket=settings.R2_BUCKET_NAME, Key=key)
+        for line in gzip.decompress(response["Body"].read()).splitlines():
+            row = json.loads(line)
+            row[policy.timestamp_field] = timestamp = parse_datetime(row[policy.timestamp_field])
+            if (since and timestamp < since) or (until and timestamp >= until):
+                continue
+            if any(row[field] != value for field, value in filters.items()):
+                continue
+            yield row
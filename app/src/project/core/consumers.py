@@ -1,17 +1,18 @@
 import json
 from collections.abc import Callable
 from enum import Enum
-from functools import cached_property, wraps
+from functools import cache, cached_property, wraps
 from typing import Annotated, ClassVar, Union
 
 import structlog
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.conf import settings
 from django.db import IntegrityError
-from django.utils.timezone import now
 from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from structlog.contextvars import bound_contextvars
 
+from .heartbeats import heartbeat_buffer
 from .models import Channel, Job, JobStatus, Validator
 from .schemas import (
     AuthenticationRequest,
@@ -21,7 +22,8 @@ from .schemas import (
     MachineSpecs,
     Response,
 )
-from .specs import save_machine_specs
+from .specs import machine_specs_writer
+from .validator_registry import get_validator_registry
 
 log = structlog.get_logger(__name__)
 
@@ -80,6 +82,8 @@ class ValidatorConsumer(AsyncWebsocketConsumer):
             validator=validator,
             name=self.channel_name,
         )
+        self.scope["validator_id"] = validator.pk
+        await sync_to_async(get_validator_registry().connect)(validator.pk, self.channel_name)
         validator_version = self.headers.get("x-validator-version")
         validator_runner_version = self.headers.get("x-validator-runner-version")
         if validator_version is not None:
@@ -91,7 +95,10 @@ class ValidatorConsumer(AsyncWebsocketConsumer):
 
     async def disconnect_channel_from_validator(self) -> None:
         """Remove associaton of this channel with any validator"""
+        heartbeat_buffer.discard(self.channel_name)
         await Channel.objects.filter(name=self.channel_name).adelete()
+        if validator_id := self.scope.get("validator_id"):
+            await sync_to_async(get_validator_registry().disconnect)(validator_id, self.channel_name)
 
     async def receive(self, text_data: str | None = None, bytes_data: bytes | None = None) -> None:
         """
@@ -104,9 +111,7 @@ class ValidatorConsumer(AsyncWebsocketConsumer):
             log.debug("message received")
 
             try:
-                message: BaseModel = TypeAdapter(
-                    Annotated[Union[*self.MESSAGE_HANDLERS.keys()], Field(discriminator="message_type")]
-                ).validate_json(text_data)
+                message: BaseModel = self.message_adapter().validate_json(text_data)
 
             except ValidationError as exc:
                 errors = [Error.parse_obj(error_dict) for error_dict in exc.errors()]
@@ -119,6 +124,12 @@ class ValidatorConsumer(AsyncWebsocketConsumer):
             log.debug("selected message handler", handler=handler)
             await handler(self, message)
 
+    @classmethod
+    @cache
+    def message_adapter(cls) -> TypeAdapter:
+        """Adapter parsing incoming messages to one of `MESSAGE_HANDLERS.keys()`; built once per class"""
+        return TypeAdapter(Annotated[Union[*cls.MESSAGE_HANDLERS.keys()], Field(discriminator="message_type")])
+
     async def authenticate(self, message: AuthenticationRequest) -> None:
         """Check some authentication details and store ss58 address in the scope"""
 
@@ -129,7 +140,7 @@ class ValidatorConsumer(AsyncWebsocketConsumer):
                 error = Error(
                     msg="Already authenticated",
                     type="auth.already_authenticated",
-                    help="You are already authenticated, please do not " "send authentication request again.",
+                    help="You are already authenticated, please do not send authentication request again.",
                 )
                 log.debug("authentication failed", error=error)
                 response = Response(status="error", errors=[error])
@@ -222,11 +233,13 @@ class ValidatorConsumer(AsyncWebsocketConsumer):
         """Handle machine specs update message sent from validator to this app"""
 
         with bound_contextvars(message=message):
-            await save_machine_specs(message)
+            # stored in the background, in batches, not to hold up other messages
+            machine_specs_writer.put(message)
 
     @require_authentication
     async def heartbeat(self, message: Heartbeat) -> None:
-        await Channel.objects.filter(name=self.channel_name).aupdate(last_heartbeat=now())
+        await sync_to_async(get_validator_registry().heartbeat)(self.scope["validator_id"], self.channel_name)
+        await heartbeat_buffer.record(self.channel_name)
 
     async def job_new(self, payload: dict) -> None:
         """Receive JobRequest from backend and forward it to validator via WS"""
@@ -0,0 +1,65 @@
+import time
+from datetime import datetime
+
+import structlog
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+
+from .models import Channel
+
+log = structlog.get_logger(__name__)
+
+
+class HeartbeatBuffer:
+    """
+    Collect channel heartbeats in memory and write them to `Channel.last_heartbeat` in bulk.
+
+    Heartbeats are flushed when one arrives and the previous flush happened at least
+    `settings.HEARTBEAT_FLUSH_INTERVAL` ago, so bursts of heartbeats from many connections
+    end up in a single UPDATE while a lone heartbeat is still written right away.
+    """
+
+    def __init__(self):
+        self._heartbeats: dict[str, datetime] = {}
+        self._last_flush = float("-inf")
+        self.num_batches = 0
+        self.num_flushed = 0
+        self.last_batch_size = 0
+
+    async def record(self, channel_name: str) -> None:
+        self._heartbeats[channel_name] = now()
+        if time.monotonic() - self._last_flush >= settings.HEARTBEAT_FLUSH_INTERVAL.total_seconds():
+            await self.flush()
+
+    def discard(self, channel_name: str) -> None:
+        self._heartbeats.pop(channel_name, None)
+
+    async def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        heartbeats, self._heartbeats = self._heartbeats, {}
+        if not heartbeats:
+            return
+
+        await sync_to_async(self._write)(heartbeats)
+        self.num_batches += 1
+        self.num_flushed += len(heartbeats)
+        self.last_batch_size = len(heartbeats)
+        log.debug("heartbeats flushed", batch_size=len(heartbeats), total_flushed=self.num_flushed)
+
+    @staticmethod
+    def _write(heartbeats: dict[str, datetime]) -> None:
+        table = connection.ops.quote_name(Channel._meta.db_table)
+        values = ", ".join(["(%s, %s::timestamptz)"] * len(heartbeats))
+        params = [param for item in heartbeats.items() for param in item]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET last_heartbeat = heartbeat.last_heartbeat "  # noqa: S608
+                f"FROM (VALUES {values}) AS heartbeat (name, last_heartbeat) "
+                f"WHERE {table}.name = heartbeat.name",
+                params,
+            )
+
+
+heartbeat_buffer = HeartbeatBuffer()
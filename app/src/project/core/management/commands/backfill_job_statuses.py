@@ -0,0 +1,39 @@
+from django.core.management import BaseCommand
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Coalesce, Left
+
+from ...models import Job, JobStatus
+
+
+class Command(BaseCommand):
+    help = "Fill denormalized Job.last_status* columns from the most recent JobStatus of each job"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10_000, help="number of jobs updated per query")
+
+    def handle(self, *args, batch_size, **options):
+        latest_statuses = JobStatus.objects.filter(job=OuterRef("pk")).order_by("-created_at")
+        latest_stdout = latest_statuses.annotate(
+            stdout=Left(KT("metadata__miner_response__docker_process_stdout"), Job.STDOUT_EXCERPT_LENGTH)
+        )
+
+        num_updated = 0
+        last_pk = None
+        while True:
+            jobs = Job.objects.order_by("pk")
+            if last_pk is not None:
+                jobs = jobs.filter(pk__gt=last_pk)
+            batch = list(jobs.values_list("pk", flat=True)[:batch_size])
+            if not batch:
+                break
+
+            num_updated += Job.objects.filter(pk__in=batch).update(
+                last_status=Subquery(latest_statuses.values("status")[:1]),
+                last_status_at=Subquery(latest_statuses.values("created_at")[:1]),
+                last_stdout=Coalesce(Subquery(latest_stdout.values("stdout")[:1]), Value("")),
+            )
+            last_pk = batch[-1]
+            self.stdout.write(f"updated {num_updated} jobs")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled last status of {num_updated} jobs"))
@@ -0,0 +1,99 @@
+import time
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from ...models import Job, JobStatus, Miner, Validator
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare listing a page of jobs with prefetched statuses against the denormalized status columns; "
+        "test data is created in a transaction which is rolled back at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=1_000_000, help="number of jobs to create")
+        parser.add_argument("--page-size", type=int, default=256, help="number of jobs listed at once")
+        parser.add_argument("--repeat", type=int, default=10, help="number of measured listings per path")
+        parser.add_argument("--batch-size", type=int, default=10_000, help="bulk insert batch size")
+
+    def handle(self, *args, jobs, page_size, repeat, batch_size, **options):
+        with transaction.atomic():
+            user = self.create_jobs(jobs, batch_size)
+
+            def list_with_statuses():
+                for job in Job.objects.filter(user=user).with_statuses().order_by("-created_at")[:page_size]:
+                    # what `JobSerializer` used to do for every row
+                    _ = (job.status.get_status_display(), job.status.meta, job.status.created_at)
+
+            def list_denormalized():
+                for job in Job.objects.filter(user=user).order_by("-created_at")[:page_size]:
+                    _ = (job.get_last_status_display(), job.last_stdout, job.last_status_at)
+
+            for name, listing in (("prefetched statuses", list_with_statuses), ("denormalized", list_denormalized)):
+                listing()  # warm up
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        listing()
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{name}: {elapsed / repeat * 1000:.2f} ms per page, {len(queries) // repeat} queries per page"
+                )
+
+            transaction.set_rollback(True)
+
+    def create_jobs(self, num_jobs: int, batch_size: int) -> User:
+        user = User.objects.create(username="benchmark-job-listing")
+        validator = Validator.objects.create(ss58_address="benchmark-job-listing", is_active=False)
+        miner = Miner.objects.create(ss58_address="benchmark-job-listing", is_active=False)
+
+        for offset in range(0, num_jobs, batch_size):
+            now_ = now()
+            jobs = Job.objects.bulk_create(
+                [
+                    Job(
+                        uuid=uuid4(),
+                        user=user,
+                        validator=validator,
+                        miner=miner,
+                        raw_script="print(1)",
+                        last_status=JobStatus.Status.COMPLETED,
+                        last_status_at=now_,
+                        last_stdout="1",
+                    )
+                    for _ in range(min(batch_size, num_jobs - offset))
+                ]
+            )
+            JobStatus.objects.bulk_create(
+                [
+                    JobStatus(job=job, status=status, created_at=now_, metadata=metadata)
+                    for job in jobs
+                    for status, metadata in (
+                        (JobStatus.Status.SENT, {}),
+                        (JobStatus.Status.ACCEPTED, {"comment": ""}),
+                        (
+                            JobStatus.Status.COMPLETED,
+                            {
+                                "comment": "",
+                                "miner_response": {
+                                    "job_uuid": str(job.uuid),
+                                    "message_type": "V0JobFinishedRequest",
+                                    "docker_process_stdout": "1",
+                                    "docker_process_stderr": "",
+                                },
+                            },
+                        ),
+                    )
+                ]
+            )
+            self.stdout.write(f"created {offset + len(jobs)}/{num_jobs} jobs")
+
+        return user
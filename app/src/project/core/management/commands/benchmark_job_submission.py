@@ -0,0 +1,69 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from rest_framework.test import APIClient
+
+from ...models import Channel, Job, Miner, Validator
+from ...validator_registry import get_validator_registry
+
+User = get_user_model()
+
+BENCHMARK_NAME = "benchmark-job-submission"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test concurrent job submission through POST /api/v1/job-docker/; "
+        "creates its own user, validator and miners and removes them afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=1000, help="number of jobs to submit")
+        parser.add_argument("--miners", type=int, default=1000, help="number of miners to create")
+        parser.add_argument("--concurrency", type=int, default=16, help="number of concurrent clients")
+
+    def handle(self, *args, jobs, miners, concurrency, **options):
+        user = User.objects.create(username=BENCHMARK_NAME)
+        validator = Validator.objects.create(ss58_address=BENCHMARK_NAME, is_active=True)
+        Channel.objects.create(name=BENCHMARK_NAME, validator=validator)
+        registry = get_validator_registry()
+        registry.connect(validator.pk, BENCHMARK_NAME)
+        created_miners = Miner.objects.bulk_create(
+            [Miner(ss58_address=f"{BENCHMARK_NAME}-{i}", is_active=True) for i in range(miners)]
+        )
+        local = threading.local()
+
+        def submit(_) -> tuple[float, bool]:
+            if not hasattr(local, "client"):
+                local.client = APIClient()
+                local.client.force_authenticate(user=user)
+
+            start = time.perf_counter()
+            response = local.client.post("/api/v1/job-docker/", {"docker_image": "hello-world"}, format="json")
+            return time.perf_counter() - start, response.status_code == 201
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                start = time.perf_counter()
+                results = list(pool.map(submit, range(jobs)))
+                elapsed = time.perf_counter() - start
+        finally:
+            registry.disconnect(validator.pk, BENCHMARK_NAME)
+            Job.objects.filter(user=user).delete()
+            Miner.objects.filter(pk__in=[miner.pk for miner in created_miners]).delete()
+            validator.delete()
+            user.delete()
+
+        latencies = sorted(latency for latency, _ in results)
+        num_failed = sum(1 for _, success in results if not success)
+        self.stdout.write(
+            f"submitted {jobs} jobs with concurrency {concurrency} in {elapsed:.2f}s: "
+            f"{jobs / elapsed:.1f} jobs/s, "
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms, "
+            f"{num_failed} failed"
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from ...utils import presigner, s3
+
+
+class Command(BaseCommand):
+    help = "Compare generating presigned URLs with boto3 against the local SigV4 presigner"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--urls", type=int, default=10_000, help="number of URLs to generate with each method")
+
+    def handle(self, *args, urls, **options):
+        expires_in = int(settings.DOWNLOAD_PRESIGNED_URL_LIFETIME.total_seconds())
+
+        def boto3_presign(key: str) -> str:
+            return s3.generate_presigned_url(
+                ClientMethod="get_object",
+                Params={"Bucket": settings.R2_BUCKET_NAME, "Key": key},
+                ExpiresIn=expires_in,
+            )
+
+        def local_presign(key: str) -> str:
+            return presigner.generate_presigned_url(
+                method="GET",
+                bucket=settings.R2_BUCKET_NAME,
+                key=key,
+                expires_in=expires_in,
+            )
+
+        for name, presign in (("boto3", boto3_presign), ("local", local_presign)):
+            presign("warm-up.zip")
+            start = time.perf_counter()
+            for i in range(urls):
+                presign(f"{i}.zip")
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name}: {elapsed / urls * 1_000_000:.1f} us per URL, {urls / elapsed:.0f} URLs/s")
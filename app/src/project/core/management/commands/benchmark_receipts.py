@@ -0,0 +1,161 @@
+import csv
+import io
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from uuid import uuid4
+
+import httpx
+from asgiref.sync import async_to_sync
+from bittensor import Keypair
+from compute_horde.executor_class import DEFAULT_EXECUTOR_CLASS
+from django.core.management import BaseCommand
+from django.utils.timezone import now
+
+from ...models import JobReceipt, MinerReceiptsCursor
+from ...receipts import MinerAddress, ReceiptsCollector, ReceiptVerifier, parse_receipt
+from ...schemas import ReceiptPayload
+
+FIELDNAMES = [
+    "job_uuid",
+    "miner_hotkey",
+    "validator_hotkey",
+    "time_started",
+    "time_took_us",
+    "score_str",
+    "executor_class",
+    "validator_signature",
+    "miner_signature",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure throughput of fetching and verifying receipts from a synthetic receipts CSV of a single miner; "
+        "does not touch the database unless --store is given, in which case the receipts stored are removed afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--receipts", type=int, default=100_000, help="number of receipts in the file")
+        parser.add_argument("--validators", type=int, default=16, help="number of validators signing the receipts")
+        parser.add_argument("--workers", type=int, default=None, help="number of verification processes")
+        parser.add_argument("--store", action="store_true", help="also measure fetching with storing the receipts")
+
+    def handle(self, *args, receipts, validators, workers, store, **options):
+        miner_keypair = Keypair.create_from_mnemonic(Keypair.generate_mnemonic())
+        validator_keypairs = [Keypair.create_from_mnemonic(Keypair.generate_mnemonic()) for _ in range(validators)]
+
+        start = time.perf_counter()
+        receipts_csv, time_started_median = self.make_receipts_csv(receipts, miner_keypair, validator_keypairs)
+        self.stdout.write(f"generated {receipts} receipts in {time.perf_counter() - start:.1f}s")
+
+        self.benchmark_per_row(receipts_csv, receipts)
+        miner = MinerAddress(hotkey=miner_keypair.ss58_address, ip="127.0.0.1", port=8000)
+        self.report(
+            "collector",
+            receipts,
+            *async_to_sync(self.benchmark_collector)(receipts_csv, miner, workers, cutoff_time=None),
+        )
+        self.report(
+            "collector, half of the receipts older than cutoff",
+            receipts,
+            *async_to_sync(self.benchmark_collector)(receipts_csv, miner, workers, cutoff_time=time_started_median),
+        )
+        if store:
+            try:
+                self.report(
+                    "collector, storing receipts (including starting verification workers)",
+                    receipts,
+                    *async_to_sync(self.benchmark_store)(receipts_csv, miner, workers),
+                )
+            finally:
+                JobReceipt.objects.filter(miner_hotkey=miner.hotkey).delete()
+                MinerReceiptsCursor.objects.filter(miner_hotkey=miner.hotkey).delete()
+
+    def make_receipts_csv(
+        self,
+        receipts: int,
+        miner_keypair: Keypair,
+        validator_keypairs: list[Keypair],
+    ) -> tuple[bytes, datetime]:
+        buf = io.StringIO()
+        csv_writer = csv.DictWriter(buf, fieldnames=FIELDNAMES)
+        csv_writer.writeheader()
+        time_started = now() - timedelta(seconds=receipts)
+        for i in range(receipts):
+            validator_keypair = validator_keypairs[i % len(validator_keypairs)]
+            payload = ReceiptPayload(
+                job_uuid=str(uuid4()),
+                miner_hotkey=miner_keypair.ss58_address,
+                validator_hotkey=validator_keypair.ss58_address,
+                time_started=time_started + timedelta(seconds=i),
+                time_took_us=30_000_000,
+                score_str="1.0",
+                executor_class=DEFAULT_EXECUTOR_CLASS,
+            )
+            blob = payload.blob_for_signing()
+            csv_writer.writerow(
+                {
+                    **payload.model_dump(mode="json"),
+                    "validator_signature": f"0x{validator_keypair.sign(blob).hex()}",
+                    "miner_signature": f"0x{miner_keypair.sign(blob).hex()}",
+                }
+            )
+        return buf.getvalue().encode(), time_started + timedelta(seconds=receipts // 2)
+
+    def report(self, name: str, receipts: int, elapsed: float, num_valid: int) -> None:
+        self.stdout.write(f"{name}: {receipts / elapsed:.0f} receipts/s ({elapsed:.2f}s, {num_valid} valid)")
+
+    def benchmark_per_row(self, receipts_csv: bytes, receipts: int) -> None:
+        """Parse and verify the receipts one by one, building keypairs for every signature"""
+        start = time.perf_counter()
+        num_valid = 0
+        for raw_receipt in csv.DictReader(io.StringIO(receipts_csv.decode())):
+            receipt = parse_receipt(raw_receipt)
+            miner_keypair = Keypair(ss58_address=receipt.payload.miner_hotkey)
+            validator_keypair = Keypair(ss58_address=receipt.payload.validator_hotkey)
+            if miner_keypair.verify(
+                receipt.payload.blob_for_signing(), receipt.miner_signature
+            ) and validator_keypair.verify(receipt.payload.blob_for_signing(), receipt.validator_signature):
+                num_valid += 1
+        self.report("per row, keypair built per signature", receipts, time.perf_counter() - start, num_valid)
+
+    async def benchmark_collector(
+        self,
+        receipts_csv: bytes,
+        miner: MinerAddress,
+        workers: int | None,
+        cutoff_time: datetime | None,
+    ) -> tuple[float, int]:
+        collector = ReceiptsCollector(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=receipts_csv)),
+            verifier=ReceiptVerifier(workers=workers),
+        )
+        async with httpx.AsyncClient(transport=collector.transport) as client:
+            # start the verification processes (which import bittensor) before measuring
+            start = time.perf_counter()
+            raw_receipts = csv.DictReader(io.StringIO(receipts_csv.decode()))
+            warm_up_receipts = [
+                parse_receipt(raw_receipt) for raw_receipt in islice(raw_receipts, collector.verifier.batch_size)
+            ]
+            await collector.verifier.verify(warm_up_receipts)
+            self.stdout.write(f"verification workers ready in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            try:
+                batches = collector.fetch_from_miner(
+                    client, miner, cutoff_time, MinerReceiptsCursor(miner_hotkey=miner.hotkey)
+                )
+                num_valid = sum([len(batch) async for batch in batches])
+            finally:
+                collector.verifier.close()
+        return time.perf_counter() - start, num_valid
+
+    async def benchmark_store(self, receipts_csv: bytes, miner: MinerAddress, workers: int | None) -> tuple[float, int]:
+        collector = ReceiptsCollector(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=receipts_csv)),
+            verifier=ReceiptVerifier(workers=workers),
+        )
+        start = time.perf_counter()
+        num_stored = await collector.collect([miner])
+        return time.perf_counter() - start, num_stored
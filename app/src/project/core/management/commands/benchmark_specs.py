@@ -0,0 +1,169 @@
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from ...models import (
+    GPU,
+    CpuSpecs,
+    ExecutorSpecs,
+    ExecutorSpecsSnapshot,
+    GpuSpecs,
+    Miner,
+    OtherSpecs,
+    ParsedSpecsData,
+    RawSpecsData,
+    TrustedValidator,
+    Validator,
+)
+from ...specs import append_specs
+
+# query of the materialized view (migration 0020), with validators hardcoded in the WHERE clause
+HARDCODED_VALIDATORS_SQL = """
+SELECT count(*) FROM (
+  SELECT snapshot.measured_at, miner.ss58_address, gpu_specs.gpu_model_id, gpu_specs.capacity
+  FROM
+    core_executorspecssnapshot snapshot
+    inner join core_parsedspecsdata specs on specs.id_id = snapshot.raw_specs_id
+    inner join core_validator validator on validator.id = snapshot.validator_id
+    inner join core_miner miner on miner.id = snapshot.miner_id
+    right join core_gpuspecs gpu_specs on gpu_specs.parsed_specs_id = specs.id_id
+    inner join core_cpuspecs cpu_specs on specs.cpu_specs_id = cpu_specs.id
+    inner join core_otherspecs other_specs on specs.other_specs_id = other_specs.id
+  where
+    snapshot.measured_at > CURRENT_DATE - INTERVAL '3 months'
+    and validator.ss58_address IN %s
+) AS specs
+"""
+
+# the same query with validators joined from the `TrustedValidator` table
+TRUSTED_VALIDATORS_SQL = """
+SELECT count(*) FROM (
+  SELECT snapshot.measured_at, miner.ss58_address, gpu_specs.gpu_model_id, gpu_specs.capacity
+  FROM
+    core_executorspecssnapshot snapshot
+    inner join core_parsedspecsdata specs on specs.id_id = snapshot.raw_specs_id
+    inner join core_validator validator on validator.id = snapshot.validator_id
+    inner join core_trustedvalidator trusted_validator on trusted_validator.ss58_address = validator.ss58_address
+    inner join core_miner miner on miner.id = snapshot.miner_id
+    inner join core_gpuspecs gpu_specs on gpu_specs.parsed_specs_id = specs.id_id
+    inner join core_cpuspecs cpu_specs on specs.cpu_specs_id = cpu_specs.id
+    inner join core_otherspecs other_specs on specs.other_specs_id = other_specs.id
+  where
+    snapshot.measured_at > CURRENT_DATE - INTERVAL '3 months'
+) AS specs
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure queries of executor specs filtered by trusted validators on synthetic snapshots of the last 3 months; "
+        "everything is created in a transaction which is rolled back at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--miners", type=int, default=256, help="number of miners")
+        parser.add_argument("--validators", type=int, default=16, help="number of validators reporting specs")
+        parser.add_argument("--trusted", type=int, default=3, help="number of trusted validators among them")
+        parser.add_argument("--interval", type=int, default=6, help="hours between specs reported by a validator")
+        parser.add_argument("--machines", type=int, default=1000, help="number of distinct machine specs")
+        parser.add_argument("--appends", type=int, default=1000, help="number of snapshots to append specs of")
+
+    def handle(self, *args, miners, validators, trusted, interval, machines, appends, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            num_snapshots = self.create_snapshots(miners, validators, trusted, interval, machines)
+            self.stdout.write(f"created {num_snapshots} snapshots in {time.perf_counter() - start:.1f}s")
+
+            trusted_addresses = tuple(TrustedValidator.objects.values_list("ss58_address", flat=True))
+            self.benchmark_query("view query, hardcoded validators", HARDCODED_VALIDATORS_SQL, [trusted_addresses])
+            self.benchmark_query("view query, trusted validators table", TRUSTED_VALIDATORS_SQL, [])
+            self.benchmark_append(appends)
+
+            transaction.set_rollback(True)
+
+    def create_snapshots(self, miners: int, validators: int, trusted: int, interval: int, machines: int) -> int:
+        gpu, _ = GPU.objects.get_or_create(name="BENCHMARK GPU")
+        cpu_specs, _ = CpuSpecs.objects.get_or_create(cpu_model="benchmark cpu", cpu_count=64)
+        other_specs, _ = OtherSpecs.objects.get_or_create(
+            os="benchmark os", virtualization="kvm", total_ram=512, total_hdd=2048, asn=0
+        )
+        raw_specs = RawSpecsData.objects.bulk_create(
+            [
+                RawSpecsData(data={"benchmark": i}, data_hash=RawSpecsData.hash_data({"benchmark": i}))
+                for i in range(machines)
+            ],
+        )
+        parsed_specs = ParsedSpecsData.objects.bulk_create(
+            [ParsedSpecsData(id=raw, cpu_specs=cpu_specs, other_specs=other_specs) for raw in raw_specs]
+        )
+        GpuSpecs.objects.bulk_create(
+            [GpuSpecs(parsed_specs=parsed, gpu_model=gpu, gpu_count=8, capacity=81920) for parsed in parsed_specs]
+        )
+        miner_ids = [
+            miner.pk
+            for miner in Miner.objects.bulk_create(
+                [Miner(ss58_address=f"benchmark_miner_{i}", is_active=True) for i in range(miners)]
+            )
+        ]
+        validators_ = Validator.objects.bulk_create(
+            [Validator(ss58_address=f"benchmark_validator_{i}", is_active=True) for i in range(validators)]
+        )
+        TrustedValidator.objects.all().delete()
+        TrustedValidator.objects.bulk_create(
+            [TrustedValidator(ss58_address=validator.ss58_address) for validator in validators_[:trusted]]
+        )
+
+        with connection.cursor() as cursor:
+            # every validator reports specs of every miner once per interval, for 3 months
+            cursor.execute(
+                """
+                INSERT INTO core_executorspecssnapshot (miner_id, validator_id, measured_at, raw_specs_id)
+                SELECT
+                    miner.id,
+                    validator.id,
+                    now() - step * make_interval(hours => %s) - random() * interval '1 minute',
+                    (%s::bigint[])[1 + (miner.id %% %s)]
+                FROM
+                    unnest(%s::bigint[]) AS miner (id),
+                    unnest(%s::bigint[]) AS validator (id),
+                    generate_series(0, %s) AS step
+                """,
+                [
+                    interval,
+                    [raw.pk for raw in raw_specs],
+                    machines,
+                    miner_ids,
+                    [validator.pk for validator in validators_],
+                    int(timedelta(days=90) / timedelta(hours=interval)),
+                ],
+            )
+            num_snapshots = cursor.rowcount
+            cursor.execute("ANALYZE core_executorspecssnapshot")
+        return num_snapshots
+
+    def benchmark_query(self, name: str, sql: str, params: list) -> None:
+        with connection.cursor() as cursor:
+            # the first run warms up the cache
+            for _ in range(2):
+                start = time.perf_counter()
+                cursor.execute(sql, params)
+                (rows,) = cursor.fetchone()
+                elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name}: {elapsed:.2f}s ({rows} rows)")
+
+    def benchmark_append(self, appends: int) -> None:
+        snapshot_ids = list(
+            ExecutorSpecsSnapshot.objects.filter(measured_at__gt=now() - timedelta(days=1))
+            .order_by("-measured_at")
+            .values_list("pk", flat=True)[:appends]
+        )
+        start = time.perf_counter()
+        rows = sum(append_specs(snapshot_ids=[snapshot_id]) for snapshot_id in snapshot_ids)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"appending specs of a snapshot: {elapsed / max(len(snapshot_ids), 1) * 1000:.2f}ms "
+            f"({len(snapshot_ids)} snapshots, {rows} rows, {ExecutorSpecs.objects.count()} rows in total)"
+        )
@@ -0,0 +1,116 @@
+import time
+from typing import Annotated, Union
+from uuid import uuid4
+
+from asgiref.sync import async_to_sync
+from bittensor import Keypair
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from compute_horde.executor_class import DEFAULT_EXECUTOR_CLASS
+from django.core.management import BaseCommand
+from pydantic import Field, TypeAdapter
+
+from ....asgi import application
+from ...consumers import ValidatorConsumer
+from ...models import Channel, Validator
+from ...schemas import AuthenticationRequest, Heartbeat, JobRequest, JobStatusUpdate, MachineSpecs
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-message latency of the validator WS consumer: parsing of every message type, "
+        "full receive path (parse, dispatch, response) and sending jobs to the validator; "
+        "creates its own validator and removes it afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000, help="number of messages of each type")
+
+    def handle(self, *args, messages, **options):
+        keypair = Keypair.create_from_mnemonic(Keypair.generate_mnemonic())
+        samples = {
+            AuthenticationRequest: AuthenticationRequest.from_keypair(keypair),
+            Heartbeat: Heartbeat(),
+            # handled without writes: the job and the miner do not exist
+            JobStatusUpdate: JobStatusUpdate(uuid=str(uuid4()), status="accepted"),
+            MachineSpecs: MachineSpecs(
+                specs={"gpu": {"count": 1}},
+                miner_hotkey=f"benchmark-{uuid4()}",
+                validator_hotkey=keypair.ss58_address,
+            ),
+        }
+
+        self.benchmark_parsing(samples, messages)
+
+        validator = Validator.objects.create(ss58_address=keypair.ss58_address, is_active=True)
+        try:
+            async_to_sync(self.benchmark_receive)(samples, messages, validator)
+        finally:
+            validator.delete()
+
+    def report(self, name: str, elapsed: float, messages: int) -> None:
+        self.stdout.write(
+            f"{name}: {elapsed / messages * 1_000_000:.1f} us per message, {messages / elapsed:.0f} msg/s"
+        )
+
+    def benchmark_parsing(self, samples: dict, messages: int) -> None:
+        adapter = ValidatorConsumer.message_adapter()
+        for message_type, sample in samples.items():
+            text_data = sample.json()
+
+            start = time.perf_counter()
+            for _ in range(messages):
+                TypeAdapter(
+                    Annotated[Union[*ValidatorConsumer.MESSAGE_HANDLERS.keys()], Field(discriminator="message_type")]
+                ).validate_json(text_data)
+            self.report(
+                f"parse {message_type.__name__}, adapter built per message", time.perf_counter() - start, messages
+            )
+
+            start = time.perf_counter()
+            for _ in range(messages):
+                adapter.validate_json(text_data)
+            self.report(f"parse {message_type.__name__}, cached adapter", time.perf_counter() - start, messages)
+
+    async def benchmark_receive(self, samples: dict, messages: int, validator: Validator) -> None:
+        communicator = WebsocketCommunicator(application, "/ws/v0/")
+        connected, _ = await communicator.connect()
+        assert connected
+        try:
+            await communicator.send_to(text_data=samples[AuthenticationRequest].json())
+            response = await communicator.receive_json_from()
+            assert response["status"] == "success", response
+
+            for message_type, sample in samples.items():
+                text_data = sample.json()
+                start = time.perf_counter()
+                for _ in range(messages):
+                    await communicator.send_to(text_data=text_data)
+                    if message_type not in (Heartbeat, MachineSpecs):  # these are not answered
+                        await communicator.receive_from()
+                # messages are handled in order, so the (rejected) re-authentication is answered after all of them
+                await communicator.send_to(text_data=samples[AuthenticationRequest].json())
+                await communicator.receive_from()
+                self.report(f"receive {message_type.__name__}", time.perf_counter() - start, messages)
+
+            channel = await Channel.objects.aget(validator=validator)
+            job_request = JobRequest(
+                uuid=str(uuid4()),
+                miner_hotkey="benchmark",
+                executor_class=DEFAULT_EXECUTOR_CLASS,
+                docker_image="hello-world",
+                raw_script="",
+                args=[],
+                env={},
+                use_gpu=False,
+                input_url="",
+                output_url="",
+            ).dict()
+            channel_layer = get_channel_layer()
+            start = time.perf_counter()
+            for _ in range(messages):
+                await channel_layer.send(channel.name, job_request)
+                await communicator.receive_from()
+            self.report("send JobRequest", time.perf_counter() - start, messages)
+        finally:
+            await communicator.disconnect()
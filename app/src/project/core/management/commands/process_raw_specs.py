@@ -1,6 +1,13 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import structlog
 from asgiref.sync import async_to_sync
 from django.core.management import BaseCommand
+from django.db import connection
+from django.db.models import Exists, OuterRef
 
 from ...models import ParsedSpecsData, RawSpecsData
 from ...specs import process_raw_specs_data
@@ -9,18 +16,80 @@ log = structlog.get_logger(__name__)
 
 
 class Command(BaseCommand):
-    help = "Process RawSpecsData jsons to regenerate MinerSpecs and MinerGpuSpecs tables"
+    help = (
+        "Process RawSpecsData jsons which were not parsed yet to regenerate MinerSpecs and MinerGpuSpecs tables; "
+        "progress is saved in a checkpoint file, so that an interrupted run resumes where it stopped"
+    )
 
     def add_arguments(self, parser):
-        pass
+        parser.add_argument("--chunk-size", type=int, default=1000, help="number of raw specs fetched at once")
+        parser.add_argument("--concurrency", type=int, default=8, help="number of raw specs processed in parallel")
+        parser.add_argument(
+            "--checkpoint",
+            type=Path,
+            default=Path("process_raw_specs.checkpoint"),
+            help="file with the id of the last raw specs processed, removed when all raw specs are processed",
+        )
+        parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the beginning")
+
+    def handle(self, *args, chunk_size, concurrency, checkpoint, restart, **options):
+        last_pk = 0
+        if checkpoint.exists() and not restart:
+            last_pk = json.loads(checkpoint.read_text())["last_pk"]
+            log.info(f"resuming after raw specs {last_pk}")
 
-    def handle(self, *args, **options):
-        n = RawSpecsData.objects.count()
+        # anti-join, so that raw specs already parsed are skipped without a query per row
+        unparsed = (
+            RawSpecsData.objects.filter(~Exists(ParsedSpecsData.objects.filter(pk=OuterRef("pk"))))
+            .only("pk", "data")
+            .order_by("pk")
+        )
+        n = unparsed.filter(pk__gt=last_pk).count()
         log.info(f"Processing {n} raw specs")
 
-        for i, raw_specs in enumerate(RawSpecsData.objects.all()):
-            if not ParsedSpecsData.objects.filter(pk=raw_specs.pk).exists():
-                async_to_sync(process_raw_specs_data)(raw_specs)
-                log.info(f"processed {i}/{n} raw specs {raw_specs.pk}")
-            else:
-                log.warning(f"skipping {i}/{n} raw specs {raw_specs.pk}")
+        num_processed = num_failed = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while chunk := list(unparsed.filter(pk__gt=last_pk)[:chunk_size]):
+                # every worker processes its share of the chunk over its own database connection
+                shares = [chunk[i::concurrency] for i in range(concurrency)]
+                num_failed += sum(pool.map(self.process, shares))
+                num_processed += len(chunk)
+
+                last_pk = chunk[-1].pk
+                self.save_checkpoint(checkpoint, last_pk)
+                elapsed = time.perf_counter() - start
+                log.info(
+                    f"processed {num_processed}/{n} raw specs up to {last_pk} ({num_failed} failed): "
+                    f"{num_processed / elapsed:.1f} rows/s"
+                )
+
+        checkpoint.unlink(missing_ok=True)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {num_processed} raw specs ({num_failed} failed) in {elapsed:.1f}s: "
+                f"{num_processed / max(elapsed, 1e-9):.1f} rows/s"
+            )
+        )
+
+    def process(self, raw_specs_list: list[RawSpecsData]) -> int:
+        """Process given raw specs, returning the number of failures"""
+        num_failed = 0
+        try:
+            for raw_specs in raw_specs_list:
+                try:
+                    async_to_sync(process_raw_specs_data)(raw_specs)
+                except Exception as e:
+                    log.error(f"failed to process raw specs {raw_specs.pk}: {e}")
+                    num_failed += 1
+        finally:
+            connection.close()
+        return num_failed
+
+    @staticmethod
+    def save_checkpoint(checkpoint: Path, last_pk: int) -> None:
+        # replaced atomically, so that the checkpoint is never left half-written
+        tmp = checkpoint.with_name(f"{checkpoint.name}.tmp")
+        tmp.write_text(json.dumps({"last_pk": last_pk}))
+        tmp.replace(checkpoint)
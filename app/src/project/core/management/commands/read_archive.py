@@ -0,0 +1,47 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_aware, make_aware
+
+from ...archive import ARCHIVE_POLICIES, read_archive, to_json
+
+
+def parse_timestamp(value: str):
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise CommandError(f"invalid timestamp: {value}")
+    return timestamp if is_aware(timestamp) else make_aware(timestamp)
+
+
+class Command(BaseCommand):
+    help = "Print archived rows (see `core.archive`) as JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", choices=sorted(ARCHIVE_POLICIES), help="name of the archive")
+        parser.add_argument("--since", type=parse_timestamp, help="only rows measured at or after this timestamp")
+        parser.add_argument("--until", type=parse_timestamp, help="only rows measured before this timestamp")
+        parser.add_argument(
+            "--filter",
+            dest="conditions",
+            action="append",
+            default=[],
+            metavar="FIELD=VALUE",
+            help="only rows with given value of an archived field, e.g. miner__ss58_address=5F...",
+        )
+
+    def handle(self, *args, archive, since, until, conditions, **options):
+        policy = ARCHIVE_POLICIES[archive]
+        filters = {}
+        for condition in conditions:
+            field, sep, value = condition.partition("=")
+            if not sep or field not in policy.fields:
+                raise CommandError(f"invalid filter {condition!r}, fields are: {', '.join(policy.fields)}")
+            # numbers are stored as such, everything else as strings
+            try:
+                filters[field] = json.loads(value)
+            except ValueError:
+                filters[field] = value
+
+        for row in read_archive(policy, since=since, until=until, **filters):
+            self.stdout.write(json.dumps(row, default=to_json))
@@ -1,11 +1,10 @@
 import itertools
-from datetime import timedelta
 
 from django.contrib.auth import get_user_model
 from django.core.management import BaseCommand
-from django.utils.timezone import now
 
-from ...models import Channel, Job, Miner
+from ...models import Job, Miner
+from ...validator_registry import get_validator_registry
 
 User = get_user_model()
 
@@ -20,9 +19,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         user = User.objects.get(username=options["username"])
         job_tag = options["job_tag"]
-        validator_ids = Channel.objects.filter(last_heartbeat__gte=now() - timedelta(minutes=3)).values_list(
-            "validator_id", flat=True
-        )
+        validator_ids = get_validator_registry().connected_validator_ids()
         cycle_validator_ids = itertools.cycle(validator_ids)
         miners = Miner.objects.filter(is_active=True)
         for miner in miners:
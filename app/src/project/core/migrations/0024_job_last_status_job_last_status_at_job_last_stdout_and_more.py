@@ -0,0 +1,31 @@
+# Generated by Django 4.2.13 on 2024-07-15 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0023_job_executor_class_jobreceipt_executor_class"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="last_status",
+            field=models.SmallIntegerField(blank=True, help_text="status of the most recent JobStatus", null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="last_status_at",
+            field=models.DateTimeField(blank=True, help_text="time of the most recent JobStatus", null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="last_stdout",
+            field=models.TextField(blank=True, default="", help_text="stdout excerpt of the most recent JobStatus"),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(fields=["user", "-created_at"], name="idx_job_user_created_at"),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils.timezone import now
+
+JOB_TIMEOUT = timedelta(minutes=5, seconds=30)
+FINAL_STATUS_VALUES = (2, -1, -2)  # COMPLETED, REJECTED, FAILED
+
+
+def fill_miner_availability(apps, schema_editor):
+    Job = apps.get_model("core", "Job")
+    Miner = apps.get_model("core", "Miner")
+
+    latest_jobs = Job.objects.filter(miner=OuterRef("pk")).order_by("-created_at")
+    Miner.objects.update(last_assigned_at=Subquery(latest_jobs.values("created_at")[:1]))
+
+    # miners whose latest job is still running stay busy until it times out
+    unfinished_jobs = Job.objects.filter(created_at__gt=now() - JOB_TIMEOUT).exclude(
+        statuses__status__in=FINAL_STATUS_VALUES
+    )
+    for job in unfinished_jobs.only("miner_id", "created_at"):
+        Miner.objects.filter(pk=job.miner_id, last_assigned_at=job.created_at).update(
+            busy_until=job.created_at + JOB_TIMEOUT
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0024_job_last_status_job_last_status_at_job_last_stdout_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="miner",
+            name="busy_until",
+            field=models.DateTimeField(
+                blank=True, help_text="miner is considered busy with its last job until this time", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="miner",
+            name="last_assigned_at",
+            field=models.DateTimeField(
+                blank=True, help_text="creation time of the last job assigned to this miner", null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="miner",
+            index=models.Index(
+                F("last_assigned_at").asc(nulls_first=True),
+                condition=Q(("is_active", True)),
+                name="idx_miner_last_assigned_at",
+            ),
+        ),
+        migrations.RunPython(fill_miner_availability, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0025_miner_busy_until_miner_last_assigned_at_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="job",
+            name="miner",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="jobs",
+                to="core.miner",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="validator",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="jobs",
+                to="core.validator",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="jobstatus",
+            name="status",
+            field=models.SmallIntegerField(
+                choices=[
+                    (-3, "Pending"),
+                    (-2, "Failed"),
+                    (-1, "Rejected"),
+                    (0, "Sent"),
+                    (1, "Accepted"),
+                    (2, "Completed"),
+                ]
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("last_status", -3)),
+                fields=["created_at", "uuid"],
+                name="idx_job_pending_created_at",
+            ),
+        ),
+    ]
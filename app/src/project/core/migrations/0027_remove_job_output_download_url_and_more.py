@@ -0,0 +1,20 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0026_job_pending_dispatch"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="job",
+            name="output_download_url",
+        ),
+        migrations.RemoveField(
+            model_name="job",
+            name="output_download_url_expires_at",
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0027_remove_job_output_download_url_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="jobreceipt",
+            index=models.Index(fields=["miner_hotkey", "time_started"], name="idx_receipt_miner_time_started"),
+        ),
+    ]
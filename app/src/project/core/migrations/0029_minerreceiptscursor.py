@@ -0,0 +1,24 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0028_jobreceipt_idx_receipt_miner_time_started"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MinerReceiptsCursor",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("miner_hotkey", models.CharField(max_length=256, unique=True)),
+                ("etag", models.CharField(blank=True, max_length=255)),
+                ("last_modified", models.CharField(blank=True, max_length=255)),
+                ("offset", models.BigIntegerField(default=0)),
+                ("fieldnames", models.JSONField(default=list)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,170 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations, models
+
+# Creates a monthly partition of the receipts table; `month` has to be the first day of the month.
+# Also used by the `create_job_receipt_partitions` task.
+CREATE_PARTITION_FUNCTION = """
+CREATE FUNCTION core_create_job_receipt_partition(month date) RETURNS void AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF core_jobreceipt FOR VALUES FROM (%L) TO (%L)',
+        'core_jobreceipt_' || replace(left(month::text, 7), '-', '_'),
+        month::text || ' 00:00:00+00',
+        (month + interval '1 month')::date::text || ' 00:00:00+00'
+    );
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PARTITION_SQL = (
+    CREATE_PARTITION_FUNCTION
+    + """
+ALTER TABLE core_jobreceipt RENAME TO core_jobreceipt_unpartitioned;
+
+CREATE SEQUENCE core_jobreceipt_partitioned_id_seq;
+
+CREATE TABLE core_jobreceipt (
+    id bigint NOT NULL DEFAULT nextval('core_jobreceipt_partitioned_id_seq'),
+    job_uuid uuid NOT NULL,
+    miner_hotkey varchar(256) NOT NULL,
+    validator_hotkey varchar(256) NOT NULL,
+    time_started timestamp with time zone NOT NULL,
+    time_took_us bigint NOT NULL,
+    score_str varchar(256) NOT NULL,
+    executor_class varchar(255) NOT NULL
+) PARTITION BY RANGE (time_started);
+
+ALTER SEQUENCE core_jobreceipt_partitioned_id_seq OWNED BY core_jobreceipt.id;
+
+-- receipts older than the first month stored and (invalid) ones from the far future
+CREATE TABLE core_jobreceipt_default PARTITION OF core_jobreceipt DEFAULT;
+
+-- a partition for every month since the oldest receipt stored, up to two months ahead
+SELECT core_create_job_receipt_partition(month::date)
+FROM generate_series(
+    date_trunc('month', coalesce((SELECT min(time_started) FROM core_jobreceipt_unpartitioned), now()) AT TIME ZONE 'UTC'),
+    date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months',
+    interval '1 month'
+) AS month;
+
+INSERT INTO core_jobreceipt SELECT
+    id, job_uuid, miner_hotkey, validator_hotkey, time_started, time_took_us, score_str, executor_class
+FROM core_jobreceipt_unpartitioned;
+
+SELECT setval('core_jobreceipt_partitioned_id_seq', coalesce(max(id), 0) + 1, false) FROM core_jobreceipt;
+
+DROP TABLE core_jobreceipt_unpartitioned;
+
+ALTER TABLE core_jobreceipt ADD CONSTRAINT core_jobreceipt_pkey PRIMARY KEY (id, time_started);
+ALTER TABLE core_jobreceipt ADD CONSTRAINT unique_job_receipt_job_uuid_time_started UNIQUE (job_uuid, time_started);
+CREATE INDEX idx_receipt_miner_time_started ON core_jobreceipt (miner_hotkey, time_started);
+CREATE INDEX idx_receipt_time_started ON core_jobreceipt (time_started);
+"""
+)
+
+UNPARTITION_SQL = """
+ALTER TABLE core_jobreceipt RENAME TO core_jobreceipt_partitioned;
+ALTER INDEX core_jobreceipt_pkey RENAME TO core_jobreceipt_partitioned_pkey;
+ALTER INDEX idx_receipt_miner_time_started RENAME TO idx_receipt_partitioned_miner_time_started;
+
+CREATE TABLE core_jobreceipt (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    job_uuid uuid NOT NULL,
+    miner_hotkey varchar(256) NOT NULL,
+    validator_hotkey varchar(256) NOT NULL,
+    time_started timestamp with time zone NOT NULL,
+    time_took_us bigint NOT NULL,
+    score_str varchar(256) NOT NULL,
+    executor_class varchar(255) NOT NULL
+);
+
+INSERT INTO core_jobreceipt SELECT
+    id, job_uuid, miner_hotkey, validator_hotkey, time_started, time_took_us, score_str, executor_class
+FROM core_jobreceipt_partitioned;
+
+SELECT setval(pg_get_serial_sequence('core_jobreceipt', 'id'), coalesce(max(id), 0) + 1, false) FROM core_jobreceipt;
+
+DROP TABLE core_jobreceipt_partitioned;
+
+ALTER TABLE core_jobreceipt ADD CONSTRAINT core_jobreceipt_pkey PRIMARY KEY (id);
+ALTER TABLE core_jobreceipt ADD CONSTRAINT unique_job_receipt_job_uuid UNIQUE (job_uuid);
+CREATE INDEX idx_receipt_miner_time_started ON core_jobreceipt (miner_hotkey, time_started);
+
+DROP FUNCTION core_create_job_receipt_partition(date);
+"""
+
+# receipts with scores which are not numbers cannot be aggregated and are left out of the stats
+BACKFILL_STATS_SQL = """
+INSERT INTO core_hourlyjobreceiptstats (
+    hour, miner_hotkey, validator_hotkey, executor_class, count, total_time_took_us, total_score
+)
+SELECT
+    date_trunc('hour', time_started AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+    miner_hotkey,
+    validator_hotkey,
+    executor_class,
+    count(*),
+    sum(time_took_us),
+    sum(score_str::double precision)
+FROM core_jobreceipt
+WHERE score_str ~ '^\\s*[+-]?([0-9]+\\.?[0-9]*|\\.[0-9]+)([eE][+-]?[0-9]+)?\\s*$'
+GROUP BY 1, 2, 3, 4;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0029_minerreceiptscursor"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(sql=PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name="jobreceipt",
+                    name="unique_job_receipt_job_uuid",
+                ),
+                migrations.AddConstraint(
+                    model_name="jobreceipt",
+                    constraint=models.UniqueConstraint(
+                        fields=("job_uuid", "time_started"), name="unique_job_receipt_job_uuid_time_started"
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name="jobreceipt",
+                    index=models.Index(fields=["time_started"], name="idx_receipt_time_started"),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="HourlyJobReceiptStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("hour", models.DateTimeField()),
+                ("miner_hotkey", models.CharField(max_length=256)),
+                ("validator_hotkey", models.CharField(max_length=256)),
+                ("executor_class", models.CharField(max_length=255)),
+                ("count", models.BigIntegerField()),
+                ("total_time_took_us", models.BigIntegerField()),
+                ("total_score", models.FloatField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["miner_hotkey", "hour"], name="idx_receipt_stats_miner_hour"),
+                    models.Index(fields=["hour"], name="idx_receipt_stats_hour"),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="hourlyjobreceiptstats",
+            constraint=models.UniqueConstraint(
+                fields=("hour", "miner_hotkey", "validator_hotkey", "executor_class"),
+                name="unique_hourly_job_receipt_stats",
+            ),
+        ),
+        migrations.RunSQL(sql=BACKFILL_STATS_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations, models
+
+# same as `HourlyJobReceiptStats.TIME_TOOK_HISTOGRAM_BOUNDARIES_US`
+TIME_TOOK_HISTOGRAM_BOUNDARIES_US = [int(10_000 * 1.25**i) for i in range(72)]
+
+BACKFILL_HISTOGRAMS_SQL = """
+UPDATE core_hourlyjobreceiptstats AS stats
+SET time_took_histogram = histogram.time_took_histogram
+FROM (
+    SELECT hour, miner_hotkey, validator_hotkey, executor_class, jsonb_object_agg(bucket, count) AS time_took_histogram
+    FROM (
+        SELECT
+            date_trunc('hour', time_started AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour,
+            miner_hotkey,
+            validator_hotkey,
+            executor_class,
+            width_bucket(time_took_us, %s::bigint[]) AS bucket,
+            count(*) AS count
+        FROM core_jobreceipt
+        WHERE score_str ~ '^\\s*[+-]?([0-9]+\\.?[0-9]*|\\.[0-9]+)([eE][+-]?[0-9]+)?\\s*$'
+        GROUP BY 1, 2, 3, 4, 5
+    ) AS receipt_bucket
+    GROUP BY 1, 2, 3, 4
+) AS histogram
+WHERE (stats.hour, stats.miner_hotkey, stats.validator_hotkey, stats.executor_class)
+    = (histogram.hour, histogram.miner_hotkey, histogram.validator_hotkey, histogram.executor_class);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0030_partition_jobreceipt_hourlyjobreceiptstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hourlyjobreceiptstats",
+            name="time_took_histogram",
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunSQL(
+            sql=[(BACKFILL_HISTOGRAMS_SQL, [TIME_TOOK_HISTOGRAM_BOUNDARIES_US])],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.CreateModel(
+            name="MinerStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("window", models.CharField(max_length=16)),
+                ("miner_hotkey", models.CharField(max_length=256)),
+                ("executor_class", models.CharField(max_length=255)),
+                ("count", models.BigIntegerField()),
+                ("time_took_p50_us", models.BigIntegerField()),
+                ("time_took_p95_us", models.BigIntegerField()),
+                ("average_score", models.FloatField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name_plural": "miner stats",
+                "indexes": [
+                    models.Index(fields=["window", "-count", "miner_hotkey"], name="idx_miner_stats_window_count"),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="minerstats",
+            constraint=models.UniqueConstraint(
+                fields=("window", "miner_hotkey", "executor_class"), name="unique_miner_stats"
+            ),
+        ),
+    ]
@@ -0,0 +1,158 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DROP_MATERIALIZED_VIEW_SQL = """
+DROP INDEX specs_miner_idx;
+DROP INDEX specs_measured_at_idx;
+DROP MATERIALIZED VIEW specs;
+"""
+
+# as in 0020_modify_specs_materialized_views
+CREATE_MATERIALIZED_VIEW_SQL = """
+CREATE MATERIALIZED VIEW specs AS
+  SELECT
+    snapshot.measured_at,
+    miner.ss58_address as miner_hotkey,
+    snapshot.batch_id,
+    other_specs.os,
+    other_specs.virtualization,
+    other_specs.total_hdd,
+    other_specs.total_ram,
+    cpu_specs.cpu_count,
+    cpu_specs.cpu_model,
+    gpu_specs.gpu_model_id as gpu_id,
+    gpu_specs.capacity as vram,
+    gpu_specs.cuda,
+    gpu_specs.driver,
+    gpu_specs.gpu_count,
+    gpu_specs.graphics_speed,
+    gpu_specs.memory_speed,
+    gpu_specs.power_limit
+  FROM
+    core_executorspecssnapshot snapshot
+    inner join core_parsedspecsdata specs on specs.id_id = snapshot.raw_specs_id
+    inner join core_validator validator on validator.id = snapshot.validator_id
+    inner join core_miner miner on miner.id = snapshot.miner_id
+    right join core_gpuspecs gpu_specs on gpu_specs.parsed_specs_id = specs.id_id
+    inner join core_cpuspecs cpu_specs on specs.cpu_specs_id = cpu_specs.id
+    inner join core_otherspecs other_specs on specs.other_specs_id = other_specs.id
+  where
+    snapshot.measured_at > CURRENT_DATE - INTERVAL '3 months'
+    and (
+      validator.ss58_address = '5F4tQyWrhfGVcNhoqeiNsR6KjD4wMZ2kfhLj4oHYuyHbZAc3' -- OTF
+      or validator.ss58_address = '5CXRfP2ekFhe62r7q3vppRajJmGhTi7vwvb2yr79jveZ282w' -- Rizzo validator
+      or validator.ss58_address = '5HBVrFGy6oYhhh71m9fFGYD7zbKyAeHnWN8i8s9fJTBMCtEE' -- our validator
+    );
+
+  CREATE INDEX specs_miner_idx ON specs (miner_hotkey, batch_id, measured_at);
+  CREATE INDEX specs_measured_at_idx ON specs (measured_at);
+"""
+
+BACKFILL_SQL = """
+INSERT INTO specs (
+    snapshot_id, gpu_specs_id, measured_at, miner_hotkey, batch_id, os, virtualization, total_hdd, total_ram,
+    cpu_count, cpu_model, gpu_id, vram, cuda, driver, gpu_count, graphics_speed, memory_speed, power_limit
+)
+SELECT
+    snapshot.id,
+    gpu_specs.id,
+    snapshot.measured_at,
+    miner.ss58_address,
+    snapshot.batch_id,
+    other_specs.os,
+    other_specs.virtualization,
+    other_specs.total_hdd,
+    other_specs.total_ram,
+    cpu_specs.cpu_count,
+    cpu_specs.cpu_model,
+    gpu_specs.gpu_model_id,
+    gpu_specs.capacity,
+    gpu_specs.cuda,
+    gpu_specs.driver,
+    gpu_specs.gpu_count,
+    gpu_specs.graphics_speed,
+    gpu_specs.memory_speed,
+    gpu_specs.power_limit
+FROM
+    core_executorspecssnapshot snapshot
+    INNER JOIN core_parsedspecsdata specs ON specs.id_id = snapshot.raw_specs_id
+    INNER JOIN core_validator validator ON validator.id = snapshot.validator_id
+    INNER JOIN core_miner miner ON miner.id = snapshot.miner_id
+    INNER JOIN core_gpuspecs gpu_specs ON gpu_specs.parsed_specs_id = specs.id_id
+    INNER JOIN core_cpuspecs cpu_specs ON specs.cpu_specs_id = cpu_specs.id
+    INNER JOIN core_otherspecs other_specs ON specs.other_specs_id = other_specs.id
+WHERE
+    snapshot.measured_at > CURRENT_DATE - INTERVAL '90 days'
+    AND validator.ss58_address IN (
+        '5F4tQyWrhfGVcNhoqeiNsR6KjD4wMZ2kfhLj4oHYuyHbZAc3',
+        '5CXRfP2ekFhe62r7q3vppRajJmGhTi7vwvb2yr79jveZ282w',
+        '5HBVrFGy6oYhhh71m9fFGYD7zbKyAeHnWN8i8s9fJTBMCtEE'
+    );
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0031_hourlyjobreceiptstats_time_took_histogram_minerstats"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=DROP_MATERIALIZED_VIEW_SQL, reverse_sql=CREATE_MATERIALIZED_VIEW_SQL),
+        migrations.CreateModel(
+            name="ExecutorSpecs",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("measured_at", models.DateTimeField()),
+                ("miner_hotkey", models.CharField(max_length=255)),
+                ("batch_id", models.UUIDField(null=True)),
+                ("os", models.CharField(max_length=255, null=True)),
+                ("virtualization", models.CharField(max_length=255, null=True)),
+                ("total_hdd", models.PositiveIntegerField(help_text="in GB", null=True)),
+                ("total_ram", models.PositiveIntegerField(help_text="in GB", null=True)),
+                ("cpu_count", models.PositiveIntegerField()),
+                ("cpu_model", models.CharField(max_length=255)),
+                ("vram", models.PositiveIntegerField(help_text="in MB")),
+                ("cuda", models.CharField(max_length=255)),
+                ("driver", models.CharField(max_length=255)),
+                ("gpu_count", models.PositiveIntegerField()),
+                ("graphics_speed", models.PositiveIntegerField(help_text="in MHz")),
+                ("memory_speed", models.PositiveIntegerField(help_text="in MHz")),
+                ("power_limit", models.FloatField()),
+                (
+                    "gpu",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="core.gpu"),
+                ),
+                (
+                    "gpu_specs",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="core.gpuspecs"
+                    ),
+                ),
+                (
+                    "snapshot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="core.executorspecssnapshot",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "executor specs",
+                "db_table": "specs",
+                "indexes": [
+                    models.Index(fields=["miner_hotkey", "batch_id", "measured_at"], name="specs_miner_idx"),
+                    models.Index(fields=["measured_at"], name="specs_measured_at_idx"),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="executorspecs",
+            constraint=models.UniqueConstraint(
+                fields=("snapshot", "gpu_specs"), name="unique_specs_snapshot_gpu_specs"
+            ),
+        ),
+        migrations.RunSQL(sql=BACKFILL_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
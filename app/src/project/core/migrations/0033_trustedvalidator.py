@@ -0,0 +1,36 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations, models
+
+# validators which used to be hardcoded in the specs view
+TRUSTED_VALIDATORS = [
+    ("5F4tQyWrhfGVcNhoqeiNsR6KjD4wMZ2kfhLj4oHYuyHbZAc3", "OTF"),
+    ("5CXRfP2ekFhe62r7q3vppRajJmGhTi7vwvb2yr79jveZ282w", "Rizzo validator"),
+    ("5HBVrFGy6oYhhh71m9fFGYD7zbKyAeHnWN8i8s9fJTBMCtEE", "our validator"),
+]
+
+
+def create_trusted_validators(apps, schema_editor):
+    TrustedValidator = apps.get_model("core", "TrustedValidator")
+    TrustedValidator.objects.bulk_create(
+        [TrustedValidator(ss58_address=ss58_address, name=name) for ss58_address, name in TRUSTED_VALIDATORS]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0032_executorspecs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrustedValidator",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("ss58_address", models.CharField(max_length=48, unique=True)),
+                ("name", models.CharField(blank=True, default="", max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_trusted_validators, reverse_code=migrations.RunPython.noop),
+    ]
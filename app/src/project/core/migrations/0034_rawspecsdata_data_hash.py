@@ -0,0 +1,53 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+# same as `RawSpecsData.hash_data`
+def hash_data(data: dict) -> str:
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode(), digest_size=32).hexdigest()
+
+
+def backfill_data_hashes(apps, schema_editor):
+    """Hash raw specs in batches, each committed separately, so that an interrupted backfill can be resumed"""
+    RawSpecsData = apps.get_model("core", "RawSpecsData")
+    while batch := list(RawSpecsData.objects.filter(data_hash__isnull=True).order_by("pk")[:BATCH_SIZE]):
+        for raw_specs in batch:
+            raw_specs.data_hash = hash_data(raw_specs.data)
+        RawSpecsData.objects.bulk_update(batch, ["data_hash"])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("core", "0033_trustedvalidator"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rawspecsdata",
+            name="data_hash",
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_data_hashes, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="rawspecsdata",
+            name="data_hash",
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.RemoveConstraint(
+            model_name="rawspecsdata",
+            name="unique_raw_specs_data",
+        ),
+        migrations.RemoveIndex(
+            model_name="rawspecsdata",
+            name="idx_raw_spec_data",
+        ),
+    ]
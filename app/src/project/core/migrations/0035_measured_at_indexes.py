@@ -0,0 +1,28 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the tables are big and written to all the time, so the indexes are built without locking them
+    atomic = False
+
+    dependencies = [
+        ("core", "0034_rawspecsdata_data_hash"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="executorspecssnapshot",
+            index=models.Index(fields=["measured_at"], name="idx_specs_snapshot_measured_at"),
+        ),
+        AddIndexConcurrently(
+            model_name="rawspecssnapshot",
+            index=models.Index(fields=["measured_at"], name="idx_raw_spec_measured_at"),
+        ),
+        AddIndexConcurrently(
+            model_name="hardwarestate",
+            index=models.Index(fields=["measured_at"], name="idx_hardware_state_measured_at"),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.13 on 2024-07-16 09:41
+
+from django.db import migrations
+
+# Creates a monthly partition of the receipts table; `month` has to be the first day of the month.
+# Receipts of the month which landed in the default partition before (e.g. ones dated far ahead by a miner)
+# are moved to the new partition, as a partition cannot be created while the default one has rows in its range.
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION core_create_job_receipt_partition(month date) RETURNS void AS $$
+DECLARE
+    partition_name text := 'core_jobreceipt_' || replace(left(month::text, 7), '-', '_');
+    partition_start text := month::text || ' 00:00:00+00';
+    partition_end text := (month + interval '1 month')::date::text || ' 00:00:00+00';
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE core_jobreceipt INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS ('
+        '    DELETE FROM core_jobreceipt_default WHERE time_started >= %L AND time_started < %L RETURNING *'
+        ') INSERT INTO %I SELECT * FROM moved',
+        partition_start,
+        partition_end,
+        partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE core_jobreceipt ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        partition_start,
+        partition_end
+    );
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# as in 0030_partition_jobreceipt_hourlyjobreceiptstats
+PREVIOUS_CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION core_create_job_receipt_partition(month date) RETURNS void AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF core_jobreceipt FOR VALUES FROM (%L) TO (%L)',
+        'core_jobreceipt_' || replace(left(month::text, 7), '-', '_'),
+        month::text || ' 00:00:00+00',
+        (month + interval '1 month')::date::text || ' 00:00:00+00'
+    );
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0035_measured_at_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_PARTITION_FUNCTION, reverse_sql=PREVIOUS_CREATE_PARTITION_FUNCTION),
+    ]
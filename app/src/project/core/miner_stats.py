@@ -0,0 +1,76 @@
+"""
+Leaderboard of miners.
+
+Percentiles cannot be combined from per-hour percentiles, so `HourlyJobReceiptStats` keeps a histogram of
+times taken per hour, and the stats of a window are computed by adding up the hours it spans. The result is
+small (a row per miner and executor class) and is stored in `MinerStats`, which is what the API serves.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+import structlog
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils.timezone import now
+
+from .models import HourlyJobReceiptStats, MinerStats
+
+log = structlog.get_logger(__name__)
+
+
+def get_time_took_histograms(since: datetime) -> dict[tuple[str, str], dict[str, int]]:
+    """Return histograms of times taken per (miner hotkey, executor class), added up since given hour"""
+    table = connection.ops.quote_name(HourlyJobReceiptStats._meta.db_table)
+    histograms = defaultdict(dict)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT miner_hotkey, executor_class, histogram.bucket, sum(histogram.count::bigint)
+            FROM {table}, jsonb_each_text(time_took_histogram) AS histogram (bucket, count)
+            WHERE hour >= %s
+            GROUP BY 1, 2, 3
+            """,  # noqa: S608
+            [since],
+        )
+        for miner_hotkey, executor_class, bucket, count in cursor.fetchall():
+            histograms[miner_hotkey, executor_class][bucket] = int(count)
+    return histograms
+
+
+def compute_miner_stats(window: str, since: datetime, updated_at: datetime) -> list[MinerStats]:
+    histograms = get_time_took_histograms(since)
+    totals = (
+        HourlyJobReceiptStats.objects.filter(hour__gte=since)
+        .values("miner_hotkey", "executor_class")
+        .annotate(total_count=Sum("count"), total_score=Sum("total_score"))
+    )
+    stats = []
+    for total in totals:
+        histogram = histograms.get((total["miner_hotkey"], total["executor_class"]), {})
+        stats.append(
+            MinerStats(
+                window=window,
+                miner_hotkey=total["miner_hotkey"],
+                executor_class=total["executor_class"],
+                count=total["total_count"],
+                time_took_p50_us=HourlyJobReceiptStats.estimate_time_took_percentile(histogram, 50) or 0,
+                time_took_p95_us=HourlyJobReceiptStats.estimate_time_took_percentile(histogram, 95) or 0,
+                average_score=total["total_score"] / total["total_count"],
+                updated_at=updated_at,
+            )
+        )
+    return stats
+
+
+def refresh_miner_stats() -> None:
+    updated_at = now()
+    current_hour = updated_at.replace(minute=0, second=0, microsecond=0)
+    for window, duration in settings.MINER_STATS_WINDOWS.items():
+        # the current hour is part of every window, so e.g. "1h" covers between one and two hours
+        stats = compute_miner_stats(window, since=current_hour - duration, updated_at=updated_at)
+        with transaction.atomic():
+            MinerStats.objects.filter(window=window).delete()
+            MinerStats.objects.bulk_create(stats)
+        log.info("miner stats refreshed", window=window, num_miners=len(stats))
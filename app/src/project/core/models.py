@@ -1,7 +1,12 @@
+import asyncio
+import hashlib
+import json
 import shlex
+from collections import defaultdict
 from collections.abc import Callable
 from contextlib import suppress
-from datetime import UTC, datetime, timedelta
+from datetime import datetime, timedelta
+from functools import partial
 from math import ceil
 from operator import attrgetter
 from typing import ClassVar
@@ -10,18 +15,20 @@ from uuid import uuid4
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from compute_horde.executor_class import DEFAULT_EXECUTOR_CLASS
+from constance import config
 from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.db import models, transaction
-from django.db.models import CheckConstraint, F, Max, OuterRef, Prefetch, Q, QuerySet, Subquery, UniqueConstraint
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connection, models, transaction
+from django.db.models import CheckConstraint, F, Max, Prefetch, Q, QuerySet, UniqueConstraint
 from django.urls import reverse
 from django.utils.timezone import now
 from structlog import get_logger
 from structlog.contextvars import bound_contextvars
-from tenacity import retry, retry_if_exception_type, stop_after_delay, wait_fixed
 
 from .schemas import JobRequest, JobStatusMetadata
 from .utils import create_signed_download_url, create_signed_upload_url
+from .validator_registry import get_validator_registry
 
 log = get_logger(__name__)
 
@@ -30,10 +37,6 @@ class MutuallyExclusiveFieldsError(ValidationError):
     pass
 
 
-class JobNotFinishedError(Exception):
-    pass
-
-
 class SignatureInfo(models.Model):
     """
     Model for storing signed requests issued through Facilitator SDK.
@@ -86,8 +89,37 @@ class Validator(AbstractNode):
     runner_version = models.CharField(max_length=255, blank=True, default="")
 
 
+class MinerQuerySet(AbstractNodeQuerySet):
+    def available(self) -> QuerySet:
+        """Active miners which are not busy executing a job"""
+        return self.filter(Q(busy_until__isnull=True) | Q(busy_until__lte=now()), is_active=True)
+
+    def claim(self, assigned_at: datetime) -> int:
+        """Mark miners as busy with a job assigned at given time, unless they were assigned a newer job already"""
+        return self.filter(Q(last_assigned_at__isnull=True) | Q(last_assigned_at__lte=assigned_at)).update(
+            busy_until=assigned_at + Job.JOB_TIMEOUT,
+            last_assigned_at=assigned_at,
+        )
+
+
 class Miner(AbstractNode):
-    pass
+    busy_until = models.DateTimeField(
+        null=True, blank=True, help_text="miner is considered busy with its last job until this time"
+    )
+    last_assigned_at = models.DateTimeField(
+        null=True, blank=True, help_text="creation time of the last job assigned to this miner"
+    )
+
+    objects = MinerQuerySet.as_manager()
+
+    class Meta(AbstractNode.Meta):
+        indexes = [
+            models.Index(
+                F("last_assigned_at").asc(nulls_first=True),
+                condition=Q(is_active=True),
+                name="idx_miner_last_assigned_at",
+            ),
+        ]
 
 
 class UserPreferences(models.Model):
@@ -146,11 +178,15 @@ class JobQuerySet(models.QuerySet):
 
 class Job(models.Model):
     JOB_TIMEOUT: ClassVar = timedelta(minutes=5, seconds=30)
+    STDOUT_EXCERPT_LENGTH: ClassVar = 10_000
+    # denormalized copy of the most recent JobStatus, maintained by `JobStatus.save()`
+    LAST_STATUS_FIELDS: ClassVar = ("last_status", "last_status_at", "last_stdout")
 
     uuid = models.UUIDField(primary_key=True, editable=False, blank=True)
     user = models.ForeignKey("auth.User", on_delete=models.PROTECT, related_name="jobs")
-    validator = models.ForeignKey(Validator, blank=True, on_delete=models.PROTECT, related_name="jobs")
-    miner = models.ForeignKey(Miner, blank=True, on_delete=models.PROTECT, related_name="jobs")
+    # both are empty until a pending job is dispatched, see `config.ASYNC_JOB_DISPATCH`
+    validator = models.ForeignKey(Validator, blank=True, null=True, on_delete=models.PROTECT, related_name="jobs")
+    miner = models.ForeignKey(Miner, blank=True, null=True, on_delete=models.PROTECT, related_name="jobs")
     created_at = models.DateTimeField(default=now)
 
     executor_class = models.CharField(
@@ -163,11 +199,13 @@ class Job(models.Model):
     use_gpu = models.BooleanField(default=False, help_text="Whether to use GPU for the job")
     input_url = models.URLField(blank=True, help_text="URL to the input data source", max_length=1000)
     output_upload_url = models.TextField(blank=True, help_text="URL for uploading output")
-    output_download_url = models.TextField(blank=True, help_text="URL for retrieving output")
-    output_download_url_expires_at = models.DateTimeField(blank=True)
 
     tag = models.CharField(max_length=255, blank=True, default="", help_text="may be used to group jobs")
 
+    last_status = models.SmallIntegerField(null=True, blank=True, help_text="status of the most recent JobStatus")
+    last_status_at = models.DateTimeField(null=True, blank=True, help_text="time of the most recent JobStatus")
+    last_stdout = models.TextField(blank=True, default="", help_text="stdout excerpt of the most recent JobStatus")
+
     objects = JobQuerySet.as_manager()
 
     class Meta:
@@ -179,6 +217,12 @@ class Job(models.Model):
         ]
         indexes = [
             models.Index(fields=["validator", "-created_at"], name="idx_job_validator_created_at"),
+            models.Index(fields=["user", "-created_at"], name="idx_job_user_created_at"),
+            models.Index(
+                fields=["created_at", "uuid"],
+                name="idx_job_pending_created_at",
+                condition=Q(last_status=-3),  # JobStatus.Status.PENDING
+            ),
         ]
 
     @property
@@ -189,118 +233,236 @@ class Job(models.Model):
     def save(self, *args, **kwargs) -> None:
         is_new = self.pk is None
 
+        # the in-memory copy of the denormalized status may be stale - never write it back
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LAST_STATUS_FIELDS
+            ]
+
         self.uuid = self.uuid or uuid4()
         self.output_upload_url = self.output_upload_url or create_signed_upload_url(self.filename)
-        if self.is_download_url_expired():
-            self.reset_download_url()
 
-        # if there is no validator selected -> we need a transaction for locking
-        # active validators during selection process
+        # if there is no miner selected -> we need a transaction for locking
+        # the selected miner until it's claimed by this job
         with transaction.atomic(), bound_contextvars(job=self):
-            self.validator = getattr(self, "validator", None) or self.select_validator()
-            self.miner = getattr(self, "miner", None) or self.select_miner()
+            if is_new and config.ASYNC_JOB_DISPATCH:
+                # nodes are selected and the job is sent by `tasks.dispatch_pending_jobs`
+                super().save(*args, **kwargs)
+                JobStatus.objects.create(job=self, status=JobStatus.Status.PENDING)
+                transaction.on_commit(self.schedule_dispatch)
+                return
+
+            self.assign_nodes()
             super().save(*args, **kwargs)
             if is_new:
+                self.claim_nodes()
                 self.send_to_validator()
 
+    @staticmethod
+    def schedule_dispatch() -> None:
+        from .tasks import dispatch_pending_jobs
+
+        dispatch_pending_jobs.delay()
+
+    def assign_nodes(self) -> None:
+        """Select a validator and a miner for the job, unless they are already set"""
+
+        self.validator = getattr(self, "validator", None) or self.select_validator()
+        self.miner = getattr(self, "miner", None) or self.select_miner()
+
+    def claim_nodes(self) -> None:
+        """Mark the assigned nodes as busy with this job"""
+
+        self.claim_miner()
+        # the registry is not transactional, so it only learns about the assignment once it is committed
+        transaction.on_commit(partial(get_validator_registry().mark_job_assigned, self.validator_id, self.created_at))
+
+    def release_nodes(self) -> None:
+        """Undo `claim_nodes` of a job which could not be sent, so that it is assigned nodes again"""
+
+        Miner.objects.filter(pk=self.miner_id, last_assigned_at=self.created_at).update(busy_until=None)
+        Job.objects.filter(pk=self.pk).update(validator=None, miner=None)
+        self.validator = self.miner = None
+
     def select_validator(self) -> Validator:
         """
         Select a validator for the job.
 
-        Currently the one with least recent job request is selected.
-        This method is expected to be run within a transaction.
+        Currently the connected one with least recent job request is selected.
         """
 
-        # select validators which are currently connected via WS
-        validator_ids: set[int] = set(
-            Channel.objects.filter(last_heartbeat__gte=now() - timedelta(minutes=3)).values_list(
-                "validator_id", flat=True
-            )
-        )
+        validator_ids = self.get_validator_candidates(self.user)
+        log.debug("choosing from validators", validator_ids=validator_ids)
+        validator_id = get_validator_registry().select_least_recently_assigned(validator_ids)
+        if validator_id is None:
+            raise Validator.DoesNotExist
+        validator = Validator.objects.get(pk=validator_id)
+
+        log.debug("selected validator", validator=validator)
+        return validator
+
+    @staticmethod
+    def get_validator_candidates(user) -> set[int]:
+        """IDs of connected validators which may be selected for jobs of given user"""
+
+        validator_ids = get_validator_registry().connected_validator_ids()
         log.debug("connected validators", validator_ids=validator_ids)
 
         # use user's preferences to select specific validators
         with suppress(UserPreferences.DoesNotExist):
-            exclusive_preference = self.user.preferences.exclusive
-            if preferred_validator_ids := set(self.user.preferences.validators.values_list("id", flat=True)):
+            exclusive_preference = user.preferences.exclusive
+            if preferred_validator_ids := set(user.preferences.validators.values_list("id", flat=True)):
                 # we either select one of preferred validators, but if none of them is available - select any
-                log.debug("preferred validators", user=self.user, preferred_validators=preferred_validator_ids)
+                log.debug("preferred validators", user=user, preferred_validators=preferred_validator_ids)
                 available_preferred_validator_ids = validator_ids & preferred_validator_ids
                 if available_preferred_validator_ids or exclusive_preference:
                     validator_ids = available_preferred_validator_ids
 
-        log.debug("choosing from validators", validator_ids=validator_ids)
-        try:
-            validator = (
-                Validator.objects.filter(
-                    pk__in=validator_ids,
-                )
-                .with_last_job_time()
-                .order_by(F("last_job_time").asc(nulls_first=True))
-            )[0]
-        except IndexError as exc:
-            raise Validator.DoesNotExist from exc
-
-        log.debug("selected validator", validator=validator)
-        return validator
+        return validator_ids
 
     def select_miner(self) -> Miner:
         """
         Select a miner for the job.
 
-        Currently, the one with the least number of jobs being executed is selected.
-        This method is expected to be called from within a transaction.
+        Currently, the available miner which was assigned a job least recently is selected.
+        Its row is locked (rows locked by concurrent selections are skipped), so this method
+        is expected to be called from within a transaction.
+        """
+
+        miners = self.select_miners(self.user, 1)
+        if not miners:
+            raise Miner.DoesNotExist
+
+        log.debug("selected miner", miner=miners[0])
+        return miners[0]
+
+    @staticmethod
+    def select_miners(user, count: int) -> list[Miner]:
+        """
+        Select up to `count` available miners for jobs of given user, least recently assigned first.
+
+        Rows of selected miners are locked, see `select_miner`.
         """
 
-        last_jobs_subquery = Subquery(
-            Job.objects.filter(miner=OuterRef("miner_id")).order_by("-created_at").values_list("pk", flat=True)[:10]
-        )
         miners = (
-            Miner.objects.select_for_update()
-            .filter(is_active=True)
-            .prefetch_related(
-                Prefetch(
-                    "jobs",
-                    queryset=(
-                        Job.objects.filter(pk__in=last_jobs_subquery)
-                        .order_by("-created_at")
-                        .prefetch_related(Prefetch("statuses", queryset=JobStatus.objects.order_by("-created_at")))
-                    ),
-                )
-            )
+            Miner.objects.available()
+            .order_by(F("last_assigned_at").asc(nulls_first=True))
+            .select_for_update(skip_locked=True)
         )
 
-        # select miners which don't have active jobs
-        miners = [miner for miner in miners if all(job.is_completed() for job in miner.jobs.all())]
-
         # use user's preferences to select specific miners
+        selected = []
         with suppress(UserPreferences.DoesNotExist):
-            exclusive_preference = self.user.preferences.exclusive
-            if preferred_miners := self.user.preferences.miners.all():
-                # we either select one of preferred miners, but if none of them is available - select any
-                available_preferred_miners = [miner for miner in miners if miner in preferred_miners]
-                if available_preferred_miners or exclusive_preference:
-                    miners = available_preferred_miners
+            exclusive_preference = user.preferences.exclusive
+            if preferred_miner_ids := set(user.preferences.miners.values_list("id", flat=True)):
+                # we either select preferred miners, but if there are not enough of them available - select any
+                selected = list(miners.filter(pk__in=preferred_miner_ids)[:count])
+                if exclusive_preference:
+                    return selected
 
-        if not miners:
-            raise Miner.DoesNotExist
+        if len(selected) < count:
+            selected += miners.exclude(pk__in=[miner.pk for miner in selected])[: count - len(selected)]
+        return selected
 
-        # sort miners by last job time
-        miners.sort(
-            key=lambda miner: jobs[0].created_at if (jobs := miner.jobs.all()) else datetime.min.replace(tzinfo=UTC)
-        )
-        return miners[0]
+    def claim_miner(self) -> None:
+        """Mark the miner as busy with this job until it finishes or times out"""
 
-    def is_download_url_expired(self) -> bool:
-        return (
-            not self.output_download_url
-            or not self.output_download_url_expires_at
-            or now() > self.output_download_url_expires_at
+        Miner.objects.filter(pk=self.miner_id).claim(self.created_at)
+
+    @classmethod
+    def submit_many(cls, user, jobs: list["Job"]) -> list["Job | ValidationError | ObjectDoesNotExist"]:
+        """
+        Create and send many jobs of a single user at once.
+
+        Nodes are assigned to all jobs in a single pass and jobs with their statuses are inserted in bulk.
+        Return, for each of `jobs`, either the created job or the reason why it could not be created.
+        """
+
+        results: list[Job | ValidationError | ObjectDoesNotExist] = []
+        created_at = now()
+        for job in jobs:
+            job.user = user
+            job.uuid = job.uuid or uuid4()
+            job.created_at = created_at
+            try:
+                job.clean()
+            except ValidationError as exc:
+                results.append(exc)
+                continue
+            job.output_upload_url = job.output_upload_url or create_signed_upload_url(job.filename)
+            results.append(job)
+
+        positions = [position for position, result in enumerate(results) if isinstance(result, Job)]
+        if not positions:
+            return results
+
+        with transaction.atomic(), bound_contextvars(user=user):
+            if config.ASYNC_JOB_DISPATCH:
+                cls.bulk_create_with_status([results[position] for position in positions], JobStatus.Status.PENDING)
+                transaction.on_commit(cls.schedule_dispatch)
+                return results
+
+            registry = get_validator_registry()
+            validator_ids = registry.sort_least_recently_assigned(cls.get_validator_candidates(user))
+            validators = Validator.objects.in_bulk(validator_ids)
+            validator_ids = [validator_id for validator_id in validator_ids if validator_id in validators]
+            miners = iter(cls.select_miners(user, len(positions)))
+
+            for i, position in enumerate(positions):
+                if not validator_ids:
+                    results[position] = Validator.DoesNotExist()
+                elif (miner := next(miners, None)) is None:
+                    results[position] = Miner.DoesNotExist()
+                else:
+                    # validators take turns, least recently assigned first
+                    results[position].validator = validators[validator_ids[i % len(validator_ids)]]
+                    results[position].miner = miner
+
+            assigned_jobs = [job for job in results if isinstance(job, Job)]
+            if not assigned_jobs:
+                return results
+
+            cls.bulk_create_with_status(assigned_jobs, JobStatus.Status.SENT)
+            Miner.objects.filter(pk__in=[job.miner_id for job in assigned_jobs]).claim(created_at)
+            for validator_id in {job.validator_id for job in assigned_jobs}:
+                transaction.on_commit(partial(registry.mark_job_assigned, validator_id, created_at))
+            # robust, so that the committed jobs are returned even if sending them fails unexpectedly
+            transaction.on_commit(partial(cls.send_submitted_jobs, assigned_jobs), robust=True)
+
+        return results
+
+    @classmethod
+    def bulk_create_with_status(cls, jobs: list["Job"], status: "JobStatus.Status") -> None:
+        """Insert new jobs along with their first status"""
+
+        status_at = now()
+        for job in jobs:
+            job.last_status = status
+            job.last_status_at = status_at
+        cls.objects.bulk_create(jobs)
+        statuses = JobStatus.objects.bulk_create(
+            [JobStatus(job=job, status=status, created_at=status_at) for job in jobs]
         )
+        # `bulk_create` bypasses `JobStatus.save`, so the statuses are published here
+        transaction.on_commit(partial(JobStatus.publish_many, statuses))
 
-    def reset_download_url(self) -> None:
-        self.output_download_url = create_signed_download_url(self.filename)
-        self.output_download_url_expires_at = now() + settings.DOWNLOAD_PRESIGNED_URL_LIFETIME
+    @property
+    def output_download_url(self) -> str:
+        """
+        Signed URL for downloading the job's output.
+
+        URLs are generated on demand and shared for `settings.DOWNLOAD_URL_CACHE_TIMEOUT`, which is much shorter
+        than `settings.DOWNLOAD_PRESIGNED_URL_LIFETIME`, so a returned URL is always valid for a while.
+        """
+
+        assert self.uuid
+        return cache.get_or_set(
+            f"job_download_url:{self.uuid}",
+            lambda: create_signed_download_url(self.filename),
+            timeout=settings.DOWNLOAD_URL_CACHE_TIMEOUT.total_seconds(),
+        )
 
     def clean(self, *args, **kwargs) -> None:
         if (self.docker_image == "") == (self.raw_script == ""):
@@ -322,8 +484,13 @@ class Job(models.Model):
     def status(self) -> "JobStatus":
         return self.statuses_ordered[-1]
 
+    def get_last_status_display(self) -> str:
+        if self.last_status is None:
+            return ""
+        return JobStatus.Status(self.last_status).label
+
     def is_completed(self) -> bool:
-        return self.status.status in JobStatus.FINAL_STATUS_VALUES or self.created_at < now() - self.JOB_TIMEOUT
+        return self.last_status in JobStatus.FINAL_STATUS_VALUES or self.created_at < now() - self.JOB_TIMEOUT
 
     @property
     def elapsed(self) -> timedelta:
@@ -346,8 +513,12 @@ class Job(models.Model):
         )
 
     def send_to_validator(self) -> None:
-        channels_names = Channel.objects.filter(validator=self.validator).values_list("name", flat=True)
-        log.debug("sending job to validator", job=self, validator=self.validator, channels_names=channels_names)
+        self.send_job_request()
+        JobStatus.objects.create(job=self, status=JobStatus.Status.SENT)
+
+    def send_job_request(self) -> None:
+        channels_names = Channel.objects.filter(validator=self.validator_id).values_list("name", flat=True)
+        log.debug("sending job to validator", job=self, validator_id=self.validator_id, channels_names=channels_names)
         channel_layer = get_channel_layer()
 
         send = async_to_sync(channel_layer.send)
@@ -355,26 +526,97 @@ class Job(models.Model):
         for channel_name in channels_names:
             send(channel_name, job_request)
 
-        JobStatus.objects.create(job=self, status=JobStatus.Status.SENT)
+    @staticmethod
+    def send_job_requests(jobs: list["Job"]) -> list["Job"]:
+        """
+        Send job requests to all channels of validators assigned to `jobs`, grouped by validator.
 
-    @retry(
-        stop=stop_after_delay(JOB_TIMEOUT),
-        wait=wait_fixed(3),
-        retry=retry_if_exception_type(JobNotFinishedError),
-        reraise=True,
-    )
-    def wait_completed(self: str, on_check: Callable = lambda job: None) -> "JobStatus.Status":
-        job = self.__class__.objects.prefetch_related("statuses").get(uuid=self.uuid)
-        on_check(job)
-        if job.is_completed():
-            return job.status
+        Unlike `send_job_request`, errors do not stop sending the remaining jobs; they are logged
+        and the jobs whose requests could not be sent are returned.
+        """
 
-        log.debug("Still waiting for results from job %s", self.uuid)
-        raise JobNotFinishedError
+        channels_names = defaultdict(list)
+        for validator_id, channel_name in Channel.objects.filter(
+            validator__in={job.validator_id for job in jobs}
+        ).values_list("validator_id", "name"):
+            channels_names[validator_id].append(channel_name)
+
+        messages = []
+        for job in sorted(jobs, key=attrgetter("validator_id")):
+            log.debug("sending job to validator", job=job, validator_id=job.validator_id)
+            job_request = job.as_job_request().dict()
+            messages.append((job, [(channel_name, job_request) for channel_name in channels_names[job.validator_id]]))
+
+        channel_layer = get_channel_layer()
+
+        async def send_all() -> list[Job]:
+            unsent = []
+            for job, job_messages in messages:
+                try:
+                    for channel_name, job_request in job_messages:
+                        await channel_layer.send(channel_name, job_request)
+                except Exception as exc:
+                    log.warning("could not send job to validator", job_id=job.pk, exc=exc)
+                    unsent.append(job)
+            return unsent
+
+        return async_to_sync(send_all)()
+
+    @classmethod
+    def send_submitted_jobs(cls, jobs: list["Job"]) -> None:
+        """Send jobs committed as sent by `submit_many`, failing the ones which could not be sent after all"""
+
+        for job in cls.send_job_requests(jobs):
+            JobStatus.objects.create(
+                job=job, status=JobStatus.Status.FAILED, metadata={"comment": "Could not send job"}
+            )
+
+    @staticmethod
+    def get_status_group_name(uuid) -> str:
+        """Channel layer group receiving `job.statuses` messages of given job"""
+        return f"job_status.{uuid}"
+
+    @staticmethod
+    def get_user_status_group_name(user_id: int) -> str:
+        """Channel layer group receiving `job.statuses` messages of all jobs of given user"""
+        return f"user_job_status.{user_id}"
+
+    @property
+    def status_group_name(self) -> str:
+        return self.get_status_group_name(self.uuid)
+
+    def wait_completed(self, on_check: Callable = lambda job: None) -> "JobStatus":
+        return async_to_sync(self.await_completed)(on_check)
+
+    async def await_completed(self, on_check: Callable = lambda job: None) -> "JobStatus":
+        """
+        Wait until the job is completed (or times out) and return its last status.
+
+        Instead of polling, the job is re-checked whenever a new status is published to its channel layer group.
+        """
+
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(self.status_group_name, channel_name)
+        try:
+            while True:
+                # (re)check after subscribing, so that no status update is missed
+                job = await self.__class__.objects.prefetch_related("statuses").aget(uuid=self.uuid)
+                on_check(job)
+                if job.is_completed():
+                    return job.status
+
+                log.debug("Still waiting for results from job %s", self.uuid)
+                timeout = (job.created_at + self.JOB_TIMEOUT - now()).total_seconds()
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(channel_layer.receive(channel_name), timeout=max(timeout, 0))
+        finally:
+            await channel_layer.group_discard(self.status_group_name, channel_name)
 
 
 class JobStatus(models.Model):
     class Status(models.IntegerChoices):
+        PENDING = -3
         FAILED = -2
         REJECTED = -1
         SENT = 0
@@ -401,11 +643,85 @@ class JobStatus(models.Model):
     def __str__(self) -> str:
         return self.get_status_display()
 
+    def save(self, *args, **kwargs) -> None:
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                self.update_job_last_status()
+                if self.status in self.FINAL_STATUS_VALUES:
+                    self.release_miner()
+                transaction.on_commit(self.publish)
+
+    def publish(self) -> None:
+        """Notify subscribers of the job's and its owner's channel layer groups about this status"""
+        self.publish_many([self])
+
+    @staticmethod
+    def publish_many(statuses: list["JobStatus"]) -> None:
+        """
+        Notify subscribers of the jobs' and their owners' channel layer groups about given statuses.
+
+        Every group gets a single `job.statuses` message with events of all statuses published to it.
+        """
+
+        group_events = defaultdict(list)
+        for status in statuses:
+            event = {
+                "uuid": str(status.job_id),
+                "status": int(status.status),
+                "created_at": status.created_at.isoformat(),
+                "tag": status.job.tag,
+            }
+            group_events[Job.get_status_group_name(status.job_id)].append(event)
+            group_events[Job.get_user_status_group_name(status.job.user_id)].append(event)
+        channel_layer = get_channel_layer()
+
+        async def send():
+            for group, events in group_events.items():
+                await channel_layer.group_send(group, {"type": "job.statuses", "events": events})
+
+        try:
+            async_to_sync(send)()
+        except Exception as exc:  # a lost notification only delays waiters until the job times out
+            log.warning("could not publish job statuses", num_statuses=len(statuses), exc=exc)
+
+    def update_job_last_status(self) -> None:
+        """Copy this status into the job's `last_status*` columns, unless a newer status is already there"""
+
+        values = {
+            "last_status": self.status,
+            "last_status_at": self.created_at,
+            "last_stdout": self.stdout[: Job.STDOUT_EXCERPT_LENGTH],
+        }
+        Job.objects.filter(
+            Q(last_status_at__isnull=True) | Q(last_status_at__lte=self.created_at),
+            pk=self.job_id,
+        ).update(**values)
+
+        # keep the job instance we were created with in sync as well
+        if JobStatus.job.is_cached(self) and (
+            self.job.last_status_at is None or self.job.last_status_at <= self.created_at
+        ):
+            for name, value in values.items():
+                setattr(self.job, name, value)
+
+    def release_miner(self) -> None:
+        """Make the miner available again, unless it was assigned another job in the meantime"""
+
+        Miner.objects.filter(jobs=self.job_id, last_assigned_at=F("jobs__created_at")).update(busy_until=None)
+
     @property
     def meta(self) -> JobStatusMetadata | None:
         if self.metadata:
             return JobStatusMetadata.parse_obj(self.metadata)
 
+    @property
+    def stdout(self) -> str:
+        # read raw metadata - it is not validated on write, so parsing it may fail
+        miner_response = (self.metadata or {}).get("miner_response") or {}
+        return miner_response.get("docker_process_stdout") or ""
+
 
 class JobFeedback(models.Model):
     """
@@ -477,6 +793,12 @@ class HardwareState(models.Model):
     state = models.JSONField()
     measured_at = models.DateTimeField(default=now)
 
+    class Meta:
+        indexes = [
+            # states are archived oldest first (`core.archive`)
+            models.Index(fields=["measured_at"], name="idx_hardware_state_measured_at"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.measured_at}"
 
@@ -510,14 +832,19 @@ class CpuSpecs(models.Model):
 
 class RawSpecsData(models.Model):
     data = models.JSONField()
+    # identifies `data`, so that whole documents do not need to be compared (nor indexed) to find them
+    data_hash = models.CharField(max_length=64, unique=True)
 
-    class Meta:
-        constraints = [
-            UniqueConstraint(fields=["data"], name="unique_raw_specs_data"),
-        ]
-        indexes = [
-            models.Index(fields=["data"], name="idx_raw_spec_data"),
-        ]
+    @staticmethod
+    def hash_data(data: dict) -> str:
+        """Return blake2b digest of canonical JSON of data (keys sorted, no whitespace)"""
+        canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.blake2b(canonical.encode(), digest_size=32).hexdigest()
+
+    def save(self, *args, **kwargs) -> None:
+        if not self.data_hash:
+            self.data_hash = self.hash_data(self.data)
+        super().save(*args, **kwargs)
 
 
 class ExecutorSpecsSnapshot(models.Model):
@@ -533,6 +860,12 @@ class ExecutorSpecsSnapshot(models.Model):
             f"raw spec for miner: {self.miner.ss58_address}, batch_id {self.batch_id} measured_at: {self.measured_at}"
         )
 
+    class Meta:
+        indexes = [
+            # snapshots are archived oldest first (`core.archive`)
+            models.Index(fields=["measured_at"], name="idx_specs_snapshot_measured_at"),
+        ]
+
 
 class ParsedSpecsData(models.Model):
     id = models.OneToOneField(RawSpecsData, primary_key=True, on_delete=models.PROTECT)
@@ -576,6 +909,65 @@ class GpuSpecs(models.Model):
         ]
 
 
+class TrustedValidator(models.Model):
+    """
+    Validator whose reports of executor specs are stored in `ExecutorSpecs`.
+
+    Takes effect for snapshots received from now on; rows already in `ExecutorSpecs` are kept until pruned.
+    """
+
+    ss58_address = models.CharField(max_length=48, unique=True)
+    name = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.ss58_address})" if self.name else self.ss58_address
+
+
+class ExecutorSpecs(models.Model):
+    """
+    Specs of executors as reported to `TrustedValidator`s, a row per GPU model.
+
+    Denormalized from `ExecutorSpecsSnapshot` and related specs tables for querying in analytics, under
+    the name of the materialized view it replaced. Rows are added by `save_machine_specs` as snapshots come in
+    and removed by `prune_specs` once older than `settings.SPECS_RETENTION`.
+    """
+
+    snapshot = models.ForeignKey(ExecutorSpecsSnapshot, on_delete=models.CASCADE, related_name="+")
+    gpu_specs = models.ForeignKey(GpuSpecs, on_delete=models.CASCADE, related_name="+")
+    measured_at = models.DateTimeField()
+    miner_hotkey = models.CharField(max_length=255)
+    batch_id = models.UUIDField(null=True)
+    os = models.CharField(max_length=255, null=True)
+    virtualization = models.CharField(max_length=255, null=True)
+    total_hdd = models.PositiveIntegerField(null=True, help_text="in GB")
+    total_ram = models.PositiveIntegerField(null=True, help_text="in GB")
+    cpu_count = models.PositiveIntegerField()
+    cpu_model = models.CharField(max_length=255)
+    gpu = models.ForeignKey(GPU, on_delete=models.CASCADE, related_name="+")
+    vram = models.PositiveIntegerField(help_text="in MB")
+    cuda = models.CharField(max_length=255)
+    driver = models.CharField(max_length=255)
+    gpu_count = models.PositiveIntegerField()
+    graphics_speed = models.PositiveIntegerField(help_text="in MHz")
+    memory_speed = models.PositiveIntegerField(help_text="in MHz")
+    power_limit = models.FloatField()
+
+    class Meta:
+        db_table = "specs"
+        constraints = [
+            UniqueConstraint(fields=["snapshot", "gpu_specs"], name="unique_specs_snapshot_gpu_specs"),
+        ]
+        indexes = [
+            models.Index(fields=["miner_hotkey", "batch_id", "measured_at"], name="specs_miner_idx"),
+            models.Index(fields=["measured_at"], name="specs_measured_at_idx"),
+        ]
+        verbose_name_plural = "executor specs"
+
+    def __str__(self) -> str:
+        return f"specs of miner: {self.miner_hotkey} measured_at: {self.measured_at}"
+
+
 # TO BE DEPRECATED
 class RawSpecsSnapshot(models.Model):
     miner = models.ForeignKey(Miner, on_delete=models.CASCADE, related_name="raw_specs")
@@ -592,10 +984,130 @@ class RawSpecsSnapshot(models.Model):
         ]
         indexes = [
             models.Index(fields=["miner", "measured_at"], name="idx_raw_spec_miner_measured_at"),
+            # snapshots are archived oldest first (`core.archive`)
+            models.Index(fields=["measured_at"], name="idx_raw_spec_measured_at"),
         ]
 
 
+class JobReceiptQuerySet(models.QuerySet):
+    def bulk_create_with_stats(self, receipts: list["JobReceipt"]) -> int:
+        """
+        Store receipts, skipping already stored ones, and add the stored ones to `HourlyJobReceiptStats`.
+
+        Both happen in a single statement, so the stats count every receipt exactly once.
+        Return the number of receipts stored.
+        """
+        if not receipts:
+            return 0
+
+        receipts_table = connection.ops.quote_name(JobReceipt._meta.db_table)
+        stats_table = connection.ops.quote_name(HourlyJobReceiptStats._meta.db_table)
+        values = ", ".join(
+            ["(%s::uuid, %s, %s, %s::timestamptz, %s::bigint, %s, %s, %s::double precision)"] * len(receipts)
+        )
+        params = [
+            param
+            for receipt in receipts
+            for param in (
+                receipt.job_uuid,
+                receipt.miner_hotkey,
+                receipt.validator_hotkey,
+                receipt.time_started,
+                receipt.time_took_us,
+                receipt.score_str,
+                receipt.executor_class,
+                receipt.score(),
+            )
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH new_receipt (
+                    job_uuid, miner_hotkey, validator_hotkey, time_started, time_took_us, score_str, executor_class, score
+                ) AS (VALUES {values}),
+                inserted AS (
+                    INSERT INTO {receipts_table} (
+                        job_uuid, miner_hotkey, validator_hotkey, time_started, time_took_us, score_str, executor_class
+                    )
+                    SELECT DISTINCT ON (job_uuid, time_started)
+                        job_uuid, miner_hotkey, validator_hotkey, time_started, time_took_us, score_str, executor_class
+                    FROM new_receipt
+                    ON CONFLICT DO NOTHING
+                    RETURNING job_uuid, time_started
+                ),
+                inserted_receipt AS (
+                    SELECT DISTINCT ON (job_uuid, time_started) new_receipt.*
+                    FROM inserted JOIN new_receipt USING (job_uuid, time_started)
+                ),
+                receipt_bucket AS (
+                    SELECT
+                        date_trunc('hour', time_started AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour,
+                        miner_hotkey,
+                        validator_hotkey,
+                        executor_class,
+                        width_bucket(time_took_us, %s::bigint[]) AS bucket,
+                        count(*) AS count,
+                        sum(time_took_us) AS total_time_took_us,
+                        sum(score) AS total_score
+                    FROM inserted_receipt
+                    GROUP BY 1, 2, 3, 4, 5
+                ),
+                stats AS (
+                    INSERT INTO {stats_table} AS stats (
+                        hour,
+                        miner_hotkey,
+                        validator_hotkey,
+                        executor_class,
+                        count,
+                        total_time_took_us,
+                        total_score,
+                        time_took_histogram
+                    )
+                    SELECT
+                        hour,
+                        miner_hotkey,
+                        validator_hotkey,
+                        executor_class,
+                        sum(count),
+                        sum(total_time_took_us),
+                        sum(total_score),
+                        jsonb_object_agg(bucket, count)
+                    FROM receipt_bucket
+                    GROUP BY 1, 2, 3, 4
+                    ORDER BY 1, 2, 3, 4
+                    ON CONFLICT (hour, miner_hotkey, validator_hotkey, executor_class) DO UPDATE SET
+                        count = stats.count + EXCLUDED.count,
+                        total_time_took_us = stats.total_time_took_us + EXCLUDED.total_time_took_us,
+                        total_score = stats.total_score + EXCLUDED.total_score,
+                        time_took_histogram = (
+                            SELECT jsonb_object_agg(bucket, count)
+                            FROM (
+                                SELECT bucket, sum(count::bigint) AS count
+                                FROM (
+                                    SELECT * FROM jsonb_each_text(stats.time_took_histogram)
+                                    UNION ALL
+                                    SELECT * FROM jsonb_each_text(EXCLUDED.time_took_histogram)
+                                ) AS histogram (bucket, count)
+                                GROUP BY bucket
+                            ) AS histogram
+                        )
+                )
+                SELECT count(*) FROM inserted
+                """,  # noqa: S608
+                [*params, HourlyJobReceiptStats.TIME_TOOK_HISTOGRAM_BOUNDARIES_US],
+            )
+            return cursor.fetchone()[0]
+
+
 class JobReceipt(models.Model):
+    """
+    Receipt of a job executed by a miner, as reported by the miner.
+
+    The table is partitioned by month of `time_started` (see migration 0030), so the actual primary key is
+    (id, time_started) and `job_uuid` is only unique together with `time_started`, which is the same for
+    every copy of a receipt. Monthly partitions are created ahead of time by `create_job_receipt_partitions`.
+    """
+
     job_uuid = models.UUIDField()
     miner_hotkey = models.CharField(max_length=256)
     validator_hotkey = models.CharField(max_length=256)
@@ -604,9 +1116,15 @@ class JobReceipt(models.Model):
     score_str = models.CharField(max_length=256)
     executor_class = models.CharField(max_length=255, default=DEFAULT_EXECUTOR_CLASS)
 
+    objects = JobReceiptQuerySet.as_manager()
+
     class Meta:
         constraints = [
-            UniqueConstraint(fields=["job_uuid"], name="unique_job_receipt_job_uuid"),
+            UniqueConstraint(fields=["job_uuid", "time_started"], name="unique_job_receipt_job_uuid_time_started"),
+        ]
+        indexes = [
+            models.Index(fields=["miner_hotkey", "time_started"], name="idx_receipt_miner_time_started"),
+            models.Index(fields=["time_started"], name="idx_receipt_time_started"),
         ]
 
     def __str__(self):
@@ -617,3 +1135,113 @@ class JobReceipt(models.Model):
 
     def score(self):
         return float(self.score_str)
+
+
+class HourlyJobReceiptStats(models.Model):
+    """Receipts aggregated per hour they were started in; maintained by `JobReceiptQuerySet.bulk_create_with_stats`"""
+
+    # Upper bounds of buckets of `time_took_histogram`, growing by 25% from 10ms up to ~21h. Bucket `i` counts
+    # receipts with `TIME_TOOK_HISTOGRAM_BOUNDARIES_US[i - 1] <= time_took_us < TIME_TOOK_HISTOGRAM_BOUNDARIES_US[i]`
+    # (as `width_bucket` of Postgres), so that percentiles estimated from it are off by less than 12.5%.
+    # Changing the bounds invalidates histograms already stored.
+    TIME_TOOK_HISTOGRAM_BOUNDARIES_US = [int(10_000 * 1.25**i) for i in range(72)]
+
+    hour = models.DateTimeField()
+    miner_hotkey = models.CharField(max_length=256)
+    validator_hotkey = models.CharField(max_length=256)
+    executor_class = models.CharField(max_length=255)
+    count = models.BigIntegerField()
+    total_time_took_us = models.BigIntegerField()
+    total_score = models.FloatField()
+    # number of receipts per bucket (index as string), buckets without receipts are left out
+    time_took_histogram = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["hour", "miner_hotkey", "validator_hotkey", "executor_class"],
+                name="unique_hourly_job_receipt_stats",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["miner_hotkey", "hour"], name="idx_receipt_stats_miner_hour"),
+            models.Index(fields=["hour"], name="idx_receipt_stats_hour"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.hour}: {self.miner_hotkey}"
+
+    @property
+    def average_time_took(self) -> timedelta:
+        return timedelta(microseconds=self.total_time_took_us / self.count)
+
+    @property
+    def average_score(self) -> float:
+        return self.total_score / self.count
+
+    @classmethod
+    def estimate_time_took_percentile(cls, histogram: dict[str, int], percentile: float) -> int | None:
+        """Return time (in microseconds) within which given percent of receipts of a histogram was done"""
+        total = sum(histogram.values())
+        if not total:
+            return None
+
+        boundaries = cls.TIME_TOOK_HISTOGRAM_BOUNDARIES_US
+        rank = total * percentile / 100
+        seen = 0
+        for bucket, count in sorted((int(bucket), count) for bucket, count in histogram.items()):
+            seen += count
+            if seen >= rank:
+                break
+        # geometric middle of the bucket; the first and the last one are open, so their bound is used
+        if bucket == 0:
+            return boundaries[0]
+        if bucket >= len(boundaries):
+            return boundaries[-1]
+        return int((boundaries[bucket - 1] * boundaries[bucket]) ** 0.5)
+
+
+class MinerStats(models.Model):
+    """
+    Performance of miners over sliding windows (`settings.MINER_STATS_WINDOWS`) ending now.
+
+    Computed from `HourlyJobReceiptStats` by `refresh_miner_stats`, so that it can be served without
+    touching receipts; windows are made of whole hours, the current one included.
+    """
+
+    window = models.CharField(max_length=16)
+    miner_hotkey = models.CharField(max_length=256)
+    executor_class = models.CharField(max_length=255)
+    count = models.BigIntegerField()
+    time_took_p50_us = models.BigIntegerField()
+    time_took_p95_us = models.BigIntegerField()
+    average_score = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["window", "miner_hotkey", "executor_class"], name="unique_miner_stats"),
+        ]
+        indexes = [
+            models.Index(fields=["window", "-count", "miner_hotkey"], name="idx_miner_stats_window_count"),
+        ]
+        verbose_name_plural = "miner stats"
+
+    def __str__(self) -> str:
+        return f"{self.window}: {self.miner_hotkey}"
+
+
+class MinerReceiptsCursor(models.Model):
+    """Position in the receipts file of a miner up to which its receipts were already fetched"""
+
+    miner_hotkey = models.CharField(max_length=256, unique=True)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=255, blank=True)
+    # number of bytes of the file fetched so far, always at the end of a line
+    offset = models.BigIntegerField(default=0)
+    # CSV header of the file, needed to parse rows fetched from the middle of it
+    fieldnames = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.miner_hotkey}: {self.offset}"
@@ -0,0 +1,418 @@
+"""
+Collecting job receipts from miners.
+
+Every serving miner exposes its receipts as a CSV file which only grows over time. `ReceiptsCollector`
+downloads the new parts of these files from many miners at once over a shared pool of keep-alive connections,
+parsing every file line by line as it arrives, and stores the valid receipts.
+"""
+
+import asyncio
+import csv
+import datetime
+import multiprocessing
+import time
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import timedelta
+from math import ceil, isfinite
+
+import httpx
+import pydantic
+import structlog
+from asgiref.sync import sync_to_async
+from compute_horde.executor_class import DEFAULT_EXECUTOR_CLASS, ExecutorClass
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+from more_itertools import chunked
+
+from .models import JobReceipt, MinerReceiptsCursor
+from .schemas import Receipt, ReceiptPayload
+from .services.verification import get_stats as get_verification_stats
+from .services.verification import verify_receipts_signatures
+
+log = structlog.get_logger(__name__)
+
+# receipts started this long before the latest known receipt of a miner are not stored again
+RECEIPTS_CUTOFF_TOLERANCE = timedelta(minutes=30)
+# receipts claiming to have started more than this in the future are invalid; they would also end up in the default
+# partition of the receipts table, or in a partition of a month far ahead
+RECEIPTS_FUTURE_TOLERANCE = timedelta(hours=1)
+
+
+@dataclass(frozen=True)
+class MinerAddress:
+    hotkey: str
+    ip: str
+    port: int
+
+    @property
+    def receipts_url(self) -> str:
+        return f"http://{self.ip}:{self.port}/receipts/receipts.csv"
+
+
+def parse_receipt(raw_receipt: dict[str, str]) -> Receipt | None:
+    """Build a receipt from a CSV row; return None if the row is malformed"""
+    try:
+        # scores are aggregated, so they have to be finite numbers
+        if not isfinite(float(raw_receipt["score_str"])):
+            return None
+        time_started = datetime.datetime.fromisoformat(raw_receipt["time_started"])
+        if time_started.tzinfo is None:
+            time_started = time_started.replace(tzinfo=datetime.UTC)
+        if time_started > now() + RECEIPTS_FUTURE_TOLERANCE:
+            return None
+        return Receipt(
+            payload=ReceiptPayload(
+                job_uuid=raw_receipt["job_uuid"],
+                miner_hotkey=raw_receipt["miner_hotkey"],
+                validator_hotkey=raw_receipt["validator_hotkey"],
+                time_started=time_started,
+                time_took_us=int(raw_receipt["time_took_us"]),
+                score_str=raw_receipt["score_str"],
+                executor_class=ExecutorClass(raw_receipt.get("executor_class", DEFAULT_EXECUTOR_CLASS)),
+            ),
+            validator_signature=raw_receipt["validator_signature"],
+            miner_signature=raw_receipt["miner_signature"],
+        )
+    except (KeyError, TypeError, ValueError, pydantic.ValidationError):
+        return None
+
+
+def get_cutoff_times(miner_hotkeys: Iterable[str]) -> dict[str, datetime.datetime]:
+    """Return the time before which receipts of each miner are already stored, for miners having any receipts"""
+    # a lookup of the latest receipt per miner only reads the newest index entry of every partition,
+    # whereas grouping receipts by miner would read all of them
+    table = connection.ops.quote_name(JobReceipt._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT miner_hotkey, (SELECT time_started FROM {table} "  # noqa: S608
+            f"WHERE {table}.miner_hotkey = hotkey.miner_hotkey ORDER BY time_started DESC LIMIT 1) "
+            f"FROM unnest(%s::text[]) AS hotkey (miner_hotkey)",
+            [list(miner_hotkeys)],
+        )
+        return {
+            miner_hotkey: latest_time_started - RECEIPTS_CUTOFF_TOLERANCE
+            for miner_hotkey, latest_time_started in cursor.fetchall()
+            if latest_time_started is not None
+        }
+
+
+def to_job_receipt(receipt: Receipt) -> JobReceipt:
+    return JobReceipt(
+        job_uuid=receipt.payload.job_uuid,
+        miner_hotkey=receipt.payload.miner_hotkey,
+        validator_hotkey=receipt.payload.validator_hotkey,
+        time_started=receipt.payload.time_started,
+        time_took_us=receipt.payload.time_took_us,
+        score_str=receipt.payload.score_str,
+        executor_class=receipt.payload.executor_class,
+    )
+
+
+def get_cursors(miner_hotkeys: Iterable[str]) -> dict[str, MinerReceiptsCursor]:
+    return {
+        cursor.miner_hotkey: cursor
+        for cursor in MinerReceiptsCursor.objects.filter(miner_hotkey__in=list(miner_hotkeys))
+    }
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a stream of bytes into lines (without line feeds) as the bytes arrive.
+
+    Data after the last line feed is not yielded: the miner may be in the middle of writing that line.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+
+
+def parse_csv_line(line: bytes) -> list[str] | None:
+    try:
+        return next(csv.reader([line.decode() + "\n"]))
+    except (UnicodeDecodeError, csv.Error):
+        return None
+
+
+class ReceiptVerifier:
+    """
+    Check signatures of receipts in batches.
+
+    Batches of at least `batch_size` receipts are split between `workers` processes of a pool started on first use;
+    smaller ones, like the few receipts added to a file since the previous fetch, are verified in a thread
+    of the current process, so that the event loop fetching receipts is not blocked meanwhile.
+
+    Daemonic processes, like prefork Celery workers, cannot have child processes, so there everything is verified
+    in the current process.
+    """
+
+    def __init__(self, workers: int | None = None, batch_size: int | None = None):
+        self.workers = settings.RECEIPTS_VERIFICATION_WORKERS if workers is None else workers
+        self.batch_size = batch_size or settings.RECEIPTS_VERIFICATION_BATCH_SIZE
+        self._pool: ProcessPoolExecutor | None = None
+        if self.workers and multiprocessing.current_process().daemon:
+            log.info("running in a daemonic process, receipts are verified without worker processes")
+            self.workers = 0
+
+    async def verify(self, receipts: list[Receipt]) -> list[tuple[bool, bool]]:
+        """Return whether the miner and the validator signature is valid, for each receipt"""
+        signatures = [receipt.signatures() for receipt in receipts]
+        if not self.workers or len(signatures) < self.batch_size:
+            return await asyncio.to_thread(verify_receipts_signatures, signatures)
+
+        if self._pool is None:
+            # workers are spawned rather than forked, as forking a process running threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        chunk_size = ceil(len(signatures) / self.workers)
+        try:
+            results = await asyncio.gather(
+                *[
+                    loop.run_in_executor(self._pool, verify_receipts_signatures, chunk)
+                    for chunk in chunked(signatures, chunk_size)
+                ]
+            )
+        except BrokenProcessPool as e:
+            log.warning("receipt verification workers failed, verifying in the current process", error=repr(e))
+            self.close()
+            self.workers = 0
+            return await asyncio.to_thread(verify_receipts_signatures, signatures)
+        return [result for chunk_results in results for result in chunk_results]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class ReceiptsFileReplaced(Exception):
+    """Receipts file of a miner does not continue where it was fetched up to before"""
+
+
+class ReceiptsCollector:
+    """
+    Fetch receipts from many miners concurrently and store the valid ones.
+
+    At most `concurrency` miners are fetched at a time, through a single HTTP client whose connection pool
+    is sized accordingly. Each miner gets `miner_timeout` for the whole download on top of the per-request
+    connect/read timeouts, so that a miner trickling its file cannot hold a slot for long.
+
+    Receipts files only grow, so for every miner a `MinerReceiptsCursor` remembers how much of the file
+    was fetched already. Subsequent requests are conditional (an unchanged file costs a single 304) and ask
+    only for the new tail of the file. Miners not supporting ranges simply send the whole file again,
+    and if the file turns out to have been replaced, it is fetched from the beginning.
+    """
+
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        timeout: timedelta | None = None,
+        miner_timeout: timedelta | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        verifier: ReceiptVerifier | None = None,
+        insert_batch_size: int | None = None,
+    ):
+        self.concurrency = concurrency or settings.RECEIPTS_FETCH_CONCURRENCY
+        self.timeout = timeout or settings.RECEIPTS_FETCH_TIMEOUT
+        self.miner_timeout = miner_timeout or settings.RECEIPTS_FETCH_MINER_TIMEOUT
+        self.transport = transport
+        self.verifier = verifier or ReceiptVerifier()
+        self.insert_batch_size = insert_batch_size or settings.RECEIPTS_INSERT_BATCH_SIZE
+        self.num_rows = 0
+
+    async def collect(self, miners: list[MinerAddress]) -> int:
+        """Fetch receipts from all the miners; return the number of receipts stored"""
+        start = time.monotonic()
+        num_rows = self.num_rows
+        miner_hotkeys = [miner.hotkey for miner in miners]
+        cutoff_times = await sync_to_async(get_cutoff_times)(miner_hotkeys)
+        cursors = await sync_to_async(get_cursors)(miner_hotkeys)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            limits=limits,
+            timeout=self.timeout.total_seconds(),
+            transport=self.transport,
+        ) as client:
+
+            async def collect_from_miner(miner: MinerAddress) -> int:
+                async with semaphore:
+                    return await self.collect_from_miner(
+                        client,
+                        miner,
+                        cutoff_times.get(miner.hotkey),
+                        cursors.get(miner.hotkey) or MinerReceiptsCursor(miner_hotkey=miner.hotkey),
+                    )
+
+            try:
+                results = await asyncio.gather(*[collect_from_miner(miner) for miner in miners])
+            finally:
+                self.verifier.close()
+
+        num_stored = sum(results)
+        num_rows = self.num_rows - num_rows
+        elapsed = time.monotonic() - start
+        log.info(
+            "receipts fetched",
+            num_miners=len(miners),
+            num_rows=num_rows,
+            num_stored=num_stored,
+            rows_per_second=round(num_rows / elapsed) if elapsed else None,
+            verification_cache_stats=get_verification_stats(),
+        )
+        return num_stored
+
+    async def collect_from_miner(
+        self,
+        client: httpx.AsyncClient,
+        miner: MinerAddress,
+        cutoff_time: datetime.datetime | None,
+        cursor: MinerReceiptsCursor,
+    ) -> int:
+        num_stored = 0
+
+        async def store(batches: AsyncIterator[list[JobReceipt]]) -> None:
+            nonlocal num_stored
+            async for batch in batches:
+                num_stored += await sync_to_async(JobReceipt.objects.bulk_create_with_stats)(batch)
+
+        try:
+            async with asyncio.timeout(self.miner_timeout.total_seconds()):
+                try:
+                    await store(self.fetch_from_miner(client, miner, cutoff_time, cursor))
+                except ReceiptsFileReplaced:
+                    log.info("receipts file of miner was replaced, fetching it again", miner_hotkey=miner.hotkey)
+                    cursor.offset = 0
+                    await store(self.fetch_from_miner(client, miner, cutoff_time, cursor))
+        except (httpx.HTTPError, TimeoutError) as e:
+            # batches stored so far are kept, they are skipped as duplicates when fetched again
+            log.info("failed to get receipts from miner", miner_hotkey=miner.hotkey, error=repr(e))
+            return num_stored
+
+        await MinerReceiptsCursor.objects.aupdate_or_create(
+            miner_hotkey=miner.hotkey,
+            defaults={
+                "etag": cursor.etag,
+                "last_modified": cursor.last_modified,
+                "offset": cursor.offset,
+                "fieldnames": cursor.fieldnames,
+            },
+        )
+        return num_stored
+
+    async def fetch_from_miner(
+        self,
+        client: httpx.AsyncClient,
+        miner: MinerAddress,
+        cutoff_time: datetime.datetime | None,
+        cursor: MinerReceiptsCursor,
+    ) -> AsyncIterator[list[JobReceipt]]:
+        """
+        Fetch receipts added to the file since the cursor position and move the cursor past them.
+
+        Valid receipts are yielded in batches of `insert_batch_size` while the file is being read,
+        so that memory use does not depend on the size of the file.
+        """
+        headers = {}
+        if cursor.offset:
+            if cursor.etag:
+                headers["If-None-Match"] = cursor.etag
+            elif cursor.last_modified:
+                headers["If-Modified-Since"] = cursor.last_modified
+            # starting one byte early lets us check that the file still has a line break at the cursor
+            headers["Range"] = f"bytes={cursor.offset - 1}-"
+
+        unverified = []
+        verified = []
+        async with client.stream("GET", miner.receipts_url, headers=headers) as response:
+            if response.status_code == httpx.codes.NOT_MODIFIED:
+                return
+            if response.status_code == httpx.codes.REQUESTED_RANGE_NOT_SATISFIABLE:
+                raise ReceiptsFileReplaced()
+            response.raise_for_status()
+
+            if response.status_code == httpx.codes.PARTIAL_CONTENT:
+                if not response.headers.get("Content-Range", "").startswith(f"bytes {cursor.offset - 1}-"):
+                    raise ReceiptsFileReplaced()
+                offset = cursor.offset - 1
+                fieldnames = cursor.fieldnames
+                # the byte preceding the requested tail has to end a line
+                expect_line_end = True
+            else:
+                offset = 0
+                fieldnames = None
+                expect_line_end = False
+
+            async for line in iter_lines(response.aiter_bytes()):
+                if expect_line_end:
+                    if line:
+                        raise ReceiptsFileReplaced()
+                    expect_line_end = False
+                elif not line.strip():
+                    pass
+                elif fieldnames is None:
+                    fieldnames = parse_csv_line(line)
+                else:
+                    self.num_rows += 1
+                    raw_receipt = dict(zip(fieldnames, parse_csv_line(line) or []))
+                    if receipt := self.build_receipt(raw_receipt, miner, cutoff_time):
+                        unverified.append(receipt)
+                    if len(unverified) >= self.verifier.batch_size:
+                        verified += await self.verify(unverified, miner)
+                        unverified = []
+                    while len(verified) >= self.insert_batch_size:
+                        yield verified[: self.insert_batch_size]
+                        verified = verified[self.insert_batch_size :]
+                offset += len(line) + 1
+
+            cursor.etag = response.headers.get("ETag", "")
+            cursor.last_modified = response.headers.get("Last-Modified", "")
+            cursor.offset = offset
+            cursor.fieldnames = fieldnames or []
+        verified += await self.verify(unverified, miner)
+        for batch in chunked(verified, self.insert_batch_size):
+            yield batch
+
+    def build_receipt(
+        self,
+        raw_receipt: dict[str, str],
+        miner: MinerAddress,
+        cutoff_time: datetime.datetime | None,
+    ) -> Receipt | None:
+        """Return the receipt if it should be stored, pending signature verification"""
+        receipt = parse_receipt(raw_receipt)
+        if receipt is None:
+            log.warning("Miner sent invalid receipt", miner_hotkey=miner.hotkey, raw_receipt=raw_receipt)
+            return None
+
+        if receipt.payload.miner_hotkey != miner.hotkey:
+            log.warning("Miner sent receipt of a different miner", miner_hotkey=miner.hotkey, receipt=receipt)
+            return None
+
+        # checked before the signatures, which are much more expensive to verify
+        if cutoff_time is not None and receipt.payload.time_started < cutoff_time:
+            return None
+
+        return receipt
+
+    async def verify(self, receipts: list[Receipt], miner: MinerAddress) -> list[JobReceipt]:
+        if not receipts:
+            return []
+
+        valid_receipts = []
+        for receipt, (is_miner_signature_valid, is_validator_signature_valid) in zip(
+            receipts, await self.verifier.verify(receipts)
+        ):
+            if not is_miner_signature_valid:
+                log.warning("Invalid miner signature of receipt", miner_hotkey=miner.hotkey, receipt=receipt)
+            elif not is_validator_signature_valid:
+                log.warning("Invalid validator signature of receipt", miner_hotkey=miner.hotkey, receipt=receipt)
+            else:
+                valid_receipts.append(to_job_receipt(receipt))
+        return valid_receipts
@@ -3,11 +3,17 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import TYPE_CHECKING, Literal, Self
 
-import bittensor
 from compute_horde.executor_class import DEFAULT_EXECUTOR_CLASS, ExecutorClass
 from pydantic import BaseModel, Extra, Field, field_validator
 from pydantic_core import to_jsonable_python
 
+from .services.verification import (
+    ReceiptSignatures,
+    get_keypair_from_public_key,
+    verify_public_key_signature,
+    verify_signature,
+)
+
 if TYPE_CHECKING:
     from bittensor import Keypair
 
@@ -38,17 +44,11 @@ class AuthenticationRequest(BaseModel, extra=Extra.forbid):
         )
 
     def verify_signature(self) -> bool:
-        from bittensor import Keypair
-
-        public_key_bytes = bytes.fromhex(self.public_key)
-        keypair = Keypair(public_key=public_key_bytes, ss58_format=42)
-        return keypair.verify(public_key_bytes, self.signature)
+        return verify_public_key_signature(self.public_key, bytes.fromhex(self.public_key), self.signature)
 
     @property
     def ss58_address(self) -> str:
-        from bittensor import Keypair
-
-        return Keypair(public_key=bytes.fromhex(self.public_key), ss58_format=42).ss58_address
+        return get_keypair_from_public_key(self.public_key).ss58_address
 
 
 class JobRequest(BaseModel, extra=Extra.forbid):
@@ -236,9 +236,18 @@ class Receipt(BaseModel):
     miner_signature: str
 
     def verify_miner_signature(self):
-        miner_keypair = bittensor.Keypair(ss58_address=self.payload.miner_hotkey)
-        return miner_keypair.verify(self.payload.blob_for_signing(), self.miner_signature)
+        return verify_signature(self.payload.miner_hotkey, self.payload.blob_for_signing(), self.miner_signature)
 
     def verify_validator_signature(self):
-        validator_keypair = bittensor.Keypair(ss58_address=self.payload.validator_hotkey)
-        return validator_keypair.verify(self.payload.blob_for_signing(), self.validator_signature)
+        return verify_signature(
+            self.payload.validator_hotkey, self.payload.blob_for_signing(), self.validator_signature
+        )
+
+    def signatures(self) -> ReceiptSignatures:
+        return (
+            self.payload.blob_for_signing(),
+            self.payload.miner_hotkey,
+            self.miner_signature,
+            self.payload.validator_hotkey,
+            self.validator_signature,
+        )
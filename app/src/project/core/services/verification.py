@@ -0,0 +1,138 @@
+"""
+Verification of substrate (sr25519) signatures.
+
+Building a `Keypair` decodes the SS58 address (or encodes one from the public key) and checking a signature
+is far more expensive than hashing it, while the same keys and often the same signatures are seen over
+and over: validators authenticate with a signature of their own public key on every reconnect, receipts
+are fetched again when a miner's file is replaced. So keypairs are cached per SS58 address and public key,
+and outcomes of verification are cached per digest of (public key, message, signature).
+
+This module does not depend on Django, so that it can be used in worker processes of a process pool.
+Caches are per process; `get_stats()` reports how well they do.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from bittensor import Keypair
+
+KEYPAIR_CACHE_SIZE = 4096
+VERIFIED_SIGNATURES_CACHE_SIZE = 65536
+
+# (blob signed, miner hotkey, miner signature, validator hotkey, validator signature)
+ReceiptSignatures = tuple[str, str, str, str, str]
+
+
+class VerifiedSignaturesCache:
+    """LRU of verification outcomes, keyed by digests so that signed messages are not kept in memory"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._results: OrderedDict[bytes, bool] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(public_key: bytes, message: str | bytes, signature: str | bytes) -> bytes:
+        if isinstance(message, str):
+            message = message.encode()
+        if isinstance(signature, str):
+            signature = signature.encode()
+        digest = hashlib.sha256(public_key)
+        for part in (message, signature):
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.digest()
+
+    def verify(self, keypair: Keypair, message: str | bytes, signature: str | bytes) -> bool:
+        key = self.digest(keypair.public_key, message, signature)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        try:
+            result = keypair.verify(message, signature)
+        except (TypeError, ValueError):
+            result = False
+
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+verified_signatures = VerifiedSignaturesCache(maxsize=VERIFIED_SIGNATURES_CACHE_SIZE)
+
+
+@lru_cache(maxsize=KEYPAIR_CACHE_SIZE)
+def get_keypair(ss58_address: str) -> Keypair:
+    return Keypair(ss58_address=ss58_address)
+
+
+@lru_cache(maxsize=KEYPAIR_CACHE_SIZE)
+def get_keypair_from_public_key(public_key: str) -> Keypair:
+    """Return keypair of a hex encoded public key"""
+    return Keypair(public_key=bytes.fromhex(public_key), ss58_format=42)
+
+
+def verify_signature(ss58_address: str, message: str | bytes, signature: str) -> bool:
+    try:
+        keypair = get_keypair(ss58_address)
+    except ValueError:
+        return False
+    return verified_signatures.verify(keypair, message, signature)
+
+
+def verify_public_key_signature(public_key: str, message: str | bytes, signature: str) -> bool:
+    try:
+        keypair = get_keypair_from_public_key(public_key)
+    except ValueError:
+        return False
+    return verified_signatures.verify(keypair, message, signature)
+
+
+def verify_receipts_signatures(receipts: list[ReceiptSignatures]) -> list[tuple[bool, bool]]:
+    """Check the miner and the validator signature of each receipt"""
+    return [
+        (
+            verify_signature(miner_hotkey, blob, miner_signature),
+            verify_signature(validator_hotkey, blob, validator_signature),
+        )
+        for blob, miner_hotkey, miner_signature, validator_hotkey, validator_signature in receipts
+    ]
+
+
+def get_stats() -> dict[str, dict[str, int]]:
+    stats = {}
+    for name, function in [("keypairs", get_keypair), ("public_key_keypairs", get_keypair_from_public_key)]:
+        cache_info = function.cache_info()
+        stats[name] = {"hits": cache_info.hits, "misses": cache_info.misses, "size": cache_info.currsize}
+    stats["verified_signatures"] = {
+        "hits": verified_signatures.hits,
+        "misses": verified_signatures.misses,
+        "size": len(verified_signatures),
+    }
+    return stats
+
+
+def clear_caches() -> None:
+    get_keypair.cache_clear()
+    get_keypair_from_public_key.cache_clear()
+    verified_signatures.clear()
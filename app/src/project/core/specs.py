@@ -1,7 +1,19 @@
-from collections import defaultdict
+import asyncio
+import threading
+from collections import OrderedDict, defaultdict
+from collections.abc import Iterable
+from contextlib import suppress
+from datetime import datetime
+from functools import reduce
+from operator import or_
 
 import structlog
+from asgiref.sync import sync_to_async
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
 from django.utils.timezone import now
 from pydantic import parse_obj_as
 
@@ -21,6 +33,169 @@ from .schemas import HardwareSpec, MachineSpecs
 log = structlog.wrap_logger(get_task_logger(__name__))
 
 SPECS_PROCESS_LOOKBACK = 60 * 65  # 65 minutes
+PARSED_RAW_SPECS_CACHE_SIZE = 10_000
+DIMENSION_CACHE_SIZE = 10_000
+
+# rows of `ExecutorSpecs` of snapshots matching `{condition}`
+APPEND_SPECS_SQL = """
+INSERT INTO specs (
+    snapshot_id, gpu_specs_id, measured_at, miner_hotkey, batch_id, os, virtualization, total_hdd, total_ram,
+    cpu_count, cpu_model, gpu_id, vram, cuda, driver, gpu_count, graphics_speed, memory_speed, power_limit
+)
+SELECT
+    snapshot.id,
+    gpu_specs.id,
+    snapshot.measured_at,
+    miner.ss58_address,
+    snapshot.batch_id,
+    other_specs.os,
+    other_specs.virtualization,
+    other_specs.total_hdd,
+    other_specs.total_ram,
+    cpu_specs.cpu_count,
+    cpu_specs.cpu_model,
+    gpu_specs.gpu_model_id,
+    gpu_specs.capacity,
+    gpu_specs.cuda,
+    gpu_specs.driver,
+    gpu_specs.gpu_count,
+    gpu_specs.graphics_speed,
+    gpu_specs.memory_speed,
+    gpu_specs.power_limit
+FROM
+    core_executorspecssnapshot snapshot
+    INNER JOIN core_parsedspecsdata specs ON specs.id_id = snapshot.raw_specs_id
+    INNER JOIN core_validator validator ON validator.id = snapshot.validator_id
+    INNER JOIN core_trustedvalidator trusted_validator ON trusted_validator.ss58_address = validator.ss58_address
+    INNER JOIN core_miner miner ON miner.id = snapshot.miner_id
+    INNER JOIN core_gpuspecs gpu_specs ON gpu_specs.parsed_specs_id = specs.id_id
+    INNER JOIN core_cpuspecs cpu_specs ON specs.cpu_specs_id = cpu_specs.id
+    INNER JOIN core_otherspecs other_specs ON specs.other_specs_id = other_specs.id
+WHERE
+    {condition}
+    AND snapshot.measured_at > %(since)s
+ON CONFLICT (snapshot_id, gpu_specs_id) DO NOTHING
+"""
+
+
+class ParsedRawSpecsCache:
+    """LRU of ids of `RawSpecsData` which are stored and parsed already, by hash of their data"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._ids: OrderedDict[str, int] = OrderedDict()
+
+    def get(self, data_hash: str) -> int | None:
+        raw_specs_id = self._ids.get(data_hash)
+        if raw_specs_id is not None:
+            self._ids.move_to_end(data_hash)
+        return raw_specs_id
+
+    def add(self, data_hash: str, raw_specs_id: int) -> None:
+        self._ids[data_hash] = raw_specs_id
+        self._ids.move_to_end(data_hash)
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+parsed_raw_specs = ParsedRawSpecsCache(maxsize=PARSED_RAW_SPECS_CACHE_SIZE)
+
+
+class DimensionCache:
+    """
+    Process-local LRU of ids of rows of a small table which hardly ever changes, by fields identifying them.
+
+    Keys missing from the cache are looked up, and those missing from the table are inserted, in bulk.
+    Saving or deleting a row of the table (other than by the bulk insert) clears the cache.
+    """
+
+    def __init__(self, model: type[models.Model], fields: list[str], maxsize: int = DIMENSION_CACHE_SIZE):
+        self.model = model
+        self.fields = fields
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._ids: OrderedDict[tuple, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        post_save.connect(self._invalidate, sender=model, weak=False)
+        post_delete.connect(self._invalidate, sender=model, weak=False)
+
+    async def get_or_create_ids(self, keys: Iterable[tuple]) -> tuple[dict[tuple, int], set[tuple]]:
+        """Return ids of rows with given values of `fields`, and keys of the rows which had to be created"""
+        # values as stored, e.g. a float GB total in an integer column, so that they match the rows fetched
+        prepared = {key: self._prepare(key) for key in set(keys)}
+        ids = {}
+        with self._lock:
+            for key in set(prepared.values()):
+                if (pk := self._ids.get(key)) is not None:
+                    self._ids.move_to_end(key)
+                    ids[key] = pk
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        missing = set(prepared.values()) - ids.keys()
+        created = set()
+        if missing:
+            found = await self._fetch(missing)
+            created = missing - found.keys()
+            if created:
+                await self.model.objects.abulk_create(
+                    [self.model(**dict(zip(self.fields, key))) for key in created],
+                    ignore_conflicts=True,
+                )
+                found |= await self._fetch(created)
+            if unresolved := missing - found.keys():
+                raise self.model.DoesNotExist(f"{self.model.__name__} rows not found after inserting: {unresolved}")
+
+            with self._lock:
+                for key, pk in found.items():
+                    self._ids[key] = pk
+                    self._ids.move_to_end(key)
+                while len(self._ids) > self.maxsize:
+                    self._ids.popitem(last=False)
+            ids |= found
+
+        return (
+            {key: ids[prepared_key] for key, prepared_key in prepared.items()},
+            {key for key, prepared_key in prepared.items() if prepared_key in created},
+        )
+
+    async def get_or_create_id(self, **values) -> tuple[int, bool]:
+        key = tuple(values[field] for field in self.fields)
+        ids, created = await self.get_or_create_ids([key])
+        return ids[key], key in created
+
+    def _prepare(self, key: tuple) -> tuple:
+        return tuple(self.model._meta.get_field(field).get_prep_value(value) for field, value in zip(self.fields, key))
+
+    async def _fetch(self, keys: set[tuple]) -> dict[tuple, int]:
+        condition = reduce(or_, (Q(**dict(zip(self.fields, key))) for key in keys))
+        # the oldest row wins if several match, e.g. differing in fields outside of the key, or with nulls in it
+        rows = self.model.objects.filter(condition).order_by("-pk").values_list(*self.fields, "pk")
+        return {tuple(row[:-1]): row[-1] async for row in rows}
+
+    def _invalidate(self, **kwargs) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+cpu_specs_ids = DimensionCache(CpuSpecs, ["cpu_model", "cpu_count"])
+other_specs_ids = DimensionCache(OtherSpecs, ["os", "virtualization", "total_ram", "total_hdd"])
+gpu_ids = DimensionCache(GPU, ["name"])
 
 
 def normalize_gpu_name(name: str) -> str:
@@ -46,46 +221,218 @@ def cleanup_fields(raw_specs):
         log.error("could not remove variable ram and hard disk fields from: {raw_specs}")
 
 
-async def save_machine_specs(message: MachineSpecs) -> None:
-    message = message.dict()
-    raw_specs = message["specs"]
-    validator_hotkey = message["validator_hotkey"]
-    miner_hotkey = message["miner_hotkey"]
-    batch_id = message.get("batch_id", None)
-    log.debug(f"received miner {miner_hotkey} specs {raw_specs} from validator {validator_hotkey}, batch_id {batch_id}")
-    measured_at = now()
+async def save_machine_specs(message: MachineSpecs, measured_at: datetime | None = None) -> None:
+    await save_machine_specs_batch([(message, measured_at or now())])
 
-    miner = await Miner.objects.filter(ss58_address=miner_hotkey, is_active=True).afirst()
-    if not miner:
-        log.warning(f"miner with hotkey {miner_hotkey} not found - not storing hardware state")
-        return
 
-    validator = await Validator.objects.filter(ss58_address=validator_hotkey, is_active=True).afirst()
-    if not validator:
-        log.warning(f"validator with hotkey {miner_hotkey} not found - not storing hardware state")
+async def save_machine_specs_batch(messages: list[tuple[MachineSpecs, datetime]]) -> None:
+    """
+    Store specs messages (with the time they were received) as `ExecutorSpecsSnapshot`s.
+
+    Miners, validators and raw specs of the whole batch are looked up at once and snapshots are inserted
+    in bulk; only raw specs never seen before are parsed one by one.
+    """
+    miner_hotkeys = {message.miner_hotkey for message, _ in messages}
+    validator_hotkeys = {message.validator_hotkey for message, _ in messages}
+    miner_ids = {
+        ss58_address: pk
+        async for ss58_address, pk in Miner.objects.filter(ss58_address__in=miner_hotkeys, is_active=True).values_list(
+            "ss58_address", "pk"
+        )
+    }
+    validator_ids = {
+        ss58_address: pk
+        async for ss58_address, pk in Validator.objects.filter(
+            ss58_address__in=validator_hotkeys, is_active=True
+        ).values_list("ss58_address", "pk")
+    }
+
+    snapshots = []
+    snapshots_data_hashes = []
+    raw_specs_data = {}
+    for message, measured_at in messages:
+        raw_specs = message.dict()["specs"]
+        log.debug(
+            f"received miner {message.miner_hotkey} specs {raw_specs} from validator {message.validator_hotkey}, "
+            f"batch_id {message.batch_id}"
+        )
+        if message.miner_hotkey not in miner_ids:
+            log.warning(f"miner with hotkey {message.miner_hotkey} not found - not storing hardware state")
+            continue
+        if message.validator_hotkey not in validator_ids:
+            log.warning(f"validator with hotkey {message.validator_hotkey} not found - not storing hardware state")
+            continue
+
+        cleanup_fields(raw_specs)
+        data_hash = RawSpecsData.hash_data(raw_specs)
+        raw_specs_data[data_hash] = raw_specs
+        snapshots_data_hashes.append(data_hash)
+        snapshots.append(
+            ExecutorSpecsSnapshot(
+                batch_id=message.batch_id,
+                miner_id=miner_ids[message.miner_hotkey],
+                validator_id=validator_ids[message.validator_hotkey],
+                measured_at=measured_at,
+            )
+        )
+    if not snapshots:
         return
 
-    cleanup_fields(raw_specs)
+    # machines keep reporting the same specs, which are then known to be stored and parsed already
+    raw_specs_ids = {data_hash: parsed_raw_specs.get(data_hash) for data_hash in raw_specs_data}
+    unknown = [data_hash for data_hash, raw_specs_id in raw_specs_ids.items() if raw_specs_id is None]
+    unparsed = []
+    if unknown:
+        # dump raw specs data
+        await RawSpecsData.objects.abulk_create(
+            [RawSpecsData(data=raw_specs_data[data_hash], data_hash=data_hash) for data_hash in unknown],
+            ignore_conflicts=True,
+        )
+        stored = {
+            raw_specs.data_hash: raw_specs
+            async for raw_specs in RawSpecsData.objects.filter(data_hash__in=unknown).only("pk", "data_hash")
+        }
+        parsed = {
+            pk
+            async for pk in ParsedSpecsData.objects.filter(
+                pk__in=[raw_specs.pk for raw_specs in stored.values()]
+            ).values_list("pk", flat=True)
+        }
+        for data_hash, raw_specs in stored.items():
+            raw_specs_ids[data_hash] = raw_specs.pk
+            if raw_specs.pk not in parsed:
+                raw_specs.data = raw_specs_data[data_hash]
+                unparsed.append(raw_specs)
 
-    # dump raw specs data
-    raw_specs, _ = await RawSpecsData.objects.aget_or_create(
-        data=raw_specs,
-    )
+    for snapshot, data_hash in zip(snapshots, snapshots_data_hashes):
+        snapshot.raw_specs_id = raw_specs_ids[data_hash]
+    snapshots = await ExecutorSpecsSnapshot.objects.abulk_create(snapshots)
 
-    await ExecutorSpecsSnapshot.objects.acreate(
-        batch_id=batch_id,
-        miner=miner,
-        validator=validator,
-        measured_at=measured_at,
-        raw_specs=raw_specs,
+    # specs of all snapshots of new raw specs (these included) are appended once they are parsed
+    unparsed_ids = {raw_specs.pk for raw_specs in unparsed}
+    failed_ids = set()
+    for raw_specs in unparsed:
+        try:
+            await process_raw_specs_data(raw_specs)
+        except Exception:
+            log.exception(f"failed to process new specs data {raw_specs.pk}")
+            failed_ids.add(raw_specs.pk)
+        else:
+            log.info(f"processed new specs data {raw_specs.pk}")
+    await sync_to_async(append_specs)(
+        snapshot_ids=[snapshot.pk for snapshot in snapshots if snapshot.raw_specs_id not in unparsed_ids]
     )
 
-    raw_specs_is_parsed = await ParsedSpecsData.objects.filter(pk=raw_specs.pk).aexists()
-    if not raw_specs_is_parsed:
-        await process_raw_specs_data(raw_specs)
-        log.info(
-            f"processed new specs data from miner {miner_hotkey}, validator {validator_hotkey}, batch {batch_id} measured at {measured_at}"
+    for data_hash, raw_specs_id in raw_specs_ids.items():
+        if raw_specs_id not in failed_ids:
+            parsed_raw_specs.add(data_hash, raw_specs_id)
+
+
+class MachineSpecsWriter:
+    """
+    Buffer of specs messages received via WS, stored by a background task in batches.
+
+    Validators send specs of all their miners at once, and storing them one by one would hold up
+    the connection they came through. Messages are buffered instead and written once
+    `settings.MACHINE_SPECS_BATCH_SIZE` of them are waiting, or `settings.MACHINE_SPECS_BATCH_DELAY`
+    after the first of them arrived. The buffer is per process (and event loop) and not persisted;
+    when `settings.MACHINE_SPECS_QUEUE_SIZE` messages are waiting already, new ones are dropped.
+    """
+
+    def __init__(self):
+        self._pending: list[tuple[MachineSpecs, datetime]] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._has_pending: asyncio.Event | None = None
+        self._has_full_batch: asyncio.Event | None = None
+        self._closing = False
+        self.num_batches = 0
+        self.num_written = 0
+        self.num_dropped = 0
+
+    def put(self, message: MachineSpecs) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._has_pending = asyncio.Event()
+            self._has_full_batch = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+        if len(self._pending) >= settings.MACHINE_SPECS_QUEUE_SIZE:
+            self.num_dropped += 1
+            log.warning("machine specs queue full - dropping specs", miner_hotkey=message.miner_hotkey)
+            return
+
+        self._pending.append((message, now()))
+        self._has_pending.set()
+        if len(self._pending) >= settings.MACHINE_SPECS_BATCH_SIZE:
+            self._has_full_batch.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            # give following messages a chance to join the batch
+            with suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self._has_full_batch.wait(),
+                    timeout=settings.MACHINE_SPECS_BATCH_DELAY.total_seconds(),
+                )
+            await self.flush()
+            if self._closing and not self._pending:
+                return
+
+    async def flush(self) -> None:
+        """Store all messages buffered so far"""
+        while self._pending:
+            batch_size = settings.MACHINE_SPECS_BATCH_SIZE
+            batch, self._pending = self._pending[:batch_size], self._pending[batch_size:]
+            if len(self._pending) < batch_size:
+                self._has_full_batch.clear()
+            if not self._pending:
+                self._has_pending.clear()
+
+            try:
+                await save_machine_specs_batch(batch)
+            except Exception:
+                log.exception("failed to store machine specs", batch_size=len(batch))
+                continue
+            self.num_batches += 1
+            self.num_written += len(batch)
+            log.debug("machine specs stored", batch_size=len(batch), total_written=self.num_written)
+
+    async def close(self) -> None:
+        """Store messages still buffered and stop the background task"""
+        if self._task is not None:
+            # the task is not cancelled, so that a batch being written is not lost
+            self._closing = True
+            self._has_pending.set()
+            self._has_full_batch.set()
+            await self._task
+        await self.flush()
+        self._loop = self._task = None
+        self._closing = False
+
+
+machine_specs_writer = MachineSpecsWriter()
+
+
+def append_specs(snapshot_ids: list[int] | None = None, raw_specs_id: int | None = None) -> int:
+    """Add specs of snapshots, or of all snapshots of given raw specs, to `ExecutorSpecs`; return number of rows added"""
+    if snapshot_ids is not None:
+        if not snapshot_ids:
+            return 0
+        condition, value = "snapshot.id = ANY(%(value)s)", snapshot_ids
+    elif raw_specs_id is not None:
+        condition, value = "snapshot.raw_specs_id = %(value)s", raw_specs_id
+    else:
+        raise ValueError("either snapshot_ids or raw_specs_id is required")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            APPEND_SPECS_SQL.format(condition=condition),
+            {"value": value, "since": now() - settings.SPECS_RETENTION},
         )
+        return cursor.rowcount
 
 
 async def process_raw_specs_data(raw_specs: RawSpecsData) -> None:
@@ -99,12 +446,12 @@ async def process_raw_specs_data(raw_specs: RawSpecsData) -> None:
     if specs.model_extra:
         log.warning(f"extra fields found in raw specs: {specs.model_extra}")
 
-    cpu_specs, _ = await CpuSpecs.objects.aget_or_create(
+    cpu_specs_id, _ = await cpu_specs_ids.get_or_create_id(
         cpu_model=specs.cpu.model,
         cpu_count=specs.cpu.count,
     )
 
-    other_specs, _ = await OtherSpecs.objects.aget_or_create(
+    other_specs_id, _ = await other_specs_ids.get_or_create_id(
         os=specs.os,
         virtualization=specs.virtualization,
         total_ram=specs.ram.get_total_gb(),
@@ -114,8 +461,8 @@ async def process_raw_specs_data(raw_specs: RawSpecsData) -> None:
     parsed_specs, is_created = await ParsedSpecsData.objects.aget_or_create(
         id=raw_specs,
         defaults={
-            "cpu_specs": cpu_specs,
-            "other_specs": other_specs,
+            "cpu_specs_id": cpu_specs_id,
+            "other_specs_id": other_specs_id,
         },
     )
 
@@ -133,17 +480,17 @@ async def process_raw_specs_data(raw_specs: RawSpecsData) -> None:
             gpu_types_count[gpu_name] += 1
             gpu_types_details[gpu_name] = gpu_detail
 
+        # try to match with reference gpus, otherwise create new
+        gpus, created = await gpu_ids.get_or_create_ids((gpu_name,) for gpu_name in gpu_types_details)
+        for (gpu_name,) in created:
+            log.warning(f"gpu: {gpu_name} not found in db - created new entry")
+
         instances = []
         for gpu_name, gpu_detail in gpu_types_details.items():
-            # try to match with reference gpu, otherwise create new
-            gpu, is_created = await GPU.objects.aget_or_create(name=gpu_name)
-            if is_created:
-                log.warning(f"gpu: {gpu_name} not found in db - created new entry")
-
             instances.append(
                 GpuSpecs(
                     parsed_specs=parsed_specs,
-                    gpu_model=gpu,
+                    gpu_model_id=gpus[gpu_name,],
                     gpu_count=gpu_types_count[gpu_name],
                     capacity=gpu_detail.capacity,
                     cuda=gpu_detail.cuda,
@@ -156,3 +503,4 @@ async def process_raw_specs_data(raw_specs: RawSpecsData) -> None:
                 )
             )
         await GpuSpecs.objects.abulk_create(instances)
+        await sync_to_async(append_specs)(raw_specs_id=raw_specs.pk)
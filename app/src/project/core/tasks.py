@@ -1,47 +1,43 @@
-import contextlib
-import csv
-import datetime
-import io
-import shutil
-import tempfile
 from collections import defaultdict
 from datetime import timedelta
+from itertools import count
 
-import pydantic
-import requests
 import structlog
 from asgiref.sync import async_to_sync
 from celery.utils.log import get_task_logger
 from channels.layers import get_channel_layer
-from compute_horde.executor_class import DEFAULT_EXECUTOR_CLASS, ExecutorClass
 from constance import config
 from django.conf import settings
-from django.db import connection
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
 from django.utils.timezone import now
 from more_itertools import one, partition
 from pydantic import parse_obj_as
-from requests import RequestException
 
 from project.celery import app
 
+from . import archive, miner_stats
 from .models import (
     GPU,
     Channel,
+    ExecutorSpecs,
     GpuCount,
     HardwareState,
-    JobReceipt,
+    Job,
+    JobStatus,
     Miner,
     Subnet,
     Validator,
 )
-from .schemas import ForceDisconnect, HardwareSpec, Receipt, ReceiptPayload
+from .receipts import MinerAddress, ReceiptsCollector
+from .schemas import ForceDisconnect, HardwareSpec
 from .specs import normalize_gpu_name
 from .utils import fetch_compute_subnet_hardware, is_validator
+from .validator_registry import get_validator_registry
 
 log = structlog.wrap_logger(get_task_logger(__name__))
 
-RECEIPTS_CUTOFF_TOLERANCE = timedelta(minutes=30)
-
 
 @app.task
 def sync_metagraph() -> None:
@@ -107,8 +103,9 @@ def sync_miners(active_miners_keys: list[str]) -> None:
     num_deactivated = to_deactivate.update(is_active=False)
     log.debug("miners deactivated", num_deactivated=num_deactivated)
 
+    # forget about jobs assigned before the miner was deactivated
     to_activate = Miner.objects.filter(is_active=False, ss58_address__in=active_miners_keys)
-    num_activated = to_activate.update(is_active=True)
+    num_activated = to_activate.update(is_active=True, busy_until=None)
     log.debug("miners activated", num_activated=num_activated)
 
     to_create = set(active_miners_keys) - set(Miner.objects.values_list("ss58_address", flat=True))
@@ -118,6 +115,95 @@ def sync_miners(active_miners_keys: list[str]) -> None:
     log.debug("miners created", num_created=num_created)
 
 
+@app.task
+def dispatch_pending_jobs(batch_size: int = settings.JOB_DISPATCH_BATCH_SIZE) -> None:
+    """
+    Select nodes for pending jobs and send them to validators.
+
+    Jobs are processed in batches; every batch is locked (skipping jobs locked by concurrent dispatchers)
+    and assigned within one transaction, and job requests are pushed to the channel layer after it commits.
+    Jobs are only marked as sent once their requests are pushed; jobs which could not be sent are unassigned
+    and dispatched again by the next run. Jobs for which no nodes are available stay pending and are failed
+    once they time out.
+    """
+
+    cursor = None
+    while True:
+        assigned = []
+        with transaction.atomic():
+            pending_jobs = (
+                Job.objects.filter(last_status=JobStatus.Status.PENDING)
+                .select_related("user")
+                .select_for_update(skip_locked=True, of=("self",))
+                .order_by("created_at", "uuid")
+            )
+            if cursor:
+                pending_jobs = pending_jobs.filter(
+                    Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], uuid__gt=cursor[1])
+                )
+            jobs = list(pending_jobs[:batch_size])
+
+            # the registry only learns about assignments once they are committed,
+            # so within the batch validators take turns, least recently assigned first
+            registry = get_validator_registry()
+            validator_ids = registry.sort_least_recently_assigned(registry.connected_validator_ids())
+            validators = Validator.objects.in_bulk(validator_ids)
+            turns = {validator_id: turn for turn, validator_id in enumerate(validator_ids)}
+            next_turns = count(len(validator_ids))
+
+            for job in jobs:
+                if job.validator_id is not None:
+                    # assigned by a run which is sending it right now, or which did not live to send it
+                    if job.created_at < now() - Job.JOB_TIMEOUT:
+                        JobStatus.objects.create(
+                            job=job,
+                            status=JobStatus.Status.FAILED,
+                            metadata={"comment": "Could not send job"},
+                        )
+                    continue
+
+                try:
+                    candidates = Job.get_validator_candidates(job.user) & validators.keys()
+                    if not candidates:
+                        raise Validator.DoesNotExist
+                    job.validator = validators[min(candidates, key=turns.__getitem__)]
+                    job.assign_nodes()
+                except ObjectDoesNotExist as exc:
+                    model_name = exc.__class__.__qualname__.partition(".")[0]
+                    log.debug("could not dispatch job", job=job, model=model_name)
+                    if job.created_at < now() - Job.JOB_TIMEOUT:
+                        JobStatus.objects.create(
+                            job=job,
+                            status=JobStatus.Status.FAILED,
+                            metadata={"comment": f"Could not select {model_name}"},
+                        )
+                    continue
+
+                turns[job.validator_id] = next(next_turns)
+                job.save(update_fields=["validator", "miner"])
+                job.claim_nodes()
+                assigned.append(job)
+
+        # do not hold the locks while talking to the channel layer
+        num_dispatched = 0
+        for job in assigned:
+            sent_at = now()
+            try:
+                job.send_job_request()
+            except Exception:
+                log.exception("could not send job", job=job)
+                job.release_nodes()
+                continue
+            # dated before sending, so that it does not supersede statuses reported by the validator meanwhile
+            JobStatus.objects.create(job=job, status=JobStatus.Status.SENT, created_at=sent_at)
+            num_dispatched += 1
+        log.info("pending jobs dispatched", num_pending=len(jobs), num_dispatched=num_dispatched)
+
+        if len(jobs) < batch_size:
+            return
+        cursor = (jobs[-1].created_at, jobs[-1].uuid)
+
+
 @app.task
 def record_compute_subnet_hardware() -> None:
     """
@@ -171,89 +257,56 @@ def record_compute_subnet_hardware() -> None:
 def fetch_receipts_from_miner(hotkey: str, ip: str, port: int):
     # Origin of this task may be found in ComputeHorde repo:
     # https://github.com/backend-developers-ltd/ComputeHorde/blob/8b35d24142265171e863e98b3c517ffee007d9a0/compute_horde/compute_horde/receipts.py#L34
+    async_to_sync(ReceiptsCollector().collect)([MinerAddress(hotkey=hotkey, ip=ip, port=port)])
 
-    to_create = []
-    latest_job_receipt = JobReceipt.objects.filter(miner_hotkey=hotkey).order_by("-time_started").first()
-    cutoff_time = latest_job_receipt.time_started - RECEIPTS_CUTOFF_TOLERANCE if latest_job_receipt else None
-
-    with contextlib.ExitStack() as exit_stack:
-        try:
-            receipts_url = f"http://{ip}:{port}/receipts/receipts.csv"
-            response = exit_stack.enter_context(requests.get(receipts_url, stream=True, timeout=5))
-            response.raise_for_status()
-        except RequestException as e:
-            log.info("failed to get receipts from miner", miner_hotkey=hotkey, error=e)
-            return
 
-        temp_file = exit_stack.enter_context(tempfile.TemporaryFile())
-        shutil.copyfileobj(response.raw, temp_file)
-        temp_file.seek(0)
-
-        wrapper = io.TextIOWrapper(temp_file)
-        csv_reader = csv.DictReader(wrapper)
-        for raw_receipt in csv_reader:
-            try:
-                executor_class = ExecutorClass(raw_receipt.get("executor_class", DEFAULT_EXECUTOR_CLASS))
-                receipt = Receipt(
-                    payload=ReceiptPayload(
-                        job_uuid=raw_receipt["job_uuid"],
-                        miner_hotkey=raw_receipt["miner_hotkey"],
-                        validator_hotkey=raw_receipt["validator_hotkey"],
-                        time_started=datetime.datetime.fromisoformat(raw_receipt["time_started"]),
-                        time_took_us=int(raw_receipt["time_took_us"]),
-                        score_str=raw_receipt["score_str"],
-                        executor_class=executor_class,
-                    ),
-                    validator_signature=raw_receipt["validator_signature"],
-                    miner_signature=raw_receipt["miner_signature"],
-                )
-            except (ValueError, pydantic.ValidationError):
-                log.warning("Miner sent invalid receipt", miner_hotkey=hotkey, raw_receipt=raw_receipt)
-                continue
+@app.task
+def fetch_receipts():
+    """Fetch job receipts from the miners."""
+    import bittensor
 
-            if receipt.payload.miner_hotkey != hotkey:
-                log.warning("Miner sent receipt of a different miner", miner_hotkey=hotkey, receipt=receipt)
-                continue
+    metagraph = bittensor.metagraph(netuid=settings.BITTENSOR_NETUID, network=settings.BITTENSOR_NETWORK)
+    miners = [
+        MinerAddress(hotkey=neuron.hotkey, ip=neuron.axon_info.ip, port=neuron.axon_info.port)
+        for neuron in metagraph.neurons
+        if neuron.axon_info.is_serving
+    ]
+    async_to_sync(ReceiptsCollector().collect)(miners)
 
-            if not receipt.verify_miner_signature():
-                log.warning("Invalid miner signature of receipt", miner_hotkey=hotkey, receipt=receipt)
-                continue
 
-            if not receipt.verify_validator_signature():
-                log.warning("Invalid validator signature of receipt", miner_hotkey=hotkey, receipt=receipt)
-                continue
+@app.task
+def create_job_receipt_partitions():
+    """
+    Create monthly partitions of the receipts table for the current and the next months.
 
-            if cutoff_time is not None and receipt.payload.time_started < cutoff_time:
-                continue
+    Receipts of months without a partition land in the default partition, and a partition cannot be created
+    for a month which already has receipts there, so partitions are created well before they are needed.
+    """
+    month = now().date().replace(day=1)
+    with connection.cursor() as cursor:
+        for _ in range(settings.JOB_RECEIPT_PARTITIONS_AHEAD + 1):
+            try:
+                with transaction.atomic():
+                    cursor.execute("SELECT core_create_job_receipt_partition(%s)", [month])
+            except DatabaseError:
+                # a failure for one month should not keep partitions of the following months from being created
+                log.exception("failed to create receipts partition", month=month)
+            month = (month + timedelta(days=31)).replace(day=1)
 
-            to_create.append(
-                JobReceipt(
-                    job_uuid=receipt.payload.job_uuid,
-                    miner_hotkey=receipt.payload.miner_hotkey,
-                    validator_hotkey=receipt.payload.validator_hotkey,
-                    time_started=receipt.payload.time_started,
-                    time_took_us=receipt.payload.time_took_us,
-                    score_str=receipt.payload.score_str,
-                    executor_class=receipt.payload.executor_class,
-                )
-            )
 
-    JobReceipt.objects.bulk_create(to_create, ignore_conflicts=True)
+@app.task
+def refresh_miner_stats():
+    miner_stats.refresh_miner_stats()
 
 
 @app.task
-def fetch_receipts():
-    """Fetch job receipts from the miners."""
-    import bittensor
-
-    metagraph = bittensor.metagraph(netuid=settings.BITTENSOR_NETUID, network=settings.BITTENSOR_NETWORK)
-    miners = [neuron for neuron in metagraph.neurons if neuron.axon_info.is_serving]
-    for miner in miners:
-        fetch_receipts_from_miner.delay(miner.hotkey, miner.axon_info.ip, miner.axon_info.port)
+def prune_specs():
+    deleted, _ = ExecutorSpecs.objects.filter(measured_at__lt=now() - settings.SPECS_RETENTION).delete()
+    log.info("pruned specs", deleted=deleted)
 
 
 @app.task
-def refresh_specs_materialized_view():
-    log.info("Refreshing specs materialized view")
-    with connection.cursor() as cursor:
-        cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY specs")
+def archive_old_rows():
+    for policy in archive.ARCHIVE_POLICIES.values():
+        archived = archive.archive(policy)
+        log.info("archived old rows", archive=policy.name, archived=archived)
@@ -2,7 +2,6 @@ from datetime import timedelta
 
 import pytest
 import pytest_asyncio
-import responses
 from bittensor import Keypair
 from channels.testing import WebsocketCommunicator
 from django.contrib.auth.models import User
@@ -12,6 +11,15 @@ from freezegun import freeze_time
 from ...asgi import application
 from ..models import Channel, Job, JobStatus, Miner, Validator
 from ..schemas import AuthenticationRequest, JobStatusMetadata, JobStatusUpdate, MinerResponse
+from ..validator_registry import get_validator_registry
+
+
+@pytest.fixture(autouse=True)
+def validator_registry():
+    """Fresh in-memory validator registry for every test"""
+    get_validator_registry.cache_clear()
+    yield get_validator_registry()
+    get_validator_registry.cache_clear()
 
 
 @pytest_asyncio.fixture
@@ -61,8 +69,9 @@ def validator(db, keypair):
 
 
 @pytest_asyncio.fixture
-def connected_validator(db, validator):
+def connected_validator(db, validator, validator_registry):
     Channel.objects.create(name="test", validator=validator)
+    validator_registry.connect(validator.pk, "test")
     return validator
 
 
@@ -82,7 +91,7 @@ def user(db):
 
 
 @pytest.fixture
-def dummy_job_params(settings):
+def dummy_job_params():
     return dict(
         docker_image="",
         raw_script="import this",
@@ -90,8 +99,6 @@ def dummy_job_params(settings):
         env={"ENV1": "VALUE1"},
         input_url="http://localhost/input",
         output_upload_url="http://localhost/output/upload",
-        output_download_url="http://localhost/output/download",
-        output_download_url_expires_at=now() + settings.DOWNLOAD_PRESIGNED_URL_LIFETIME,
     )
 
 
@@ -207,9 +214,3 @@ async def miner_with_old_active_jobs(db, user, validator, dummy_job_params):
             await JobStatus.objects.acreate(job=job, status=JobStatus.Status.ACCEPTED)
 
     return miner
-
-
-@pytest.fixture
-def mocked_responses():
-    with responses.RequestsMock() as rsps:
-        yield rsps
@@ -3,3 +3,7 @@ import os
 os.environ["DEBUG_TOOLBAR"] = "False"
 
 from project.settings import *  # noqa: E402,F403
+
+VALIDATOR_REGISTRY = {
+    "BACKEND": "project.core.validator_registry.InMemoryValidatorRegistry",
+}
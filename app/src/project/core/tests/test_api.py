@@ -1,13 +1,25 @@
+import asyncio
+import json
 import time
+from datetime import timedelta
 from unittest.mock import patch
+from uuid import uuid4
 
 import pytest
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
 from compute_horde_facilitator_sdk.v1 import Signature
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import ErrorDetail
 from rest_framework.test import APIClient
 
-from project.core.models import Job, JobFeedback, SignatureInfo
+from project.core.miner_stats import refresh_miner_stats
+from project.core.models import Job, JobFeedback, JobReceipt, JobStatus, Miner, SignatureInfo
 from project.core.services.signatures import signature_info_from_signature
 
 
@@ -135,6 +147,35 @@ def test_job_viewset_list(api_client, user, job_docker, job_raw):
     check_raw_job(raw_result)
 
 
+@pytest.mark.django_db
+def test_job_viewset_list__constant_queries(api_client, user, connected_validator, miner):
+    """Listing jobs should not issue additional queries per job or per job status"""
+
+    def create_job():
+        job = Job.objects.create(user=user, validator=connected_validator, miner=miner, raw_script="print(1)")
+        JobStatus.objects.create(job=job, status=JobStatus.Status.ACCEPTED)
+        JobStatus.objects.create(job=job, status=JobStatus.Status.COMPLETED)
+
+    def get_query_count():
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get("/api/v1/jobs/")
+        assert response.status_code == 200
+        return len(context)
+
+    api_client.force_authenticate(user=user)
+
+    create_job()
+    count1 = get_query_count()
+
+    for _ in range(5):
+        create_job()
+    count2 = get_query_count()
+
+    assert count1 == count2
+    response = api_client.get("/api/v1/jobs/")
+    assert {job["status"] for job in response.data["results"]} == {"Completed"}
+
+
 @pytest.mark.django_db
 def test_job_viewset_list_object_permissions(api_client, user, job_docker, job_raw, another_user_job_raw):
     api_client.force_authenticate(user=user)
@@ -191,6 +232,145 @@ def test_docker_job_viewset_create(api_client, user, connected_validator, miner)
     assert job.user == user
 
 
+@pytest.mark.django_db
+def test_docker_job_viewset_bulk_create(api_client, user, connected_validator, miner):
+    api_client.force_authenticate(user=user)
+    data = [
+        {"docker_image": "hello-world", "args": "first"},
+        {"docker_image": "hello-world", "use_gpu": "maybe"},
+        {"docker_image": "hello-world", "args": "second"},
+    ]
+    response = api_client.post("/api/v1/job-docker/bulk/", data, format="json")
+    assert response.status_code == 200
+    first, invalid, no_miner = response.json()
+
+    # only one miner is available
+    assert first["status"] == "created"
+    assert first["job"]["args"] == "first"
+    assert first["job"]["status"] == "Sent"
+    assert invalid["status"] == "error"
+    assert "use_gpu" in invalid["errors"]
+    assert no_miner == {"status": "error", "errors": {"non_field_errors": ["Could not select Miner"]}}
+
+    job = Job.objects.get()
+    assert str(job.uuid) == first["job"]["uuid"]
+    assert job.validator == connected_validator
+    assert job.miner == miner
+    assert job.last_status == JobStatus.Status.SENT
+    assert job.statuses.get().status == JobStatus.Status.SENT
+    miner.refresh_from_db()
+    assert miner.busy_until == job.created_at + Job.JOB_TIMEOUT
+
+
+@pytest.mark.django_db
+def test_docker_job_viewset_bulk_create__send_failed(
+    api_client, user, connected_validator, miners, django_capture_on_commit_callbacks
+):
+    api_client.force_authenticate(user=user)
+    data = [{"docker_image": "hello-world", "args": "sent"}, {"docker_image": "hello-world", "args": "unsent"}]
+    channel_layer = get_channel_layer()
+    with (
+        patch.object(type(channel_layer), "send", side_effect=[None, ChannelFull()]),
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = api_client.post("/api/v1/job-docker/bulk/", data, format="json")
+
+    # both jobs were committed before sending, so both are returned...
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()] == ["created", "created"]
+
+    # ...but the one which could not be sent is failed, releasing its miner
+    sent, unsent = Job.objects.order_by("args")
+    assert sent.last_status == JobStatus.Status.SENT
+    assert unsent.last_status == JobStatus.Status.FAILED
+    assert unsent.statuses.get(status=JobStatus.Status.FAILED).metadata == {"comment": "Could not send job"}
+    assert Miner.objects.available().count() == len(miners) - 1
+
+
+@pytest.mark.django_db
+def test_docker_job_viewset_bulk_create__not_a_list(api_client, user):
+    api_client.force_authenticate(user=user)
+    response = api_client.post("/api/v1/job-docker/bulk/", {"docker_image": "hello-world"}, format="json")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_job_events__single_job(user, job_docker):
+    token = await Token.objects.acreate(user=user)
+    response = await AsyncClient().get(
+        f"/api/v1/job-events/?uuid={job_docker.uuid}", headers={"Authorization": f"Token {token.key}"}
+    )
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/event-stream"
+
+    events = aiter(response.streaming_content)
+    assert await anext(events) == b": connected\n\n"
+    assert b'"status": "Sent"' in await anext(events)
+
+    await JobStatus.objects.acreate(job=job_docker, status=JobStatus.Status.COMPLETED)
+    event = await asyncio.wait_for(anext(events), timeout=3)
+    assert event.startswith(b"event: status\n")
+    assert b'"status": "Completed"' in event
+
+    # stream ends when the job is completed
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(anext(events), timeout=3)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_job_events__tag(user, job_docker, job_raw):
+    job_raw.tag = "followed"
+    await job_raw.asave(update_fields=["tag"])
+    token = await Token.objects.acreate(user=user)
+    response = await AsyncClient().get(
+        "/api/v1/job-events/?tag=followed", headers={"Authorization": f"Token {token.key}"}
+    )
+    assert response.status_code == 200
+
+    events = aiter(response.streaming_content)
+    assert await anext(events) == b": connected\n\n"
+    await JobStatus.objects.acreate(job=job_docker, status=JobStatus.Status.ACCEPTED)
+    await JobStatus.objects.acreate(job=job_raw, status=JobStatus.Status.ACCEPTED)
+    event = await asyncio.wait_for(anext(events), timeout=3)
+    assert str(job_raw.uuid).encode() in event
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_job_events__bulk_submitted(user, connected_validator, miners):
+    token = await Token.objects.acreate(user=user)
+    headers = {"Authorization": f"Token {token.key}"}
+    response = await AsyncClient().get("/api/v1/job-events/", headers=headers)
+    events = aiter(response.streaming_content)
+    assert await anext(events) == b": connected\n\n"
+
+    data = [{"docker_image": "hello-world", "args": str(i)} for i in range(2)]
+    response = await AsyncClient().post(
+        "/api/v1/job-docker/bulk/", data, content_type="application/json", headers=headers
+    )
+    assert response.status_code == 200
+    uuids = {result["job"]["uuid"] for result in response.json()}
+
+    received = [json.loads((await asyncio.wait_for(anext(events), timeout=3)).split(b"data: ")[1]) for _ in uuids]
+    assert {event["uuid"] for event in received} == uuids
+    assert {event["status"] for event in received} == {"Sent"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_job_events__permissions(another_user, job_docker):
+    response = await AsyncClient().get("/api/v1/job-events/")
+    assert response.status_code == 401
+
+    token = await Token.objects.acreate(user=another_user)
+    response = await AsyncClient().get(
+        f"/api/v1/job-events/?uuid={job_docker.uuid}", headers={"Authorization": f"Token {token.key}"}
+    )
+    assert response.status_code == 404
+
+
 def test_job_feedback__create__requires_signature(authenticated_api_client):
     response = authenticated_api_client.put("/api/v1/jobs/123/feedback/", {"result_correctness": 1})
     assert (response.status_code, response.data) == (
@@ -234,3 +414,76 @@ def test_job_feedback__already_exists(authenticated_api_client, mock_signature_i
         {"detail": ErrorDetail(string="Feedback already exists", code="conflict")},
     )
     assert JobFeedback.objects.get() == job_feedback
+
+
+@pytest.mark.django_db
+def test_miner_stats(authenticated_api_client):
+    def make_receipt(miner_hotkey: str, time_took: timedelta, age: timedelta = timedelta()) -> JobReceipt:
+        return JobReceipt(
+            job_uuid=uuid4(),
+            miner_hotkey=miner_hotkey,
+            validator_hotkey="validator",
+            time_started=now() - age,
+            time_took_us=int(time_took.total_seconds() * 1_000_000),
+            score_str="2.0",
+        )
+
+    JobReceipt.objects.bulk_create_with_stats(
+        [make_receipt("miner1", timedelta(seconds=1)) for _ in range(18)]
+        + [make_receipt("miner1", timedelta(seconds=10)) for _ in range(2)]
+        + [make_receipt("miner2", timedelta(seconds=1))]
+        + [make_receipt("miner2", timedelta(seconds=1), age=timedelta(days=2))]
+    )
+    refresh_miner_stats()
+
+    response = authenticated_api_client.get("/api/v1/miners/stats/", {"page_size": 1})
+    assert response.status_code == 200
+    [miner1] = response.data["results"]
+    assert miner1["miner_hotkey"] == "miner1"
+    assert miner1["count"] == 20
+    assert miner1["time_took_p50"] == pytest.approx(1, rel=0.125)
+    assert miner1["time_took_p95"] == pytest.approx(10, rel=0.125)
+    assert miner1["average_score"] == 2.0
+
+    response = authenticated_api_client.get(response.data["next"])
+    assert [(miner["miner_hotkey"], miner["count"]) for miner in response.data["results"]] == [("miner2", 1)]
+    assert response.data["next"] is None
+
+    response = authenticated_api_client.get("/api/v1/miners/stats/", {"window": "7d"})
+    assert [(miner["miner_hotkey"], miner["count"]) for miner in response.data["results"]] == [
+        ("miner1", 20),
+        ("miner2", 2),
+    ]
+
+    response = authenticated_api_client.get("/api/v1/miners/stats/", {"window": "1y"})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_miner_stats__etag(authenticated_api_client):
+    JobReceipt.objects.bulk_create_with_stats(
+        [
+            JobReceipt(
+                job_uuid=uuid4(),
+                miner_hotkey="miner",
+                validator_hotkey="validator",
+                time_started=now(),
+                time_took_us=1_000_000,
+                score_str="1.0",
+            )
+        ]
+    )
+    refresh_miner_stats()
+
+    response = authenticated_api_client.get("/api/v1/miners/stats/")
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    response = authenticated_api_client.get("/api/v1/miners/stats/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    # every refresh makes a new version, even if nothing changed
+    refresh_miner_stats()
+    response = authenticated_api_client.get("/api/v1/miners/stats/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..heartbeats import HeartbeatBuffer
+from ..models import Channel
+
+
+def count_flush_queries(buffer: HeartbeatBuffer) -> int:
+    # queries are made over the connection of the sync thread, so they are captured there
+    with CaptureQueriesContext(connection) as queries:
+        async_to_sync(buffer.flush)()
+    return len(queries)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test__heartbeat_buffer__flushes_in_bulk(settings, validator):
+    settings.HEARTBEAT_FLUSH_INTERVAL = timedelta(hours=1)
+    created = {
+        name: await Channel.objects.acreate(name=name, validator=validator) for name in ["first", "second", "third"]
+    }
+    buffer = HeartbeatBuffer()
+
+    # first heartbeat is written right away
+    await buffer.record("first")
+    assert buffer.num_batches == 1
+    first = await Channel.objects.aget(name="first")
+    assert first.last_heartbeat > created["first"].last_heartbeat
+
+    # following ones wait for the flush interval
+    await buffer.record("first")
+    await buffer.record("second")
+    await buffer.record("third")
+    assert buffer.num_batches == 1
+    assert (await Channel.objects.aget(name="second")).last_heartbeat == created["second"].last_heartbeat
+
+    assert await sync_to_async(count_flush_queries)(buffer) == 1
+    assert buffer.num_batches == 2
+    assert buffer.last_batch_size == 3
+    assert buffer.num_flushed == 4
+
+    channels = {channel.name: channel async for channel in Channel.objects.all()}
+    assert channels["first"].last_heartbeat > first.last_heartbeat
+    assert channels["second"].last_heartbeat > created["second"].last_heartbeat
+    assert channels["third"].last_heartbeat > created["third"].last_heartbeat
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test__heartbeat_buffer__discard(settings, validator):
+    settings.HEARTBEAT_FLUSH_INTERVAL = timedelta(hours=1)
+    channel = await Channel.objects.acreate(name="test", validator=validator)
+    buffer = HeartbeatBuffer()
+    await buffer.record("other")
+
+    await buffer.record("test")
+    buffer.discard("test")
+    await buffer.flush()
+
+    assert (await Channel.objects.aget(name="test")).last_heartbeat == channel.last_heartbeat
+    assert buffer.num_batches == 1
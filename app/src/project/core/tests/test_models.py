@@ -1,18 +1,22 @@
+import asyncio
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from datetime import timedelta
 from uuid import uuid4
 
+import boto3
 import pytest
 import requests
+from django.core.cache import cache
 from django.db import connection, transaction
 from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from freezegun import freeze_time
 
-from ..models import Channel, Job, JobStatus, Miner, UserPreferences, Validator
-from ..utils import create_signed_download_url, create_signed_upload_url
+from ..models import Channel, HourlyJobReceiptStats, Job, JobReceipt, JobStatus, Miner, UserPreferences, Validator
+from ..utils import S3Presigner, create_signed_download_url, create_signed_upload_url
 
 
 @pytest.mark.django_db(transaction=True)
@@ -27,6 +31,29 @@ def test__job__autocreating_signed_urls(user, validator, miner, settings):
     assert job.output_download_url
 
 
+@pytest.mark.parametrize("endpoint_url", ["https://account.r2.cloudflarestorage.com", "http://localhost:9000"])
+@pytest.mark.parametrize("key", ["output.zip", "some dir/ü+~=&.zip"])
+@pytest.mark.parametrize("timestamp", ["2024-07-16 09:41:00", "2024-12-31 23:59:59"])
+def test__signed_url__same_as_boto3(endpoint_url, key, timestamp):
+    credentials = dict(aws_access_key_id="access-key", aws_secret_access_key="secret/key+", region_name="auto")
+    client = boto3.client(service_name="s3", endpoint_url=endpoint_url, **credentials)
+    presigner = S3Presigner(
+        endpoint_url=endpoint_url,
+        access_key_id=credentials["aws_access_key_id"],
+        secret_access_key=credentials["aws_secret_access_key"],
+        region_name=credentials["region_name"],
+    )
+
+    with freeze_time(timestamp):
+        for method, client_method in (("PUT", "put_object"), ("GET", "get_object")):
+            expected = client.generate_presigned_url(
+                ClientMethod=client_method,
+                Params={"Bucket": "bucket", "Key": key},
+                ExpiresIn=3600,
+            )
+            assert presigner.generate_presigned_url(method, "bucket", key, 3600) == expected
+
+
 @pytest.mark.skip(reason="this makes actual request - cannot have this in CI")
 def test__signed_url__uploading_and_downloading(settings):
     settings.OUTPUT_PRESIGNED_URL_LIFETIME = timedelta(seconds=30)
@@ -52,34 +79,22 @@ def test__signed_url__uploading_and_downloading(settings):
 
 
 @pytest.mark.django_db(transaction=True)
-def test__job__output_url_expiration(settings, user, validator, communicator, authenticated, miner):
-    """Check that output urls are created with correct expiration time and it works"""
+def test__job__download_url_caching(settings, job, monkeypatch):
+    """Check that download URLs are generated on demand, without touching the database, and reused for a while"""
 
-    settings.DOWNLOAD_PRESIGNED_URL_LIFETIME = timedelta(seconds=30)
+    settings.DOWNLOAD_URL_CACHE_TIMEOUT = timedelta(seconds=30)
+    urls = iter(["http://localhost/download/1", "http://localhost/download/2"])
+    monkeypatch.setattr("project.core.models.create_signed_download_url", lambda _: next(urls))
+    cache.delete(f"job_download_url:{job.uuid}")
 
     now_ = now()
-    with freeze_time(now_):
-        job = Job.objects.create(
-            user=user,
-            validator=None,
-            raw_script="import this",
-            output_upload_url="http://localhost/output/upload",
-        )
-        assert job.output_download_url
-        assert job.output_download_url_expires_at == now_ + timedelta(seconds=30)
-        assert job.is_download_url_expired() is False
-
-    with freeze_time(now_ + timedelta(seconds=30)):
-        assert job.is_download_url_expired() is False
+    with freeze_time(now_), CaptureQueriesContext(connection) as queries:
+        assert job.output_download_url == "http://localhost/download/1"
+        assert Job.objects.get(pk=job.pk).output_download_url == "http://localhost/download/1"
+    assert len(queries) == 1
 
     with freeze_time(now_ + timedelta(seconds=31)):
-        assert job.is_download_url_expired() is True
-
-    with freeze_time(now_ + timedelta(seconds=60)):
-        job.save()
-
-        assert job.output_download_url_expires_at == now_ + timedelta(seconds=90)
-        assert job.is_download_url_expired() is False
+        assert job.output_download_url == "http://localhost/download/2"
 
 
 @pytest.mark.django_db(transaction=True)
@@ -90,7 +105,6 @@ def test__job__selecting_validator__failure__not_exist(user):
             validator=None,
             raw_script="import this",
             output_upload_url="http://localhost/output/upload",
-            output_download_url="http://localhost/output/download",
         )
 
 
@@ -103,7 +117,6 @@ def test__job__selecting_validator__failure__not_connected(user, validator):
             validator=None,
             raw_script="import this",
             output_upload_url="http://localhost/output/upload",
-            output_download_url="http://localhost/output/download",
         )
 
 
@@ -116,7 +129,6 @@ def test__job__selecting_validator__failure__not_authorized(user, validator, com
             validator=None,
             raw_script="import this",
             output_upload_url="http://localhost/output/upload",
-            output_download_url="http://localhost/output/download",
         )
 
 
@@ -128,13 +140,14 @@ def test__job__selecting_validator__success(user, validator, communicator, authe
         validator=None,
         raw_script="import this",
         output_upload_url="http://localhost/output/upload",
-        output_download_url="http://localhost/output/download",
     )
     assert job.validator == validator
 
 
 @pytest.mark.django_db(transaction=True)
-def test__job__selecting_validator__user_preference(user, validator, communicator, authenticated, miners):
+def test__job__selecting_validator__user_preference(
+    user, validator, communicator, authenticated, miners, validator_registry
+):
     """Check that new job is assigned to user's preferred validators first"""
 
     # make two preferred validators for the user and connect them
@@ -142,6 +155,8 @@ def test__job__selecting_validator__user_preference(user, validator, communicato
     preferred_validator2 = Validator.objects.create(ss58_address="specific_validator2", is_active=True)
     channel1 = Channel.objects.create(name="test1", validator=preferred_validator1)
     channel2 = Channel.objects.create(name="test2", validator=preferred_validator2)
+    validator_registry.connect(preferred_validator1.pk, channel1.name)
+    validator_registry.connect(preferred_validator2.pk, channel2.name)
 
     preferences = UserPreferences.objects.create(user=user)
     preferences.validators.add(preferred_validator1)
@@ -154,7 +169,6 @@ def test__job__selecting_validator__user_preference(user, validator, communicato
         validator=None,
         raw_script="import this",
         output_upload_url="http://localhost/output/upload",
-        output_download_url="http://localhost/output/download",
     )
 
     # no matter how many times we request job, only preferred validators are chosen
@@ -163,6 +177,8 @@ def test__job__selecting_validator__user_preference(user, validator, communicato
         assert job.validator in (preferred_validator1, preferred_validator2)
 
     # now disconnect preferred validators and ensure that other validator is chosen
+    validator_registry.disconnect(preferred_validator1.pk, channel1.name)
+    validator_registry.disconnect(preferred_validator2.pk, channel2.name)
     channel1.delete()
     channel2.delete()
     job = Job.objects.create(**job_kwargs)
@@ -186,7 +202,6 @@ def test__job__selecting_miner__user_preference(user, validator, communicator, a
         validator=validator,
         raw_script="import this",
         output_upload_url="http://localhost/output/upload",
-        output_download_url="http://localhost/output/download",
     )
 
     # no matter how many times we request job, only preferred miners are chosen
@@ -215,7 +230,6 @@ async def test__job__selecting_miner__doesnt_exist(user, validator, communicator
             miner=None,
             raw_script="import this",
             output_upload_url="http://localhost/output/upload",
-            output_download_url="http://localhost/output/download",
         )
 
 
@@ -238,7 +252,6 @@ async def test__job__selecting_miner__unavailable(
             miner=None,
             raw_script="import this",
             output_upload_url="http://localhost/output/upload",
-            output_download_url="http://localhost/output/download",
         )
 
 
@@ -381,3 +394,143 @@ def test__job__selecting_miner__constant_queries(
     count2 = get_query_count()
 
     assert count1 == count2
+
+
+@pytest.mark.django_db(transaction=True)
+def test__job_status__updates_job_last_status(job, job_status_update):
+    status = JobStatus.objects.create(
+        job=job,
+        status=JobStatus.Status.ACCEPTED,
+        metadata=job_status_update.metadata.dict(),
+    )
+    assert (job.last_status, job.last_status_at, job.last_stdout) == (
+        JobStatus.Status.ACCEPTED,
+        status.created_at,
+        "some stdout",
+    )
+    job.refresh_from_db()
+    assert (job.last_status, job.last_status_at, job.last_stdout) == (
+        JobStatus.Status.ACCEPTED,
+        status.created_at,
+        "some stdout",
+    )
+    assert job.get_last_status_display() == "Accepted"
+
+    # status older than the current one does not override it
+    JobStatus.objects.create(
+        job=job,
+        status=JobStatus.Status.FAILED,
+        created_at=status.created_at - timedelta(seconds=1),
+    )
+    job.refresh_from_db()
+    assert job.last_status == JobStatus.Status.ACCEPTED
+
+
+@pytest.mark.django_db(transaction=True)
+def test__job__save__does_not_overwrite_last_status(job):
+    stale_job = Job.objects.get(pk=job.pk)
+    JobStatus.objects.create(job=job, status=JobStatus.Status.COMPLETED)
+
+    stale_job.tag = "some tag"
+    stale_job.save()
+
+    stale_job.refresh_from_db()
+    assert stale_job.tag == "some tag"
+    assert stale_job.last_status == JobStatus.Status.COMPLETED
+    assert stale_job.is_completed()
+
+
+@pytest.mark.django_db(transaction=True)
+def test__job__miner_availability(user, validator, miner, dummy_job_params):
+    """Miner is busy from job assignment until the job finishes, unless it got another job in the meantime"""
+
+    job1 = Job.objects.create(user=user, validator=validator, miner=miner, **dummy_job_params)
+    miner.refresh_from_db()
+    assert miner.last_assigned_at == job1.created_at
+    assert miner.busy_until == job1.created_at + Job.JOB_TIMEOUT
+    assert not Miner.objects.available().exists()
+
+    job2 = Job.objects.create(user=user, validator=validator, miner=miner, **dummy_job_params)
+    JobStatus.objects.create(job=job1, status=JobStatus.Status.COMPLETED)
+    assert not Miner.objects.available().exists()
+
+    JobStatus.objects.create(job=job2, status=JobStatus.Status.FAILED)
+    assert list(Miner.objects.available()) == [miner]
+
+    # miner is not kept busy by a job which has timed out
+    with freeze_time(now() - Job.JOB_TIMEOUT - timedelta(seconds=1)):
+        timed_out_miner = Miner.objects.create(ss58_address="timed-out-miner", is_active=True)
+        Job.objects.create(user=user, validator=validator, miner=timed_out_miner, **dummy_job_params)
+    assert set(Miner.objects.available()) == {miner, timed_out_miner}
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test__job__await_completed(job):
+    """Waiters are woken up by new statuses instead of polling"""
+
+    waiter = asyncio.create_task(job.await_completed())
+    await JobStatus.objects.acreate(job=job, status=JobStatus.Status.ACCEPTED)
+    await asyncio.sleep(0.5)
+    assert not waiter.done()
+
+    await JobStatus.objects.acreate(job=job, status=JobStatus.Status.COMPLETED)
+    status = await asyncio.wait_for(waiter, timeout=1)
+    assert status.status == JobStatus.Status.COMPLETED
+
+
+@pytest.mark.django_db(transaction=True)
+def test__job__wait_completed(job):
+    def complete():
+        time.sleep(0.5)
+        JobStatus.objects.create(job=job, status=JobStatus.Status.FAILED)
+
+    thread = threading.Thread(target=complete)
+    start = time.monotonic()
+    thread.start()
+    status = job.wait_completed()
+    thread.join()
+
+    assert status.status == JobStatus.Status.FAILED
+    assert time.monotonic() - start < 2
+
+
+@pytest.mark.django_db
+def test__job_receipt__bulk_create_with_stats():
+    hour = now().replace(minute=0, second=0, microsecond=0)
+
+    def make_receipt(minutes: int, score: float, validator_hotkey: str = "validator") -> JobReceipt:
+        return JobReceipt(
+            job_uuid=uuid4(),
+            miner_hotkey="miner",
+            validator_hotkey=validator_hotkey,
+            time_started=hour + timedelta(minutes=minutes),
+            time_took_us=1_000_000,
+            score_str=str(score),
+        )
+
+    receipts = [make_receipt(0, 1.0), make_receipt(59, 2.0), make_receipt(60, 3.0), make_receipt(0, 4.0, "other")]
+    assert JobReceipt.objects.bulk_create_with_stats(receipts) == 4
+    # receipts stored already are not counted again
+    assert JobReceipt.objects.bulk_create_with_stats([receipts[0], receipts[0], make_receipt(1, 3.0)]) == 1
+
+    assert JobReceipt.objects.count() == 5
+    stats = HourlyJobReceiptStats.objects.get(hour=hour, validator_hotkey="validator")
+    assert stats.count == 3
+    assert stats.total_time_took_us == 3_000_000
+    assert stats.average_score == 2.0
+    assert stats.time_took_histogram == {"21": 3}
+    assert HourlyJobReceiptStats.objects.get(hour=hour + timedelta(hours=1)).count == 1
+    assert HourlyJobReceiptStats.objects.get(hour=hour, validator_hotkey="other").count == 1
+
+
+def test__hourly_job_receipt_stats__estimate_time_took_percentile():
+    estimate = HourlyJobReceiptStats.estimate_time_took_percentile
+    assert estimate({}, 50) is None
+    # 1s falls into bucket 21 (867ms - 1084ms), 10s into bucket 31
+    histogram = {"21": 90, "31": 10}
+    assert estimate(histogram, 50) == 969_739
+    assert estimate(histogram, 90) == 969_739
+    assert 9_000_000 < estimate(histogram, 95) < 11_000_000
+    assert estimate({"0": 1}, 50) == 10_000
+    assert estimate({"72": 1}, 50) == HourlyJobReceiptStats.TIME_TOOK_HISTOGRAM_BOUNDARIES_US[-1]
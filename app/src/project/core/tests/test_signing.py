@@ -1,3 +1,6 @@
+from ..services.verification import clear_caches, get_stats
+
+
 def test__signing__low_level(keypair):
     payload = keypair.public_key
     signature = f"0x{keypair.sign(payload).hex()}"
@@ -11,3 +14,19 @@ def test__signing__authentication_request__success(authentication_request):
 def test__signing__authentication_request__failure(keypair, authentication_request, other_signature):
     authentication_request.signature = other_signature
     assert not authentication_request.verify_signature()
+
+
+def test__signing__authentication_request__cached(keypair, authentication_request, other_signature):
+    clear_caches()
+    valid_signature = authentication_request.signature
+
+    for _ in range(2):
+        authentication_request.signature = valid_signature
+        assert authentication_request.verify_signature()
+        assert authentication_request.ss58_address == keypair.ss58_address
+        authentication_request.signature = other_signature
+        assert not authentication_request.verify_signature()
+
+    stats = get_stats()
+    assert stats["public_key_keypairs"] == {"hits": 5, "misses": 1, "size": 1}
+    assert stats["verified_signatures"] == {"hits": 2, "misses": 2, "size": 2}
@@ -1,19 +1,35 @@
+import io
+import json
+from unittest.mock import patch
 from uuid import uuid4
 
 import pytest
+from django.core.management import call_command
 
+from project.asgi import lifespan_application
 from project.core.schemas import MachineSpecs
-from project.core.specs import process_raw_specs_data, save_machine_specs
+from project.core.specs import (
+    MachineSpecsWriter,
+    cpu_specs_ids,
+    gpu_ids,
+    machine_specs_writer,
+    other_specs_ids,
+    parsed_raw_specs,
+    process_raw_specs_data,
+    save_machine_specs,
+)
 
 from ..models import (
     GPU,
     CpuSpecs,
+    ExecutorSpecs,
     ExecutorSpecsSnapshot,
     GpuSpecs,
     Miner,
     OtherSpecs,
     ParsedSpecsData,
     RawSpecsData,
+    TrustedValidator,
     Validator,
 )
 
@@ -62,6 +78,17 @@ dummy_specs: dict = {
 }
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # tables are flushed between tests, bypassing signals which invalidate the caches
+    caches = [parsed_raw_specs, cpu_specs_ids, other_specs_ids, gpu_ids]
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
+
+
 async def setup_db():
     await Validator.objects.acreate(ss58_address="validator_hotkey", is_active=True)
     await Miner.objects.acreate(ss58_address="miner_hotkey", is_active=True)
@@ -91,6 +118,83 @@ async def test_machine_specs_udpate():
     assert await ParsedSpecsData.objects.acount() == 1
 
 
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_machine_specs_update__known_raw_specs_not_looked_up():
+    await setup_db()
+    message = MachineSpecs(specs=dummy_specs, miner_hotkey="miner_hotkey", validator_hotkey="validator_hotkey")
+    await save_machine_specs(message)
+    raw_specs = await RawSpecsData.objects.aget()
+    assert raw_specs.data_hash == RawSpecsData.hash_data(raw_specs.data)
+
+    # variable fields are not part of the hash
+    other_message = message.copy(deep=True)
+    other_message.specs["ram"]["free"] += 1
+    with patch.object(RawSpecsData.objects, "abulk_create", side_effect=AssertionError("unexpected lookup")):
+        await save_machine_specs(other_message)
+
+    assert await ExecutorSpecsSnapshot.objects.filter(raw_specs=raw_specs).acount() == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_machine_specs_writer(settings):
+    settings.MACHINE_SPECS_BATCH_SIZE = 3
+    await setup_db()
+    await Miner.objects.acreate(ss58_address="other_miner_hotkey", is_active=True)
+    other_specs = {**dummy_specs, "os": "Debian"}
+    messages = [
+        MachineSpecs(specs=dummy_specs, miner_hotkey="miner_hotkey", validator_hotkey="validator_hotkey"),
+        MachineSpecs(specs=other_specs, miner_hotkey="other_miner_hotkey", validator_hotkey="validator_hotkey"),
+        MachineSpecs(specs=dummy_specs, miner_hotkey="unknown_miner_hotkey", validator_hotkey="validator_hotkey"),
+        MachineSpecs(specs=dummy_specs, miner_hotkey="other_miner_hotkey", validator_hotkey="validator_hotkey"),
+    ]
+
+    writer = MachineSpecsWriter()
+    for message in messages:
+        writer.put(message)
+    # nothing is stored until the batch is written
+    assert await ExecutorSpecsSnapshot.objects.acount() == 0
+    await writer.close()
+
+    assert writer.num_batches == 2
+    assert writer.num_written == 4
+    assert await RawSpecsData.objects.acount() == 2
+    assert await ParsedSpecsData.objects.acount() == 2
+    snapshots = [
+        (snapshot.miner.ss58_address, snapshot.raw_specs.data["os"])
+        async for snapshot in ExecutorSpecsSnapshot.objects.select_related("miner", "raw_specs").order_by("pk")
+    ]
+    assert snapshots == [
+        ("miner_hotkey", "Ubuntu Noble Numbat"),
+        ("other_miner_hotkey", "Debian"),
+        ("other_miner_hotkey", "Ubuntu Noble Numbat"),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_lifespan_shutdown_stores_buffered_machine_specs():
+    await setup_db()
+    machine_specs_writer.put(
+        MachineSpecs(specs=dummy_specs, miner_hotkey="miner_hotkey", validator_hotkey="validator_hotkey")
+    )
+    assert await ExecutorSpecsSnapshot.objects.acount() == 0
+
+    received = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(received)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    await lifespan_application({"type": "lifespan"}, receive, send)
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert await ExecutorSpecsSnapshot.objects.acount() == 1
+
+
 @pytest.mark.asyncio
 @pytest.mark.django_db(transaction=True)
 async def test_process_raw_specs_data():
@@ -120,3 +224,83 @@ async def test_process_raw_specs_data():
     gpu_spec = await GpuSpecs.objects.filter(gpu_model=gpu_model).afirst()
     assert gpu_spec.capacity == 40960
     assert gpu_spec.gpu_count == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_process_raw_specs_data__dimensions_cached():
+    await setup_db()
+    await process_raw_specs_data(await RawSpecsData.objects.acreate(data=dummy_specs))
+    assert gpu_ids.misses == 2
+
+    other_specs = {**dummy_specs, "os": "Debian"}
+    raw_specs_data = await RawSpecsData.objects.acreate(data=other_specs)
+    with patch.object(GPU.objects, "abulk_create", side_effect=AssertionError("unexpected insert")):
+        await process_raw_specs_data(raw_specs_data)
+
+    assert (cpu_specs_ids.hits, gpu_ids.hits, other_specs_ids.hits) == (1, 2, 0)
+    assert await CpuSpecs.objects.acount() == 1
+    assert await OtherSpecs.objects.acount() == 2
+    assert await GpuSpecs.objects.filter(parsed_specs_id=raw_specs_data.pk).acount() == 2
+
+    # GB totals are not whole numbers, they are looked up as stored
+    same_specs = {**dummy_specs, "ram": {**dummy_specs["ram"], "free": 1}}
+    await process_raw_specs_data(await RawSpecsData.objects.acreate(data=same_specs))
+    assert other_specs_ids.hits == 1
+    assert await OtherSpecs.objects.acount() == 2
+
+    # changed rows are looked up again
+    await GPU.objects.filter(name="5090X").adelete()
+    assert len(gpu_ids) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_process_raw_specs_command(tmp_path):
+    checkpoint = tmp_path / "checkpoint"
+    parsed = RawSpecsData.objects.create(data=dummy_specs)
+    ParsedSpecsData.objects.create(
+        id=parsed,
+        cpu_specs=CpuSpecs.objects.create(cpu_model="cpu", cpu_count=1),
+        other_specs=OtherSpecs.objects.create(os="os"),
+    )
+    skipped = RawSpecsData.objects.create(data={**dummy_specs, "os": "Debian"})
+    unparsed = [RawSpecsData.objects.create(data={**dummy_specs, "os": f"Ubuntu {i}"}) for i in range(5)]
+
+    # an interrupted run resumes after the checkpoint
+    checkpoint.write_text(json.dumps({"last_pk": skipped.pk}))
+    call_command("process_raw_specs", chunk_size=2, concurrency=2, checkpoint=checkpoint, stdout=io.StringIO())
+
+    assert set(ParsedSpecsData.objects.values_list("pk", flat=True)) == {parsed.pk} | {raw.pk for raw in unparsed}
+    assert GpuSpecs.objects.count() == 2 * len(unparsed)
+    assert not checkpoint.exists()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_machine_specs_update__appends_specs():
+    await setup_db()
+    await TrustedValidator.objects.acreate(ss58_address="validator_hotkey")
+    await Validator.objects.acreate(ss58_address="other_validator_hotkey", is_active=True)
+
+    message = MachineSpecs(
+        specs=dummy_specs, miner_hotkey="miner_hotkey", validator_hotkey="validator_hotkey", batch_id=str(uuid4())
+    )
+    await save_machine_specs(message)
+    # a row per GPU model
+    assert await ExecutorSpecs.objects.acount() == 2
+    specs = await ExecutorSpecs.objects.select_related("gpu").aget(gpu__name="A100 SXM4 40GB")
+    assert specs.miner_hotkey == "miner_hotkey"
+    assert str(specs.batch_id) == message.batch_id
+    assert specs.cpu_count == 48
+    assert specs.gpu_count == 2
+    assert specs.vram == 40960
+
+    # raw specs already parsed
+    await save_machine_specs(message)
+    assert await ExecutorSpecs.objects.acount() == 4
+
+    # specs reported to other validators are not stored
+    message.validator_hotkey = "other_validator_hotkey"
+    await save_machine_specs(message)
+    assert await ExecutorSpecs.objects.acount() == 4
+    assert await ExecutorSpecsSnapshot.objects.acount() == 3
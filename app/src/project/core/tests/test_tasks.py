@@ -1,15 +1,44 @@
 import csv
 import io
 import json
-from datetime import datetime
+import multiprocessing
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import partial
 from typing import NamedTuple
+from unittest.mock import patch
+from uuid import uuid4
 
+import httpx
 import pytest
 from asgiref.sync import sync_to_async
 from constance import config
-
-from ..models import Channel, JobReceipt, Validator
-from ..tasks import fetch_receipts, sync_metagraph
+from django.db import connection
+from django.utils.timezone import now
+from freezegun import freeze_time
+
+from .. import archive, tasks
+from ..models import (
+    Channel,
+    ExecutorSpecsSnapshot,
+    Job,
+    JobReceipt,
+    JobStatus,
+    Miner,
+    MinerReceiptsCursor,
+    RawSpecsData,
+    Validator,
+)
+from ..receipts import (
+    RECEIPTS_CUTOFF_TOLERANCE,
+    RECEIPTS_FUTURE_TOLERANCE,
+    MinerAddress,
+    ReceiptsCollector,
+    ReceiptVerifier,
+    parse_receipt,
+)
+from ..schemas import Receipt
+from ..tasks import dispatch_pending_jobs, fetch_receipts, sync_metagraph
 
 RAW_RECEIPT_PAYLOAD_1 = """{"payload":{"job_uuid":"01584e70-3242-40b6-be69-65bca9d423c2","miner_hotkey":"5GBm3LTJpUGrkX9FXTS65Fx3Cqpz9zThgPx6gPuNdhdjjLm3","validator_hotkey":"5HpWwsSCHhmFuBtQPskPbjM4As3oXHH8Mgh9NGbyyiuHPABx","time_started":"2024-07-02T18:31:41.259730Z","time_took_us":30000000,"score_str":"0.1234","executor_class":"spin_up-4min.gpu-24gb"},"validator_signature":"0x5cd3a2a17d1bd844b1654aca30db1e9b76f4312c5b6d937c446696a2ac2ef848de1b306cf655b402a8a41dc8f79c0880066b63f380251ab5d49ef6c11ad08888","miner_signature":"0xf231018a49d6c95ba1fdd2a41df56564627bddbad65e0722cb3bf17fee99d634d0aa7c0f35ed2ebb2f8ff981b285222cecc80c215d9e0887ced0c52ce32dfd86"}"""
 RAW_RECEIPT_PAYLOAD_2 = """{"payload":{"job_uuid":"d10f1c3e-f90f-4fda-bf1b-38bb6d633fc3","miner_hotkey":"5GBm3LTJpUGrkX9FXTS65Fx3Cqpz9zThgPx6gPuNdhdjjLm3","validator_hotkey":"5HpWwsSCHhmFuBtQPskPbjM4As3oXHH8Mgh9NGbyyiuHPABx","time_started":"2024-07-02T18:32:34.172187Z","time_took_us":30000000,"score_str":"0.1234","executor_class":"spin_up-4min.gpu-24gb"},"validator_signature":"0xb0ab8d589348661ea3f0f990e3bcecf73bdd0e7d57589f8c21f74af8ffcb22024f41754b15ce97161353996b960d84c8a56785d383381a552263f473a861938d","miner_signature":"0xe049797f3120e781793e93aea5874887ff81c2f4a4fb3280f2fb28ba5f501f0dc29a8c6785fc89ca79bf901846f1fccf5b951a26ddd6ab710a2e4fd0f0ea6f8c"}"""
@@ -229,22 +258,23 @@ async def test__websocket__disconnect_validator_if_become_inactive(
         await communicator.receive_json_from()
 
 
-def fetch_receipts_test_helper(monkeypatch, mocked_responses, raw_receipt_payloads):
+def make_receipts_csv(raw_receipt_payloads, header=True) -> str:
     buf = io.StringIO()
     csv_writer = csv.writer(buf)
-    csv_writer.writerow(
-        [
-            "job_uuid",
-            "miner_hotkey",
-            "validator_hotkey",
-            "time_started",
-            "time_took_us",
-            "score_str",
-            "executor_class",
-            "validator_signature",
-            "miner_signature",
-        ]
-    )
+    if header:
+        csv_writer.writerow(
+            [
+                "job_uuid",
+                "miner_hotkey",
+                "validator_hotkey",
+                "time_started",
+                "time_took_us",
+                "score_str",
+                "executor_class",
+                "validator_signature",
+                "miner_signature",
+            ]
+        )
     for raw_receipt_payload in raw_receipt_payloads:
         receipt = json.loads(raw_receipt_payload)
         payload = receipt.get("payload", {})
@@ -262,12 +292,16 @@ def fetch_receipts_test_helper(monkeypatch, mocked_responses, raw_receipt_payloa
             ]
         )
 
-    buf.seek(0)
+    return buf.getvalue()
+
+
+def fetch_receipts_test_helper(monkeypatch, raw_receipt_payloads):
+    receipts_csv = make_receipts_csv(raw_receipt_payloads)
 
-    mocked_responses.get(
-        "http://127.0.0.1:8000/receipts/receipts.csv", status=404
-    )  # this one should be gracefully ignored
-    mocked_responses.get("http://127.0.0.2:8000/receipts/receipts.csv", body=buf.read())
+    def handle_request(request: httpx.Request) -> httpx.Response:
+        if request.url == "http://127.0.0.2:8000/receipts/receipts.csv":
+            return httpx.Response(200, text=receipts_csv)
+        return httpx.Response(404)  # this one should be gracefully ignored
 
     class MockedMetagraph:
         def __init__(self, *args, **kwargs):
@@ -288,12 +322,15 @@ def fetch_receipts_test_helper(monkeypatch, mocked_responses, raw_receipt_payloa
         import bittensor
 
         mp.setattr(bittensor, "metagraph", MockedMetagraph)
+        mp.setattr(
+            tasks, "ReceiptsCollector", partial(ReceiptsCollector, transport=httpx.MockTransport(handle_request))
+        )
         fetch_receipts()
 
 
 @pytest.mark.django_db(transaction=True)
-def test__fetch_receipts__happy_path(monkeypatch, mocked_responses):
-    fetch_receipts_test_helper(monkeypatch, mocked_responses, [RAW_RECEIPT_PAYLOAD_1, RAW_RECEIPT_PAYLOAD_2])
+def test__fetch_receipts__happy_path(monkeypatch):
+    fetch_receipts_test_helper(monkeypatch, [RAW_RECEIPT_PAYLOAD_1, RAW_RECEIPT_PAYLOAD_2])
 
     assert JobReceipt.objects.all().count() == 2
 
@@ -309,22 +346,86 @@ def test__fetch_receipts__happy_path(monkeypatch, mocked_responses):
 
 
 @pytest.mark.django_db(transaction=True)
-def test__fetch_receipts__invalid_receipt_skipped(monkeypatch, mocked_responses):
+def test__fetch_receipts__older_than_cutoff_skipped(monkeypatch):
+    time_started_1 = datetime.fromisoformat(json.loads(RAW_RECEIPT_PAYLOAD_1)["payload"]["time_started"])
+    JobReceipt.objects.create(
+        job_uuid=uuid4(),
+        miner_hotkey=MINER_HOTKEY,
+        validator_hotkey="validator",
+        time_started=time_started_1 + RECEIPTS_CUTOFF_TOLERANCE + timedelta(seconds=10),
+        time_took_us=1,
+        score_str="1",
+    )
+    fetch_receipts_test_helper(monkeypatch, [RAW_RECEIPT_PAYLOAD_1, RAW_RECEIPT_PAYLOAD_2])
+
+    # only the receipt started within the tolerance of the latest stored one should be added
+    assert JobReceipt.objects.all().count() == 2
+    assert JobReceipt.objects.filter(job_uuid=json.loads(RAW_RECEIPT_PAYLOAD_2)["payload"]["job_uuid"]).exists()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test__receipts_collector__fetches_only_new_receipts():
+    receipts_csv = make_receipts_csv([RAW_RECEIPT_PAYLOAD_1]).encode()
+    requests = []
+
+    def handle_request(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        etag = f'"{len(receipts_csv)}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        start = int(request.headers.get("Range", "bytes=0-").removeprefix("bytes=").removesuffix("-"))
+        return httpx.Response(
+            206 if start else 200,
+            content=receipts_csv[start:],
+            headers={"ETag": etag, "Content-Range": f"bytes {start}-{len(receipts_csv) - 1}/{len(receipts_csv)}"},
+        )
+
+    collector = ReceiptsCollector(transport=httpx.MockTransport(handle_request))
+    miners = [MinerAddress(hotkey=MINER_HOTKEY, ip="127.0.0.2", port=8000)]
+    assert await collector.collect(miners) == 1
+
+    # unchanged file is not sent again
+    assert await collector.collect(miners) == 0
+    assert requests[-1].headers["If-None-Match"] == f'"{len(receipts_csv)}"'
+
+    # only the tail of a grown file is requested
+    offset = len(receipts_csv)
+    receipts_csv += make_receipts_csv([RAW_RECEIPT_PAYLOAD_2], header=False).encode()
+    assert await collector.collect(miners) == 1
+    assert requests[-1].headers["Range"] == f"bytes={offset - 1}-"
+
+    assert await JobReceipt.objects.acount() == 2
+    cursor = await MinerReceiptsCursor.objects.aget(miner_hotkey=MINER_HOTKEY)
+    assert cursor.offset == len(receipts_csv)
+
+
+@pytest.mark.django_db(transaction=True)
+def test__fetch_receipts__invalid_receipt_skipped(monkeypatch):
     invalid_receipt_payload = json.dumps({"payload": {"job_uuid": "invalid"}})
-    fetch_receipts_test_helper(monkeypatch, mocked_responses, [invalid_receipt_payload, RAW_RECEIPT_PAYLOAD_1])
+    fetch_receipts_test_helper(monkeypatch, [invalid_receipt_payload, RAW_RECEIPT_PAYLOAD_1])
 
     # only the valid receipt should be stored
     assert JobReceipt.objects.all().count() == 1
     assert str(JobReceipt.objects.get().job_uuid) == json.loads(RAW_RECEIPT_PAYLOAD_1)["payload"]["job_uuid"]
 
 
+def test__parse_receipt__future_time_started_rejected():
+    raw_receipt = json.loads(RAW_RECEIPT_PAYLOAD_1)
+    row = {**raw_receipt.pop("payload"), **raw_receipt}
+    assert parse_receipt(row) is not None
+
+    row["time_started"] = (now() + RECEIPTS_FUTURE_TOLERANCE + timedelta(minutes=1)).isoformat()
+    assert parse_receipt(row) is None
+
+
 @pytest.mark.django_db(transaction=True)
-def test__fetch_receipts__miner_hotkey_mismatch_skipped(monkeypatch, mocked_responses):
+def test__fetch_receipts__miner_hotkey_mismatch_skipped(monkeypatch):
     invalid_receipt_payload = RAW_RECEIPT_PAYLOAD_2.replace(
         MINER_HOTKEY,
         MINER_HOTKEY[:-4] + "AAAA",
     )
-    fetch_receipts_test_helper(monkeypatch, mocked_responses, [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload])
+    fetch_receipts_test_helper(monkeypatch, [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload])
 
     # only the valid receipt should be stored
     assert JobReceipt.objects.all().count() == 1
@@ -332,13 +433,13 @@ def test__fetch_receipts__miner_hotkey_mismatch_skipped(monkeypatch, mocked_resp
 
 
 @pytest.mark.django_db(transaction=True)
-def test__fetch_receipts__invalid_miner_signature_skipped(monkeypatch, mocked_responses):
+def test__fetch_receipts__invalid_miner_signature_skipped(monkeypatch):
     invalid_char = "0" if PAYLOAD_2_MINER_SIGNATURE[-1] != "0" else "1"
     invalid_receipt_payload = RAW_RECEIPT_PAYLOAD_2.replace(
         PAYLOAD_2_MINER_SIGNATURE,
         PAYLOAD_2_MINER_SIGNATURE[:-1] + invalid_char,
     )
-    fetch_receipts_test_helper(monkeypatch, mocked_responses, [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload])
+    fetch_receipts_test_helper(monkeypatch, [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload])
 
     # only the valid receipt should be stored
     assert JobReceipt.objects.all().count() == 1
@@ -346,14 +447,246 @@ def test__fetch_receipts__invalid_miner_signature_skipped(monkeypatch, mocked_re
 
 
 @pytest.mark.django_db(transaction=True)
-def test__fetch_receipts__invalid_validator_signature_skipped(monkeypatch, mocked_responses):
+def test__fetch_receipts__invalid_validator_signature_skipped(monkeypatch):
     invalid_char = "0" if PAYLOAD_2_VALIDATOR_SIGNATURE[-1] != "0" else "1"
     invalid_receipt_payload = RAW_RECEIPT_PAYLOAD_2.replace(
         PAYLOAD_2_VALIDATOR_SIGNATURE,
         PAYLOAD_2_VALIDATOR_SIGNATURE[:-1] + invalid_char,
     )
-    fetch_receipts_test_helper(monkeypatch, mocked_responses, [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload])
+    fetch_receipts_test_helper(monkeypatch, [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload])
 
     # only the valid receipt should be stored
     assert JobReceipt.objects.all().count() == 1
     assert str(JobReceipt.objects.get().job_uuid) == json.loads(RAW_RECEIPT_PAYLOAD_1)["payload"]["job_uuid"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test__receipts_collector__stores_in_batches(monkeypatch):
+    receipts_csv = make_receipts_csv([RAW_RECEIPT_PAYLOAD_1, RAW_RECEIPT_PAYLOAD_2])
+    batch_sizes = []
+    bulk_create_with_stats = JobReceipt.objects.bulk_create_with_stats
+
+    def bulk_create_with_stats_spy(receipts):
+        batch_sizes.append(len(receipts))
+        return bulk_create_with_stats(receipts)
+
+    monkeypatch.setattr(JobReceipt.objects, "bulk_create_with_stats", bulk_create_with_stats_spy)
+    collector = ReceiptsCollector(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, text=receipts_csv)),
+        insert_batch_size=1,
+    )
+    assert await collector.collect([MinerAddress(hotkey=MINER_HOTKEY, ip="127.0.0.2", port=8000)]) == 2
+
+    assert batch_sizes == [1, 1]
+    assert collector.num_rows == 2
+    assert await JobReceipt.objects.acount() == 2
+
+
+@pytest.mark.asyncio
+async def test__receipt_verifier__process_pool():
+    invalid_char = "0" if PAYLOAD_2_VALIDATOR_SIGNATURE[-1] != "0" else "1"
+    invalid_receipt_payload = RAW_RECEIPT_PAYLOAD_2.replace(
+        PAYLOAD_2_VALIDATOR_SIGNATURE,
+        PAYLOAD_2_VALIDATOR_SIGNATURE[:-1] + invalid_char,
+    )
+    receipts = [
+        Receipt.model_validate_json(raw_receipt_payload)
+        for raw_receipt_payload in [RAW_RECEIPT_PAYLOAD_1, invalid_receipt_payload, RAW_RECEIPT_PAYLOAD_2]
+    ]
+
+    verifier = ReceiptVerifier(workers=2, batch_size=2)
+    try:
+        assert await verifier.verify(receipts) == [(True, True), (True, False), (True, True)]
+    finally:
+        verifier.close()
+
+
+@pytest.mark.asyncio
+async def test__receipt_verifier__daemonic_process(monkeypatch):
+    # like a prefork Celery worker, which cannot start child processes
+    monkeypatch.setitem(multiprocessing.current_process()._config, "daemon", True)
+    receipts = [Receipt.model_validate_json(RAW_RECEIPT_PAYLOAD_1), Receipt.model_validate_json(RAW_RECEIPT_PAYLOAD_2)]
+
+    verifier = ReceiptVerifier(workers=2, batch_size=2)
+    assert verifier.workers == 0
+    assert await verifier.verify(receipts) == [(True, True), (True, True)]
+    assert verifier._pool is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test__create_job_receipt_partitions(settings):
+    settings.JOB_RECEIPT_PARTITIONS_AHEAD = 1
+    month = now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month = (month + timedelta(days=31)).replace(day=1)
+    far_month = (next_month + timedelta(days=62)).replace(day=1)
+    # receipts of months without a partition, e.g. dated far ahead, land in the default partition
+    receipt = JobReceipt.objects.create(
+        job_uuid=uuid4(),
+        miner_hotkey="miner",
+        validator_hotkey="validator",
+        time_started=far_month + timedelta(days=1),
+        time_took_us=1,
+        score_str="1",
+    )
+
+    def get_partition(time_started: datetime) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM core_jobreceipt WHERE time_started = %s", [time_started]
+            )
+            return cursor.fetchone()[0]
+
+    assert get_partition(receipt.time_started) == "core_jobreceipt_default"
+
+    tasks.create_job_receipt_partitions()
+    tasks.create_job_receipt_partitions()
+    for partition_month in (month, next_month):
+        JobReceipt.objects.create(
+            job_uuid=uuid4(),
+            miner_hotkey="miner",
+            validator_hotkey="validator",
+            time_started=partition_month,
+            time_took_us=1,
+            score_str="1",
+        )
+        assert get_partition(partition_month) == f"core_jobreceipt_{partition_month:%Y_%m}"
+
+    # once the month comes, the receipt is moved to its partition instead of blocking its creation
+    with freeze_time(far_month):
+        tasks.create_job_receipt_partitions()
+    assert get_partition(receipt.time_started) == f"core_jobreceipt_{far_month:%Y_%m}"
+    assert JobReceipt.objects.filter(time_started__gte=far_month).count() == 1
+
+
+@pytest.mark.django_db
+def test__dispatch_pending_jobs(user, connected_validator, miners, dummy_job_params):
+    config.ASYNC_JOB_DISPATCH = True
+    jobs = [Job.objects.create(user=user, **dummy_job_params) for _ in range(3)]
+    for job in jobs:
+        job.refresh_from_db()
+        assert job.last_status == JobStatus.Status.PENDING
+        assert job.validator is None
+        assert job.miner is None
+
+    dispatch_pending_jobs(batch_size=2)
+
+    for job in jobs:
+        job.refresh_from_db()
+        assert job.last_status == JobStatus.Status.SENT
+        assert job.validator == connected_validator
+    assert len({job.miner_id for job in jobs}) == len(jobs)
+
+
+@pytest.mark.django_db
+def test__dispatch_pending_jobs__validators_take_turns(
+    user, connected_validator, validator_registry, miners, dummy_job_params
+):
+    config.ASYNC_JOB_DISPATCH = True
+    other_validator = Validator.objects.create(ss58_address="other", is_active=True)
+    Channel.objects.create(name="other", validator=other_validator)
+    validator_registry.connect(other_validator.pk, "other")
+    for _ in range(4):
+        Job.objects.create(user=user, **dummy_job_params)
+
+    dispatch_pending_jobs()
+
+    assert Counter(Job.objects.values_list("validator_id", flat=True)) == {
+        connected_validator.pk: 2,
+        other_validator.pk: 2,
+    }
+
+
+@pytest.mark.django_db
+def test__dispatch_pending_jobs__send_failed(user, connected_validator, miners, dummy_job_params):
+    config.ASYNC_JOB_DISPATCH = True
+    unsent, sent = [Job.objects.create(user=user, **dummy_job_params) for _ in range(2)]
+
+    with patch.object(Job, "send_job_request", autospec=True, side_effect=[RuntimeError("channel layer down"), None]):
+        dispatch_pending_jobs()
+
+    # the job which could not be sent is left for the next run, without holding its miner
+    unsent.refresh_from_db()
+    assert unsent.last_status == JobStatus.Status.PENDING
+    assert (unsent.validator, unsent.miner) == (None, None)
+    assert Miner.objects.available().count() == len(miners) - 1
+    sent.refresh_from_db()
+    assert sent.last_status == JobStatus.Status.SENT
+
+    dispatch_pending_jobs()
+    unsent.refresh_from_db()
+    assert unsent.last_status == JobStatus.Status.SENT
+    assert unsent.validator == connected_validator
+
+
+@pytest.mark.django_db
+def test__dispatch_pending_jobs__no_nodes_available(user, connected_validator, validator_registry, dummy_job_params):
+    config.ASYNC_JOB_DISPATCH = True
+    job = Job.objects.create(user=user, **dummy_job_params)
+
+    # job waits for a miner to become available...
+    dispatch_pending_jobs()
+    job.refresh_from_db()
+    assert job.last_status == JobStatus.Status.PENDING
+
+    # ...but not longer than it would take to run it
+    with freeze_time(now() + Job.JOB_TIMEOUT + timedelta(seconds=1)):
+        # the validator stays connected meanwhile
+        validator_registry.heartbeat(connected_validator.pk, "test")
+        dispatch_pending_jobs()
+    job.refresh_from_db()
+    assert job.last_status == JobStatus.Status.FAILED
+    assert job.statuses.get(status=JobStatus.Status.FAILED).metadata == {"comment": "Could not select Miner"}
+
+
+class MockedS3:
+    def __init__(self, objects: dict[str, bytes]):
+        self.objects = objects
+
+    def get_paginator(self, operation_name: str):
+        return self
+
+    def paginate(self, Bucket: str, Prefix: str, StartAfter: str):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+        yield {"Contents": [{"Key": key} for key in keys]}
+
+    def get_object(self, Bucket: str, Key: str):
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+@pytest.mark.django_db(transaction=True)
+def test__archive_old_rows(settings, monkeypatch):
+    settings.ARCHIVE_BATCH_SIZE = 2
+    objects = {}
+    monkeypatch.setattr(archive, "upload_data", objects.__setitem__)
+    monkeypatch.setattr(archive, "s3", MockedS3(objects))
+
+    miner = Miner.objects.create(ss58_address="miner", is_active=True)
+    validator = Validator.objects.create(ss58_address="validator", is_active=True)
+    raw_specs = RawSpecsData.objects.create(data={})
+    day = now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=100)
+    measured_at = [day, day + timedelta(hours=1), day + timedelta(hours=2), day + timedelta(days=1), now()]
+    snapshots = ExecutorSpecsSnapshot.objects.bulk_create(
+        [
+            ExecutorSpecsSnapshot(miner=miner, validator=validator, raw_specs=raw_specs, measured_at=timestamp)
+            for timestamp in measured_at
+        ]
+    )
+
+    tasks.archive_old_rows()
+
+    # batches never span days
+    assert sorted(objects) == [
+        f"archive/executor_specs_snapshots/{day.date()}/120000000000-{snapshots[0].pk}.jsonl.gz",
+        f"archive/executor_specs_snapshots/{day.date()}/140000000000-{snapshots[2].pk}.jsonl.gz",
+        f"archive/executor_specs_snapshots/{(day + timedelta(days=1)).date()}/120000000000-{snapshots[3].pk}.jsonl.gz",
+    ]
+    assert list(ExecutorSpecsSnapshot.objects.values_list("pk", flat=True)) == [snapshots[4].pk]
+
+    policy = archive.ARCHIVE_POLICIES["executor_specs_snapshots"]
+    rows = list(archive.read_archive(policy, since=day + timedelta(hours=1), miner__ss58_address="miner"))
+    assert [row["id"] for row in rows] == [snapshot.pk for snapshot in snapshots[1:4]]
+    assert rows[0]["measured_at"] == measured_at[1]
+    assert rows[0]["validator__ss58_address"] == "validator"
+    assert rows[0]["raw_specs_id"] == raw_specs.pk
+    assert list(archive.read_archive(policy, until=day)) == []
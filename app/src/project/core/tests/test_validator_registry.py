@@ -0,0 +1,66 @@
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from django.conf import settings
+from django.utils.timezone import now
+from freezegun import freeze_time
+
+from ..validator_registry import InMemoryValidatorRegistry, RedisValidatorRegistry, ValidatorRegistry
+
+
+@pytest.fixture(params=["in_memory", "redis"])
+def registry(request):
+    if request.param == "in_memory":
+        yield InMemoryValidatorRegistry()
+        return
+
+    registry = RedisValidatorRegistry(url=settings.CHANNELS_BACKEND_URL, prefix=f"test_validator_registry_{uuid4()}")
+    yield registry
+    if keys := registry.redis.keys(f"{registry.prefix}:*"):
+        registry.redis.delete(*keys)
+
+
+def test__validator_registry__connection(registry: ValidatorRegistry):
+    assert registry.connected_validator_ids() == set()
+
+    registry.connect(1, "channel1")
+    registry.connect(1, "channel2")
+    registry.connect(2, "channel3")
+    assert registry.connected_validator_ids() == {1, 2}
+
+    # validator stays connected as long as any of its channels is connected
+    registry.disconnect(1, "channel1")
+    assert registry.connected_validator_ids() == {1, 2}
+    registry.disconnect(1, "channel2")
+    assert registry.connected_validator_ids() == {2}
+
+
+def test__validator_registry__heartbeat_timeout(registry: ValidatorRegistry):
+    now_ = now()
+    with freeze_time(now_):
+        registry.connect(1, "channel1")
+        registry.connect(2, "channel2")
+
+    with freeze_time(now_ + registry.CONNECTION_TIMEOUT - timedelta(seconds=1)):
+        registry.heartbeat(2, "channel2")
+
+    with freeze_time(now_ + registry.CONNECTION_TIMEOUT + timedelta(seconds=1)):
+        assert registry.connected_validator_ids() == {2}
+
+
+def test__validator_registry__least_recently_assigned(registry: ValidatorRegistry):
+    now_ = now()
+    assert registry.select_least_recently_assigned(set()) is None
+
+    registry.mark_job_assigned(1, now_)
+    registry.mark_job_assigned(2, now_ - timedelta(minutes=1))
+    # validators without any job go first
+    assert registry.select_least_recently_assigned({1, 2, 3}) == 3
+    assert registry.select_least_recently_assigned({1, 2}) == 2
+    assert registry.sort_least_recently_assigned({1, 2, 3}) == [3, 2, 1]
+
+    # older assignments never override newer ones
+    registry.mark_job_assigned(2, now_ + timedelta(minutes=1))
+    registry.mark_job_assigned(2, now_ - timedelta(minutes=2))
+    assert registry.select_least_recently_assigned({1, 2}) == 1
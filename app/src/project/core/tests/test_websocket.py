@@ -1,14 +1,19 @@
 import asyncio
+import io
 from unittest import mock
 
 import pytest
 from bittensor import Keypair
 from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
 from more_itertools import one
+from pydantic import TypeAdapter
 
 from ...asgi import application
+from .. import consumers
+from ..consumers import ValidatorConsumer
 from ..models import Job, JobStatus, Validator
-from ..schemas import AuthenticationRequest
+from ..schemas import AuthenticationRequest, Heartbeat
 
 
 @pytest.mark.asyncio
@@ -59,6 +64,24 @@ async def test__websocket__authentication__bad_signature(
     ]
 
 
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test__websocket__message_adapter__built_once(communicator, authenticated, monkeypatch):
+    """Parsing messages must not rebuild the pydantic schema of known messages every time"""
+
+    ValidatorConsumer.message_adapter.cache_clear()
+    type_adapter = mock.Mock(wraps=TypeAdapter)
+    monkeypatch.setattr(consumers, "TypeAdapter", type_adapter)
+
+    for _ in range(3):
+        await communicator.send_json_to(Heartbeat().dict())
+    await communicator.send_json_to({"message_type": "unknown"})
+    response = await communicator.receive_json_from()
+    assert response["status"] == "error"
+
+    type_adapter.assert_called_once()
+
+
 @pytest.mark.asyncio
 @pytest.mark.django_db(transaction=True)
 async def test__websocket__authentication__success(communicator, authentication_request, validator):
@@ -211,3 +234,15 @@ async def test__websocket__new_job__evenly_distributed(
     )
 
     await communicator2.disconnect(200)
+
+
+@pytest.mark.django_db(transaction=True)
+def test__benchmark_validator_consumer_command():
+    stdout = io.StringIO()
+    call_command("benchmark_validator_consumer", messages=3, stdout=stdout)
+
+    output = stdout.getvalue()
+    for message_type in ["AuthenticationRequest", "Heartbeat", "JobStatusUpdate", "MachineSpecs"]:
+        assert f"receive {message_type}:" in output
+    assert "send JobRequest:" in output
+    assert not Validator.objects.exists()
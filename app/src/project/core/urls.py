@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.authtoken.views import obtain_auth_token
 
-from .api import router
+from .api import job_events_view, router
 from .views import (
     DockerImageJobCreateView,
     JobDetailView,
@@ -15,6 +15,7 @@ urlpatterns = [
     path("new-docker/", DockerImageJobCreateView.as_view(), name="job-docker/submit"),
     path("new-raw/", RawScriptJobCreateView.as_view(), name="job-raw/submit"),
     path("<uuid:pk>/", JobDetailView.as_view(), name="job/detail"),
+    path("api/v1/job-events/", job_events_view, name="job-events"),
     path("api/v1/", include(router.urls)),
     path("api-auth/", include("rest_framework.urls")),
     path("api-token-auth/", obtain_auth_token, name="api-token-auth"),
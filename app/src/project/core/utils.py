@@ -1,9 +1,14 @@
+import hashlib
+import hmac
+from functools import lru_cache
 from typing import TYPE_CHECKING
+from urllib.parse import quote, urlsplit
 
 import boto3
 import wandb
 from constance import config
 from django.conf import settings
+from django.utils.timezone import now
 from structlog import get_logger
 
 if TYPE_CHECKING:
@@ -21,6 +26,71 @@ s3 = boto3.client(
 )
 
 
+@lru_cache(maxsize=16)
+def get_sigv4_signing_key(secret_access_key: str, date: str, region_name: str, service_name: str) -> bytes:
+    """Derive AWS SigV4 signing key; it only changes once a day, so it is cached"""
+
+    key = f"AWS4{secret_access_key}".encode()
+    for part in (date, region_name, service_name, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+
+class S3Presigner:
+    """
+    Create presigned S3 URLs (AWS SigV4, query string authentication) locally.
+
+    URLs are identical to the ones generated by `boto3` client's `generate_presigned_url` for a custom
+    endpoint (path-style addressing), but without going through its request-building machinery.
+    """
+
+    ALGORITHM = "AWS4-HMAC-SHA256"
+    SERVICE_NAME = "s3"
+
+    def __init__(self, endpoint_url: str, access_key_id: str, secret_access_key: str, region_name: str):
+        endpoint = urlsplit(endpoint_url)
+        self.origin = f"{endpoint.scheme}://{endpoint.netloc}"
+        self.host = endpoint.netloc
+        self.path_prefix = endpoint.path.rstrip("/")
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region_name = region_name
+
+    def generate_presigned_url(self, method: str, bucket: str, key: str, expires_in: int) -> str:
+        timestamp = now()
+        date = timestamp.strftime("%Y%m%d")
+        amz_date = timestamp.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{date}/{self.region_name}/{self.SERVICE_NAME}/aws4_request"
+
+        path = f"{self.path_prefix}/{quote(bucket, safe='')}/{quote(key, safe='/~')}"
+        query = "&".join(
+            f"{name}={quote(value, safe='-_.~')}"
+            for name, value in (
+                ("X-Amz-Algorithm", self.ALGORITHM),
+                ("X-Amz-Credential", f"{self.access_key_id}/{scope}"),
+                ("X-Amz-Date", amz_date),
+                ("X-Amz-Expires", str(expires_in)),
+                ("X-Amz-SignedHeaders", "host"),
+            )
+        )
+        canonical_request = f"{method}\n{path}\n{query}\nhost:{self.host}\n\nhost\nUNSIGNED-PAYLOAD"
+        string_to_sign = "\n".join(
+            [self.ALGORITHM, amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+        )
+        signing_key = get_sigv4_signing_key(self.secret_access_key, date, self.region_name, self.SERVICE_NAME)
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        return f"{self.origin}{path}?{query}&X-Amz-Signature={signature}"
+
+
+presigner = S3Presigner(
+    endpoint_url=settings.R2_ENDPOINT_URL,
+    access_key_id=settings.R2_ACCESS_KEY_ID,
+    secret_access_key=settings.R2_SECRET_ACCESS_KEY,
+    region_name=settings.R2_REGION_NAME,
+)
+
+
 def create_signed_upload_url(key: str) -> str:
     """
     Create a signed URL for executor's output.
@@ -39,24 +109,20 @@ def create_signed_upload_url(key: str) -> str:
     # )
     # return result['url'], result['fields']
 
-    return s3.generate_presigned_url(
-        ClientMethod="put_object",
-        Params={
-            "Bucket": settings.R2_BUCKET_NAME,
-            "Key": key,
-        },
-        ExpiresIn=int(settings.OUTPUT_PRESIGNED_URL_LIFETIME.total_seconds()),
+    return presigner.generate_presigned_url(
+        method="PUT",
+        bucket=settings.R2_BUCKET_NAME,
+        key=key,
+        expires_in=int(settings.OUTPUT_PRESIGNED_URL_LIFETIME.total_seconds()),
     )
 
 
 def create_signed_download_url(key: str) -> str:
-    return s3.generate_presigned_url(
-        ClientMethod="get_object",
-        Params={
-            "Bucket": settings.R2_BUCKET_NAME,
-            "Key": key,
-        },
-        ExpiresIn=int(settings.DOWNLOAD_PRESIGNED_URL_LIFETIME.total_seconds()),
+    return presigner.generate_presigned_url(
+        method="GET",
+        bucket=settings.R2_BUCKET_NAME,
+        key=key,
+        expires_in=int(settings.DOWNLOAD_PRESIGNED_URL_LIFETIME.total_seconds()),
     )
 
 
@@ -0,0 +1,156 @@
+"""
+Registry of validators currently connected via WS.
+
+Selecting a validator for a new job only needs to know which validators are connected
+and when each of them was assigned a job last. Both are kept here, fed by `ValidatorConsumer`
+events, so that the selection does not depend on the size of the jobs table.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from functools import cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+
+class ValidatorRegistry(ABC):
+    """Interface of validator registry backends"""
+
+    # validator is considered connected if any of its channels sent a heartbeat within this time
+    CONNECTION_TIMEOUT = timedelta(minutes=3)
+
+    @abstractmethod
+    def connect(self, validator_id: int, channel_name: str) -> None: ...
+
+    @abstractmethod
+    def heartbeat(self, validator_id: int, channel_name: str) -> None: ...
+
+    @abstractmethod
+    def disconnect(self, validator_id: int, channel_name: str) -> None: ...
+
+    @abstractmethod
+    def connected_validator_ids(self) -> set[int]: ...
+
+    @abstractmethod
+    def mark_job_assigned(self, validator_id: int, assigned_at: datetime) -> None: ...
+
+    @abstractmethod
+    def sort_least_recently_assigned(self, validator_ids: set[int]) -> list[int]:
+        """Return validators ordered by the time they were assigned a job last (never assigned ones first)"""
+
+    def select_least_recently_assigned(self, validator_ids: set[int]) -> int | None:
+        """Return the validator which was assigned a job least recently (never assigned ones first)"""
+        return next(iter(self.sort_least_recently_assigned(validator_ids)), None)
+
+
+class InMemoryValidatorRegistry(ValidatorRegistry):
+    """Registry kept in the memory of a single process; only usable when WS and jobs are handled by one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels: dict[int, set[str]] = {}
+        self._last_heartbeat: dict[int, datetime] = {}
+        self._last_job_assigned_at: dict[int, datetime] = {}
+
+    def connect(self, validator_id: int, channel_name: str) -> None:
+        with self._lock:
+            self._channels.setdefault(validator_id, set()).add(channel_name)
+            self._last_heartbeat[validator_id] = now()
+
+    def heartbeat(self, validator_id: int, channel_name: str) -> None:
+        self.connect(validator_id, channel_name)
+
+    def disconnect(self, validator_id: int, channel_name: str) -> None:
+        with self._lock:
+            channels = self._channels.get(validator_id, set())
+            channels.discard(channel_name)
+            if not channels:
+                self._channels.pop(validator_id, None)
+                self._last_heartbeat.pop(validator_id, None)
+
+    def connected_validator_ids(self) -> set[int]:
+        threshold = now() - self.CONNECTION_TIMEOUT
+        with self._lock:
+            return {
+                validator_id
+                for validator_id, last_heartbeat in self._last_heartbeat.items()
+                if last_heartbeat >= threshold
+            }
+
+    def mark_job_assigned(self, validator_id: int, assigned_at: datetime) -> None:
+        with self._lock:
+            previous = self._last_job_assigned_at.get(validator_id)
+            if previous is None or previous < assigned_at:
+                self._last_job_assigned_at[validator_id] = assigned_at
+
+    def sort_least_recently_assigned(self, validator_ids: set[int]) -> list[int]:
+        with self._lock:
+            assigned_at = {validator_id: self._last_job_assigned_at.get(validator_id) for validator_id in validator_ids}
+        return sorted(
+            validator_ids,
+            key=lambda validator_id: (assigned_at[validator_id] is not None, assigned_at[validator_id], validator_id),
+        )
+
+
+class RedisValidatorRegistry(ValidatorRegistry):
+    """Registry shared by all processes through Redis"""
+
+    # channels of validators which stopped sending heartbeats are forgotten after this time
+    CHANNELS_EXPIRY = timedelta(minutes=10)
+
+    def __init__(self, url: str, prefix: str = "validator_registry"):
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, *parts: str | int) -> str:
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def connect(self, validator_id: int, channel_name: str) -> None:
+        channels_key = self._key("channels", validator_id)
+        with self.redis.pipeline() as pipe:
+            pipe.sadd(channels_key, channel_name)
+            pipe.expire(channels_key, self.CHANNELS_EXPIRY)
+            pipe.zadd(self._key("heartbeats"), {validator_id: now().timestamp()})
+            pipe.execute()
+
+    def heartbeat(self, validator_id: int, channel_name: str) -> None:
+        self.connect(validator_id, channel_name)
+
+    def disconnect(self, validator_id: int, channel_name: str) -> None:
+        channels_key = self._key("channels", validator_id)
+        self.redis.srem(channels_key, channel_name)
+        if not self.redis.scard(channels_key):
+            self.redis.zrem(self._key("heartbeats"), validator_id)
+
+    def connected_validator_ids(self) -> set[int]:
+        threshold = (now() - self.CONNECTION_TIMEOUT).timestamp()
+        return {
+            int(validator_id) for validator_id in self.redis.zrangebyscore(self._key("heartbeats"), threshold, "+inf")
+        }
+
+    def mark_job_assigned(self, validator_id: int, assigned_at: datetime) -> None:
+        self.redis.zadd(self._key("last_job_assigned_at"), {validator_id: assigned_at.timestamp()}, gt=True)
+
+    def sort_least_recently_assigned(self, validator_ids: set[int]) -> list[int]:
+        if not validator_ids:
+            return []
+
+        validator_ids_ = sorted(validator_ids)
+        scores = self.redis.zmscore(self._key("last_job_assigned_at"), validator_ids_)
+        return [
+            validator_id
+            for validator_id, _ in sorted(
+                zip(validator_ids_, scores),
+                key=lambda item: (item[1] is not None, item[1], item[0]),
+            )
+        ]
+
+
+@cache
+def get_validator_registry() -> ValidatorRegistry:
+    backend = import_string(settings.VALIDATOR_REGISTRY["BACKEND"])
+    return backend(**settings.VALIDATOR_REGISTRY.get("OPTIONS", {}))
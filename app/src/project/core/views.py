@@ -32,7 +32,7 @@ class JobListView(ListView):
     paginate_by = 20
 
     def get_queryset(self) -> QuerySet:
-        return self.request.user.jobs.with_statuses().order_by("-created_at")
+        return self.request.user.jobs.order_by("-created_at")
 
 
 @method_decorator(login_required, name="dispatch")
@@ -136,15 +136,6 @@ class JobDetailView(DetailView):
     def get_queryset(self) -> QuerySet:
         return super().get_queryset().with_statuses()
 
-    def get_object(self, queryset: QuerySet | None = None) -> Job:
-        """
-        Regenerate download URL if it's expired before displaying the object to user
-        """
-        job: Job = super().get_object(queryset)
-        if job.is_download_url_expired():
-            job.save()
-        return job
-
 
 @login_required
 def api_token_view(request):
@@ -124,6 +124,11 @@ CONSTANCE_CONFIG = {
     "ENABLE_PUBLIC_REGISTRATION": (False, "Whether to allow anyone to register as a user", bool),
     "VALIDATORS_LIMIT": (12, "Maximum number of active validators", int),
     "OUR_VALIDATOR_SS58_ADDRESS": ("", "Our validator's SS58 address", str),
+    "ASYNC_JOB_DISPATCH": (
+        False,
+        "Whether to store new jobs as pending and select nodes and send them to validators in a background task",
+        bool,
+    ),
 }
 
 BITTENSOR_NETUID = env("BITTENSOR_NETUID")
@@ -140,6 +145,11 @@ OUTPUT_PRESIGNED_URL_LIFETIME = timedelta(seconds=env.int("OUTPUT_PRESIGNED_URL_
 # how often the signed URLs are valid for downloading; after this timedelta, the download URL
 # is invalid and should be regenerated (this is to prevent long-term access to the file)
 DOWNLOAD_PRESIGNED_URL_LIFETIME = timedelta(seconds=env.int("DOWNLOAD_PRESIGNED_URL_LIFETIME"))
+# download URLs are generated on demand and reused for this long (capped so that they stay valid for a while)
+DOWNLOAD_URL_CACHE_TIMEOUT = min(
+    timedelta(seconds=env.int("DOWNLOAD_URL_CACHE_TIMEOUT", default=60)),
+    DOWNLOAD_PRESIGNED_URL_LIFETIME / 2,
+)
 
 WANDB_API_KEY = env("WANDB_API_KEY")
 COMPUTE_SUBNET_UID = 27
@@ -252,8 +262,63 @@ CHANNEL_LAYERS = {
     },
 }
 
+VALIDATOR_REGISTRY = {
+    "BACKEND": "project.core.validator_registry.RedisValidatorRegistry",
+    "OPTIONS": {
+        "url": env("VALIDATOR_REGISTRY_REDIS_URL", default=CHANNELS_BACKEND_URL),
+    },
+}
+
+# heartbeats received by a process are written to the database in bulk, at most once per this interval
+HEARTBEAT_FLUSH_INTERVAL = timedelta(seconds=env.int("HEARTBEAT_FLUSH_INTERVAL_SECONDS", default=5))
+
+# specs received via WS are stored in batches of up to this size, at most this long after they are received
+MACHINE_SPECS_BATCH_SIZE = env.int("MACHINE_SPECS_BATCH_SIZE", default=500)
+MACHINE_SPECS_BATCH_DELAY = timedelta(seconds=env.int("MACHINE_SPECS_BATCH_DELAY_SECONDS", default=1))
+# specs received while this many are waiting to be stored are dropped
+MACHINE_SPECS_QUEUE_SIZE = env.int("MACHINE_SPECS_QUEUE_SIZE", default=10000)
+
 METAGRAPH_SYNC_PERIOD = timedelta(minutes=5)
 
+# number of pending jobs dispatched in a single transaction, see `config.ASYNC_JOB_DISPATCH`
+JOB_DISPATCH_BATCH_SIZE = env.int("JOB_DISPATCH_BATCH_SIZE", default=100)
+# maximum number of jobs submitted in a single bulk request
+JOB_BULK_SUBMIT_MAX_SIZE = env.int("JOB_BULK_SUBMIT_MAX_SIZE", default=1000)
+# job status event streams are closed after this time (clients reconnect) and send keep-alives in between
+JOB_EVENTS_STREAM_DURATION = timedelta(minutes=10)
+JOB_EVENTS_KEEPALIVE_INTERVAL = timedelta(seconds=15)
+# receipts are fetched from this many miners at a time; the timeout applies to connecting and to every read,
+# the miner timeout to the whole download from a single miner
+RECEIPTS_FETCH_CONCURRENCY = env.int("RECEIPTS_FETCH_CONCURRENCY", default=64)
+RECEIPTS_FETCH_TIMEOUT = timedelta(seconds=env.int("RECEIPTS_FETCH_TIMEOUT_SECONDS", default=5))
+RECEIPTS_FETCH_MINER_TIMEOUT = timedelta(seconds=env.int("RECEIPTS_FETCH_MINER_TIMEOUT_SECONDS", default=60))
+# signatures of receipts are verified in a pool of this many processes (0 to verify them in the fetching process),
+# in batches of this many receipts; smaller batches are always verified in the fetching process
+RECEIPTS_VERIFICATION_WORKERS = env.int("RECEIPTS_VERIFICATION_WORKERS", default=4)
+RECEIPTS_VERIFICATION_BATCH_SIZE = env.int("RECEIPTS_VERIFICATION_BATCH_SIZE", default=1000)
+# receipts are stored while being fetched, in batches of this many receipts
+RECEIPTS_INSERT_BATCH_SIZE = env.int("RECEIPTS_INSERT_BATCH_SIZE", default=1000)
+# number of months ahead for which partitions of the receipts table are created
+JOB_RECEIPT_PARTITIONS_AHEAD = 2
+
+# `ExecutorSpecs` older than this are removed
+SPECS_RETENTION = timedelta(days=90)
+# rows older than this are moved to the R2 bucket (`core.archive`), in batches of this many rows
+ARCHIVE_RETENTION = {
+    "executor_specs_snapshots": SPECS_RETENTION,
+    "hardware_states": timedelta(days=30),
+    "raw_specs_snapshots": timedelta(days=30),
+}
+ARCHIVE_BATCH_SIZE = env.int("ARCHIVE_BATCH_SIZE", default=10_000)
+
+# sliding windows of the miners leaderboard (`/api/v1/miners/stats/`)
+MINER_STATS_WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+MINER_STATS_DEFAULT_WINDOW = "24h"
+
 CELERY_BROKER_URL = env("CELERY_BROKER_URL", default="")
 CELERY_RESULT_BACKEND = env("CELERY_BROKER_URL", default="")  # store results in Redis
 CELERY_RESULT_EXPIRES = int(timedelta(days=1).total_seconds())  # time until task result deletion
@@ -274,12 +339,32 @@ CELERY_BEAT_SCHEDULE = {
     "fetch_receipts": {
         "task": "project.core.tasks.fetch_receipts",
         "schedule": timedelta(minutes=30),
-        "options": {"time_limit": 30},
+        "options": {"time_limit": 300},
+    },
+    "create_job_receipt_partitions": {
+        "task": "project.core.tasks.create_job_receipt_partitions",
+        "schedule": timedelta(days=1),
+        "options": {"time_limit": 60},
+    },
+    "refresh_miner_stats": {
+        "task": "project.core.tasks.refresh_miner_stats",
+        "schedule": timedelta(minutes=5),
+        "options": {"time_limit": 120},
+    },
+    "dispatch_pending_jobs": {
+        "task": "project.core.tasks.dispatch_pending_jobs",
+        "schedule": timedelta(seconds=10),
+        "options": {"time_limit": 60},
+    },
+    "prune_specs": {
+        "task": "project.core.tasks.prune_specs",
+        "schedule": timedelta(minutes=60),
+        "options": {"time_limit": 300},
     },
-    "refresh_specs_materialized_view": {
-        "task": "project.core.tasks.refresh_specs_materialized_view",
+    "archive_old_rows": {
+        "task": "project.core.tasks.archive_old_rows",
         "schedule": timedelta(minutes=60),
-        "options": {},
+        "options": {"time_limit": 600},
     },
 }
 CELERY_TASK_ROUTES = ["project.celery.route_task"]